@@ -0,0 +1,59 @@
+# --------------------------------------------------------------------------
+# Admin router for the Auth Server
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from ..config import settings
+from ..core.auth import get_current_active_user
+from ..core.profiler import PROFILE_MODES, ProfilerBusy, profiler
+from ..models.user import User
+
+router = APIRouter()
+
+
+@router.post("/profile", response_model=None)
+async def profile(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(10.0, ge=1, le=1000),
+    mode: str = Query("all"),
+    output: str = Query("collapsed"),
+    idle: bool = False,
+    current_user: User = Depends(get_current_active_user),
+) -> Any:
+    """Sample this worker's Python stacks for a while (superuser only)
+
+    ``mode=requests`` only samples requests sent with ``X-Profile`` while
+    the profile runs. The collapsed stacks are ready for flamegraph.pl or
+    speedscope; ``output=json`` returns them with the sample counts.
+    """
+    if not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions"
+        )
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if mode not in PROFILE_MODES or output not in ("collapsed", "json"):
+        raise HTTPException(status_code=400, detail="Unknown profile mode or output")
+    if seconds > settings.PROFILING_MAX_SECONDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Profiles last at most {settings.PROFILING_MAX_SECONDS:g} seconds",
+        )
+    try:
+        profiler.start(mode, interval_ms / 1000, idle)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        # Also when the client gives up waiting
+        result = profiler.stop()
+    if output == "json":
+        return result.to_dict()
+    return PlainTextResponse(result.collapsed())
@@ -14,6 +14,8 @@ from sqlalchemy import select
 
 from ..config import settings
 from ..core.database import get_db
+from ..core.keys import signing_key, token_headers, verification_key
+from ..core.tracing import traced, tracer
 from ..models.user import User
 
 router = APIRouter()
@@ -27,7 +29,9 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    # bcrypt is deliberately slow; worth seeing in a trace
+    with tracer.span("auth.verify_password"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
@@ -43,7 +47,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, signing_key(), algorithm=settings.JWT_ALGORITHM, headers=token_headers())
     return encoded_jwt
 
 
@@ -52,7 +56,7 @@ def create_refresh_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
     to_encode.update({"exp": expire, "type": "refresh"})
-    encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, signing_key(), algorithm=settings.JWT_ALGORITHM, headers=token_headers())
     return encoded_jwt
 
 
@@ -62,6 +66,7 @@ async def get_user(db: AsyncSession, username: str) -> Optional[User]:
     return result.scalar_one_or_none()
 
 
+@traced("auth.authenticate_user")
 async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
     """Authenticate user with username and password"""
     user = await get_user(db, username)
@@ -72,6 +77,7 @@ async def authenticate_user(db: AsyncSession, username: str, password: str) -> O
     return user
 
 
+@traced("auth.get_current_user")
 async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
     """Get current user from JWT token"""
     credentials_exception = HTTPException(
@@ -80,7 +86,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+        payload = jwt.decode(token, verification_key(), algorithms=[settings.JWT_ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
@@ -135,7 +141,7 @@ async def refresh_access_token(
 ):
     """Refresh access token using refresh token"""
     try:
-        payload = jwt.decode(refresh_token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+        payload = jwt.decode(refresh_token, verification_key(), algorithms=[settings.JWT_ALGORITHM])
         username: str = payload.get("sub")
         token_type: str = payload.get("type")
         
@@ -3,12 +3,13 @@
 #
 # @author bnbong bbbong9@gmail.com
 # --------------------------------------------------------------------------
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 
 from ..config import settings
+from .tracing import tracer
 
 # Create async engine
 engine = create_async_engine(
@@ -18,6 +19,35 @@ engine = create_async_engine(
     pool_recycle=300,
 )
 
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _start_query_span(conn, cursor, statement, parameters, context, executemany):
+    """Open a span for each statement run inside a traced request"""
+    span = tracer.span(
+        "db.query",
+        "client",
+        **{"db.system": conn.dialect.name, "db.statement": statement[:512]}
+    )
+    conn.info.setdefault("query_spans", []).append(span)
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _end_query_span(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("query_spans")
+    if spans:
+        spans.pop().end()
+
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _fail_query_span(exception_context):
+    conn = exception_context.connection
+    spans = conn.info.get("query_spans") if conn is not None else None
+    if spans:
+        span = spans.pop()
+        span.record_error(exception_context.original_exception)
+        span.end()
+
+
 # Create session factory
 AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
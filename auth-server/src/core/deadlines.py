@@ -0,0 +1,71 @@
+# --------------------------------------------------------------------------
+# Request deadlines forwarded by the API Gateway
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, MutableMapping, Optional
+
+from starlette.responses import JSONResponse
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+
+# Remaining time budget of a request in milliseconds, set by the gateway
+DEADLINE_HEADER = b"x-request-timeout-ms"
+
+
+def request_budget(scope: Scope) -> Optional[float]:
+    """Seconds the caller still waits for a request; None when it did not say"""
+    for name, value in scope.get("headers", []):
+        if name.lower() == DEADLINE_HEADER:
+            try:
+                milliseconds = float(value)
+            except ValueError:
+                return None
+            if milliseconds != milliseconds or milliseconds < 0:
+                return None
+            return milliseconds / 1000
+    return None
+
+
+class DeadlineMiddleware:
+    """Stops working on a request once the gateway has stopped waiting for it
+
+    A request whose budget is already spent is answered 504 at once; one
+    that runs out while being handled is cancelled, and answered 504 when
+    no response has been started yet.
+    """
+
+    def __init__(self, app: Callable[[Scope, Receive, Send], Awaitable[None]]):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        budget = request_budget(scope) if scope["type"] == "http" else None
+        if budget is None:
+            await self.app(scope, receive, send)
+            return
+
+        timed_out = JSONResponse(
+            {"detail": "Request deadline exceeded"}, status_code=504
+        )
+        if budget <= 0:
+            await timed_out(scope, receive, send)
+            return
+
+        state: Dict[str, bool] = {"started": False}
+
+        async def send_tracked(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                state["started"] = True
+            await send(message)
+
+        try:
+            await asyncio.wait_for(self.app(scope, receive, send_tracked), budget)
+        except asyncio.TimeoutError:
+            if state["started"]:
+                # Half a response cannot be taken back; drop the connection
+                raise
+            await timed_out(scope, receive, send)
@@ -0,0 +1,67 @@
+# --------------------------------------------------------------------------
+# JWT signing keys of the Auth Server and their public JWKS
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import hashlib
+import json
+from functools import lru_cache
+from typing import Any, Dict
+
+from jose import jwk
+
+from ..config import settings
+
+# Public members that identify a key, per key type
+THUMBPRINT_MEMBERS = {"RSA": ("e", "kty", "n"), "EC": ("crv", "kty", "x", "y")}
+
+
+def is_asymmetric() -> bool:
+    """Whether tokens are signed with a private key (RS*, ES*, PS*)"""
+    return not settings.JWT_ALGORITHM.startswith("HS")
+
+
+@lru_cache(maxsize=1)
+def _private_key() -> str:
+    if settings.JWT_PRIVATE_KEY:
+        return settings.JWT_PRIVATE_KEY
+    with open(settings.JWT_PRIVATE_KEY_PATH) as key_file:
+        return key_file.read()
+
+
+@lru_cache(maxsize=1)
+def public_jwk() -> Dict[str, Any]:
+    """Public half of the signing key as a JWK, with its key id"""
+    key = jwk.construct(_private_key(), settings.JWT_ALGORITHM).public_key().to_dict()
+    # RFC 7638 thumbprint of the required members as the default key id
+    required = THUMBPRINT_MEMBERS[key["kty"]]
+    canonical = json.dumps(
+        {name: key[name] for name in required}, sort_keys=True, separators=(",", ":")
+    )
+    thumbprint = hashlib.sha256(canonical.encode()).hexdigest()[:16]
+    return {
+        **key,
+        "kid": settings.JWT_KEY_ID or thumbprint,
+        "use": "sig",
+        "alg": settings.JWT_ALGORITHM,
+    }
+
+
+def signing_key() -> str:
+    """Key tokens are signed with"""
+    return _private_key() if is_asymmetric() else settings.JWT_SECRET_KEY
+
+
+def verification_key() -> Any:
+    """Key tokens are verified with"""
+    return public_jwk() if is_asymmetric() else settings.JWT_SECRET_KEY
+
+
+def token_headers() -> Dict[str, str]:
+    """JOSE headers of issued tokens: the key id when keys are published"""
+    return {"kid": public_jwk()["kid"]} if is_asymmetric() else {}
+
+
+def jwks() -> Dict[str, Any]:
+    """Published verification keys; a shared secret is never published"""
+    return {"keys": [public_jwk()] if is_asymmetric() else []}
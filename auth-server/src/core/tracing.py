@@ -0,0 +1,540 @@
+# --------------------------------------------------------------------------
+# Request tracing with W3C trace context for the Auth Server
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import atexit
+import functools
+import importlib
+import json
+import queue
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar, Union
+
+import structlog
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..config import settings
+
+logger = structlog.get_logger()
+
+TRACEPARENT = "traceparent"
+TRACESTATE = "tracestate"
+
+# version-trace_id-parent_id-flags (https://www.w3.org/TR/trace-context/)
+TRACEPARENT_PATTERN = re.compile(
+    r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})(-.*)?$"
+)
+SAMPLED_FLAG = 0x01
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+
+class SpanContext:
+    """Trace and span id of a caller, as received in ``traceparent``"""
+
+    __slots__ = ("trace_id", "span_id", "sampled", "tracestate")
+
+    def __init__(
+        self,
+        trace_id: str,
+        span_id: str,
+        sampled: bool,
+        tracestate: Optional[str] = None,
+    ):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+        self.tracestate = tracestate
+
+
+def parse_traceparent(
+    value: Optional[str], tracestate: Optional[str] = None
+) -> Optional[SpanContext]:
+    """Caller context of a ``traceparent`` header; None when absent or invalid"""
+    if not value:
+        return None
+    match = TRACEPARENT_PATTERN.match(value.strip().lower())
+    if match is None:
+        return None
+    version, trace_id, span_id, flags, rest = match.groups()
+    # Version ff is invalid; version 00 has nothing after the flags
+    if version == "ff" or (version == "00" and rest):
+        return None
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return SpanContext(
+        trace_id, span_id, bool(int(flags, 16) & SAMPLED_FLAG), tracestate
+    )
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits) or 1:0{bits // 4}x}"
+
+
+class Trace:
+    """Spans of one request in this process, kept or dropped together"""
+
+    __slots__ = ("trace_id", "sampled", "tracestate", "root", "spans", "error", "kept")
+
+    def __init__(self, trace_id: str, sampled: bool, tracestate: Optional[str]):
+        self.trace_id = trace_id
+        # Head decision, also sent on to upstreams
+        self.sampled = sampled
+        self.tracestate = tracestate
+        # Local root span; the decision is made when it ends
+        self.root: Optional["Span"] = None
+        self.spans: List["Span"] = []
+        self.error = False
+        # Set once the root span has ended: whether the trace was exported
+        self.kept: Optional[bool] = None
+
+
+class Span:
+    """A timed operation of a request; use as a context manager"""
+
+    __slots__ = (
+        "tracer",
+        "trace",
+        "name",
+        "kind",
+        "span_id",
+        "parent_id",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "error",
+        "_token",
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        trace: Trace,
+        name: str,
+        kind: str,
+        parent_id: Optional[str],
+        attributes: Dict[str, Any],
+    ):
+        self.tracer = tracer
+        self.trace = trace
+        self.name = name
+        self.kind = kind
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error = False
+        self._token: Any = None
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, error: Optional[BaseException] = None) -> None:
+        """Mark the span failed, which keeps its whole trace"""
+        self.error = True
+        self.trace.error = True
+        if error is not None:
+            self.attributes["error.type"] = type(error).__name__
+            self.attributes["error.message"] = str(error)[:256]
+
+    def traceparent(self) -> str:
+        """``traceparent`` value naming this span as the parent of a call"""
+        flags = SAMPLED_FLAG if self.trace.sampled else 0
+        return f"00-{self.trace.trace_id}-{self.span_id}-{flags:02x}"
+
+    def inject(self, headers: Dict[str, str]) -> None:
+        """Add the trace context headers of an outgoing call"""
+        headers[TRACEPARENT] = self.traceparent()
+        if self.trace.tracestate:
+            headers[TRACESTATE] = self.trace.tracestate
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.tracer._finish(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, error_type: Any, error: Any, traceback: Any) -> None:
+        if error is not None and not self.error:
+            self.record_error(error)
+        _current_span.reset(self._token)
+        self.end()
+
+    def to_dict(self) -> Dict[str, Any]:
+        end_ns = self.end_ns or self.start_ns
+        return {
+            "service": self.tracer.service_name,
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": end_ns,
+            "duration_ms": round((end_ns - self.start_ns) / 1e6, 3),
+            "status": "error" if self.error else "ok",
+            "attributes": self.attributes,
+        }
+
+
+class NoopSpan:
+    """Stands in for a span when tracing is off or outside a request"""
+
+    __slots__ = ()
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def record_error(self, error: Optional[BaseException] = None) -> None:
+        pass
+
+    def inject(self, headers: Dict[str, str]) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self) -> "NoopSpan":
+        return self
+
+    def __exit__(self, error_type: Any, error: Any, traceback: Any) -> None:
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+AnySpan = Union[Span, NoopSpan]
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class SpanExporter:
+    """Destination of finished spans; called from the export thread"""
+
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def shutdown(self) -> None:
+        pass
+
+
+class FileSpanExporter(SpanExporter):
+    """Appends spans to a file as JSON lines"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        lines = "".join(json.dumps(span, default=str) + "\n" for span in spans)
+        with self.path.open("a") as spans_file:
+            spans_file.write(lines)
+
+
+class BatchSpanProcessor:
+    """Hands kept spans to a background thread that exports them in batches
+
+    The request path only pays for a queue put; spans are serialized and
+    exported on the thread, at most ``batch_size`` at a time and at least
+    every ``interval`` seconds. Spans that do not fit in the queue are
+    dropped and counted in ``dropped``.
+    """
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        queue_size: int = 2048,
+        batch_size: int = 512,
+        interval: float = 1.0,
+    ):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.interval = interval
+        self.spans: "queue.Queue[Optional[Span]]" = queue.Queue(queue_size)
+        self.dropped = 0
+        self._thread = threading.Thread(
+            target=self._run, name="auth-span-exporter", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def submit(self, spans: List[Span]) -> None:
+        for index, span in enumerate(spans):
+            try:
+                self.spans.put_nowait(span)
+            except queue.Full:
+                self.dropped += len(spans) - index
+                return
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Export what is queued, then stop the thread"""
+        if not self._thread.is_alive():
+            return
+        self.spans.put(None)
+        self._thread.join(timeout)
+        self.exporter.shutdown()
+
+    def _run(self) -> None:
+        while True:
+            batch: List[Optional[Span]] = []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.spans.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                if batch[-1] is None:
+                    break
+            stopping = bool(batch) and batch[-1] is None
+            self._export([span for span in batch if span is not None])
+            if stopping:
+                return
+
+    def _export(self, batch: List[Span]) -> None:
+        if not batch:
+            return
+        try:
+            self.exporter.export([span.to_dict() for span in batch])
+        except Exception as e:
+            self.dropped += len(batch)
+            logger.warning("Span export failed", spans=len(batch), error=str(e))
+
+
+class Tracer:
+    """Creates spans and decides which traces are exported
+
+    Head sampling keeps ``sample_rate`` of new traces, or follows the
+    caller's sampled flag. Every trace is still recorded in memory until
+    its root span ends: tail sampling then keeps it anyway when a span
+    failed or the request took ``slow_seconds`` or longer. Without a
+    processor (tracing off) only no-op spans are handed out.
+    """
+
+    def __init__(
+        self,
+        service_name: str = "auth-server",
+        sample_rate: float = 0.01,
+        slow_seconds: float = 1.0,
+    ):
+        self.service_name = service_name
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.processor: Optional[BatchSpanProcessor] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.processor is not None
+
+    def configure(
+        self,
+        processor: Optional[BatchSpanProcessor],
+        sample_rate: Optional[float] = None,
+        slow_seconds: Optional[float] = None,
+    ) -> None:
+        self.processor = processor
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if slow_seconds is not None:
+            self.slow_seconds = slow_seconds
+
+    def start_trace(
+        self,
+        name: str,
+        traceparent: Optional[str] = None,
+        tracestate: Optional[str] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+    ) -> AnySpan:
+        """Root span of a request, continuing the caller's trace if it sent one"""
+        if self.processor is None:
+            return NOOP_SPAN
+        parent = parse_traceparent(traceparent, tracestate)
+        if parent is not None:
+            trace = Trace(parent.trace_id, parent.sampled, parent.tracestate)
+        else:
+            sampled = random.random() < self.sample_rate
+            trace = Trace(_new_id(128), sampled, None)
+        trace.root = Span(
+            self,
+            trace,
+            name,
+            "server",
+            parent.span_id if parent is not None else None,
+            attributes or {},
+        )
+        return trace.root
+
+    def span(self, name: str, kind: str = "internal", **attributes: Any) -> AnySpan:
+        """Child of the current span; a no-op outside a traced request"""
+        parent = _current_span.get()
+        if parent is None:
+            return NOOP_SPAN
+        return Span(parent.tracer, parent.trace, name, kind, parent.span_id, attributes)
+
+    def current(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def _finish(self, span: Span) -> None:
+        trace = span.trace
+        if trace.kept is not None:
+            # Ended after its request, e.g. a relayed body
+            if trace.kept and self.processor is not None:
+                self.processor.submit([span])
+            return
+        trace.spans.append(span)
+        if span is trace.root:
+            self._decide(span)
+
+    def _decide(self, root: Span) -> None:
+        trace = root.trace
+        duration = ((root.end_ns or root.start_ns) - root.start_ns) / 1e9
+        if trace.sampled:
+            decision = "head"
+        elif trace.error:
+            decision = "error"
+        elif duration >= self.slow_seconds:
+            decision = "slow"
+        else:
+            decision = "dropped"
+        trace.kept = decision != "dropped"
+        root.set("sampling.decision", decision)
+        if trace.kept and self.processor is not None:
+            self.processor.submit(trace.spans)
+        trace.spans = []
+
+    def shutdown(self) -> None:
+        """Export the spans still queued and stop tracing"""
+        processor, self.processor = self.processor, None
+        if processor is not None:
+            processor.stop()
+
+
+# The process-wide tracer; off until configure_tracing() gives it a processor
+tracer = Tracer()
+
+
+def traced(name: str) -> Callable[[F], F]:
+    """Run an async function inside a span of the current request"""
+
+    def decorate(function: F) -> F:
+        @functools.wraps(function)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if _current_span.get() is None:
+                return await function(*args, **kwargs)
+            with tracer.span(name):
+                return await function(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
+
+def create_exporter(name: str, path: str) -> Optional[SpanExporter]:
+    """Span exporter named by TRACING_EXPORTER
+
+    ``file`` appends JSON lines to ``path``; ``package.module:factory``
+    calls a factory returning any other SpanExporter.
+    """
+    if name == "none":
+        return None
+    if name == "file":
+        return FileSpanExporter(path)
+    module_name, _, attribute = name.partition(":")
+    if not attribute:
+        raise ValueError(f"Unknown span exporter '{name}'")
+    factory = getattr(importlib.import_module(module_name), attribute)
+    return factory()
+
+
+def configure_tracing() -> Tracer:
+    """Turn tracing on from the settings, with spans exported in the background"""
+    if not settings.TRACING_ENABLED:
+        return tracer
+    exporter = create_exporter(settings.TRACING_EXPORTER, settings.TRACING_FILE_PATH)
+    if exporter is None:
+        return tracer
+    processor = BatchSpanProcessor(
+        exporter,
+        queue_size=settings.TRACING_QUEUE_SIZE,
+        batch_size=settings.TRACING_BATCH_SIZE,
+        interval=settings.TRACING_EXPORT_INTERVAL,
+    )
+    processor.start()
+    tracer.service_name = settings.TRACING_SERVICE_NAME
+    tracer.configure(
+        processor,
+        sample_rate=settings.TRACING_SAMPLE_RATE,
+        slow_seconds=settings.TRACING_SLOW_SECONDS,
+    )
+    # Spans queued at exit are still exported
+    atexit.register(tracer.shutdown)
+    logger.info(
+        "Tracing enabled",
+        exporter=settings.TRACING_EXPORTER,
+        sample_rate=settings.TRACING_SAMPLE_RATE,
+    )
+    return tracer
+
+
+def _process_tracer() -> Tracer:
+    return tracer
+
+
+def _header(scope: Scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class TracingMiddleware:
+    """Root span of every request, continuing the gateway's trace
+
+    The span is named after the matched route once the request is handled
+    and fails on 5xx responses, so that tail sampling keeps the trace.
+    """
+
+    def __init__(self, app: ASGIApp, tracer: Optional[Tracer] = None):
+        self.app = app
+        self.tracer = tracer or _process_tracer()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        span = self.tracer.start_trace(
+            scope["method"],
+            _header(scope, TRACEPARENT.encode()),
+            _header(scope, TRACESTATE.encode()),
+            {"http.method": scope["method"], "http.target": scope["path"]},
+        )
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        with span:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = getattr(scope.get("route"), "path", None) or "unmatched"
+                span.name = f"{scope['method']} {route}"
+                span.set("http.status_code", status_code)
+                if status_code >= 500:
+                    span.record_error()
@@ -10,7 +10,12 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 
 from .config import settings
+from .core.admin import router as admin_router
 from .core.auth import router as auth_router
+from .core.deadlines import DeadlineMiddleware
+from .core.keys import jwks
+from .core.profiler import ProfilingMiddleware
+from .core.tracing import TracingMiddleware, configure_tracing, tracer
 from .core.users import router as users_router
 
 @asynccontextmanager
@@ -19,6 +24,9 @@ async def lifespan(app: FastAPI):
     # Startup
     print("Starting Auth Server")
     
+    # Export spans of sampled, failed and slow requests in the background
+    configure_tracing()
+    
     # Initialize database
     from .core.database import init_db
     await init_db()
@@ -29,6 +37,7 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     print("Shutting down Auth Server")
+    tracer.shutdown()
 
 def create_app() -> FastAPI:
     """Create and configure FastAPI application"""
@@ -52,15 +61,30 @@ def create_app() -> FastAPI:
     
     app.add_middleware(TrustedHostMiddleware, allowed_hosts=settings.ALLOWED_HOSTS)
     
+    # Give up on requests the gateway no longer waits for
+    app.add_middleware(DeadlineMiddleware)
+    
+    # Outermost, so the root span covers every other middleware
+    app.add_middleware(TracingMiddleware)
+    
+    # Marks X-Profile requests for the profiler; outermost to cover them all
+    app.add_middleware(ProfilingMiddleware)
+    
     # Add routes
     app.include_router(auth_router, prefix="/auth", tags=["authentication"])
     app.include_router(users_router, prefix="/users", tags=["users"])
+    app.include_router(admin_router, prefix="/admin", tags=["admin"])
     
     # Health check endpoint
     @app.get("/health")
     async def health_check():
         return {"status": "healthy", "service": "auth-server"}
     
+    # Public verification keys, for services that verify tokens offline
+    @app.get("/.well-known/jwks.json")
+    async def jwks_document():
+        return jwks()
+    
     # Root endpoint
     @app.get("/")
     async def root():
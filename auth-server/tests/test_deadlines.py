@@ -0,0 +1,49 @@
+# --------------------------------------------------------------------------
+# Tests for the deadline forwarded by the API Gateway.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+from typing import Dict
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.core.deadlines import DeadlineMiddleware
+
+
+def _client(finished: Dict[str, bool]) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(DeadlineMiddleware)
+
+    @app.get("/slow")
+    async def slow() -> Dict[str, str]:
+        await asyncio.sleep(0.5)
+        finished["slow"] = True
+        return {"status": "done"}
+
+    return TestClient(app)
+
+
+def test_requests_within_budget_are_answered() -> None:
+    """Test that a request is handled normally with or without a budget."""
+    finished: Dict[str, bool] = {}
+    client = _client(finished)
+
+    assert client.get("/slow").status_code == 200
+    response = client.get("/slow", headers={"x-request-timeout-ms": "5000"})
+    assert response.json() == {"status": "done"}
+
+
+def test_spent_budget_is_answered_504_without_finishing_the_work() -> None:
+    """Test that an exhausted or expiring budget stops the handler with a 504."""
+    finished: Dict[str, bool] = {}
+    client = _client(finished)
+
+    response = client.get("/slow", headers={"x-request-timeout-ms": "0"})
+    assert response.status_code == 504
+
+    response = client.get("/slow", headers={"x-request-timeout-ms": "50"})
+    assert response.status_code == 504
+    assert response.json() == {"detail": "Request deadline exceeded"}
+    assert finished == {}
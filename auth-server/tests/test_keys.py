@@ -0,0 +1,51 @@
+# --------------------------------------------------------------------------
+# Tests for the signing keys and the published JWKS.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+from typing import Iterator
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+
+from src.config import settings
+from src.core import keys
+
+
+@pytest.fixture
+def rsa_settings(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    monkeypatch.setattr(settings, "JWT_ALGORITHM", "RS256")
+    monkeypatch.setattr(settings, "JWT_PRIVATE_KEY", pem)
+    keys._private_key.cache_clear()
+    keys.public_jwk.cache_clear()
+    yield
+    keys._private_key.cache_clear()
+    keys.public_jwk.cache_clear()
+
+
+def test_tokens_verify_against_published_jwks(rsa_settings: None) -> None:
+    """Test that a token signed with the private key verifies with the JWKS."""
+    token = jwt.encode(
+        {"sub": "bnbong"}, keys.signing_key(), "RS256", headers=keys.token_headers()
+    )
+    published = keys.jwks()["keys"]
+
+    assert len(published) == 1
+    assert "d" not in published[0]
+    assert jwt.get_unverified_header(token)["kid"] == published[0]["kid"]
+    assert jwt.decode(token, published[0], algorithms=["RS256"])["sub"] == "bnbong"
+
+
+def test_shared_secret_is_never_published() -> None:
+    """Test that HMAC deployments publish no keys."""
+    assert settings.JWT_ALGORITHM == "HS256"
+    assert keys.jwks() == {"keys": []}
+    assert keys.token_headers() == {}
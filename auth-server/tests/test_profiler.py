@@ -0,0 +1,54 @@
+# --------------------------------------------------------------------------
+# Tests for the on-demand sampling profiler.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+import time
+from typing import Dict
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.core.profiler import ProfilingMiddleware, SamplingProfiler
+
+
+def _hash_password() -> None:
+    until = time.perf_counter() + 0.2
+    while time.perf_counter() < until:
+        pass
+
+
+async def _in_child_task() -> None:
+    _hash_password()
+
+
+def test_requests_profile_follows_marked_requests_into_their_tasks() -> None:
+    """Test that only X-Profile requests are sampled, including the tasks they start."""
+    sampler = SamplingProfiler()
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, profiler=sampler)
+
+    @app.get("/token")
+    async def token() -> Dict[str, str]:
+        await asyncio.create_task(_in_child_task())
+        return {"status": "ok"}
+
+    client = TestClient(app)
+    # Nothing is marked while no profile runs
+    assert client.get("/token", headers={"x-profile": "1"}).status_code == 200
+    assert not sampler.marked
+
+    sampler.start("requests", interval=0.005)
+    try:
+        assert client.get("/token").status_code == 200
+        assert client.get("/token", headers={"x-profile": "1"}).status_code == 200
+    finally:
+        result = sampler.stop()
+
+    # Only the marked request, not the unmarked one before it
+    assert 10 < result.samples < 60
+    assert all(stack.startswith("request;") for stack in result.stacks)
+    assert any("_in_child_task" in stack for stack in result.stacks)
+    assert "idle_samples" in result.to_dict()
+    assert result.collapsed().endswith("\n")
@@ -0,0 +1,62 @@
+# --------------------------------------------------------------------------
+# Tests for request tracing continued from the API Gateway.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import json
+from pathlib import Path
+from typing import Dict
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.core.tracing import (
+    BatchSpanProcessor,
+    FileSpanExporter,
+    Tracer,
+    TracingMiddleware,
+    traced,
+)
+
+GATEWAY_SPAN = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-00"
+
+
+def test_gateway_trace_is_continued_and_kept_when_it_fails(tmp_path: Path) -> None:
+    """Test that spans join the gateway's trace and failed traces are exported."""
+    path = tmp_path / "spans.jsonl"
+    processor = BatchSpanProcessor(FileSpanExporter(path), interval=0.05)
+    processor.start()
+    tracer = Tracer("auth-test")
+    tracer.configure(processor, sample_rate=0.0, slow_seconds=60)
+
+    @traced("auth.lookup")
+    async def lookup(username: str) -> str:
+        if username == "ghost":
+            raise LookupError(username)
+        return username
+
+    app = FastAPI()
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+
+    @app.get("/users/{username}")
+    async def user(username: str) -> Dict[str, str]:
+        return {"username": await lookup(username)}
+
+    client = TestClient(app, raise_server_exceptions=False)
+    response = client.get("/users/alice", headers={"traceparent": GATEWAY_SPAN})
+    assert response.status_code == 200
+    response = client.get("/users/ghost", headers={"traceparent": GATEWAY_SPAN})
+    assert response.status_code == 500
+    tracer.shutdown()
+
+    # The unsampled, successful request was dropped
+    spans = {
+        span["name"]: span for span in map(json.loads, path.read_text().splitlines())
+    }
+    assert set(spans) == {"GET /users/{username}", "auth.lookup"}
+    root = spans["GET /users/{username}"]
+    assert root["trace_id"] == "0af7651916cd43dd8448eb211c80319c"
+    assert root["parent_span_id"] == "b7ad6b7169203331"
+    assert root["attributes"]["sampling.decision"] == "error"
+    assert spans["auth.lookup"]["parent_span_id"] == root["span_id"]
+    assert spans["auth.lookup"]["attributes"]["error.type"] == "LookupError"
@@ -0,0 +1,143 @@
+# --------------------------------------------------------------------------
+# Benchmark of the gateway middleware stack: BaseHTTPMiddleware vs plain ASGI
+#
+# Usage: python -m benchmarks.middleware_stack [--requests 5000] [--concurrency 50]
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import argparse
+import asyncio
+import time
+from typing import Callable, Dict, List, Type
+
+import httpx
+import structlog
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from starlette.types import ASGIApp
+
+from src.core.middleware import LoggingMiddleware, RateLimitMiddleware
+
+logger = structlog.get_logger()
+
+
+class BaseHTTPLoggingMiddleware(BaseHTTPMiddleware):
+    """The previous LoggingMiddleware, kept as the baseline"""
+
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        start_time = time.time()
+        logger.info(
+            "Request started",
+            method=request.method,
+            url=str(request.url),
+            client_ip=request.client.host if request.client else None,
+            user_agent=request.headers.get("user-agent"),
+        )
+        response = await call_next(request)
+        logger.info(
+            "Request completed",
+            method=request.method,
+            url=str(request.url),
+            status_code=response.status_code,
+            duration=time.time() - start_time,
+        )
+        return response
+
+
+class BaseHTTPRateLimitMiddleware(BaseHTTPMiddleware):
+    """The previous RateLimitMiddleware, kept as the baseline"""
+
+    def __init__(self, app: ASGIApp, limit: int = 60):
+        super().__init__(app)
+        self.limit = limit
+        self.rate_limits: Dict[str, List[float]] = {}
+
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        client_ip = request.client.host if request.client else "unknown"
+        if not self._check_rate_limit(client_ip):
+            return Response("Rate limit exceeded", status_code=429)
+        return await call_next(request)
+
+    def _check_rate_limit(self, client_ip: str) -> bool:
+        # One timestamp per request in the last minute, per client
+        minute_ago = time.monotonic() - 60
+        timestamps = [t for t in self.rate_limits.get(client_ip, []) if t > minute_ago]
+        self.rate_limits[client_ip] = timestamps
+        if len(timestamps) >= self.limit:
+            return False
+        timestamps.append(time.monotonic())
+        return True
+
+
+async def endpoint(request: Request) -> Response:
+    return JSONResponse({"status": "ok"})
+
+
+def build_app(logging: Type, rate_limit: Type, limit: int) -> Starlette:
+    return Starlette(
+        routes=[Route("/ping", endpoint)],
+        middleware=[Middleware(logging), Middleware(rate_limit, limit=limit)],
+    )
+
+
+async def measure(app: Starlette, requests: int, concurrency: int) -> List[float]:
+    latencies: List[float] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        queue: "asyncio.Queue[int]" = asyncio.Queue()
+        for index in range(requests):
+            queue.put_nowait(index)
+
+        async def worker() -> None:
+            while not queue.empty():
+                queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.get("/ping")
+                latencies.append(time.perf_counter() - started)
+                assert response.status_code == 200
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies
+
+
+def report(name: str, latencies: List[float], elapsed: float) -> None:
+    ordered = sorted(latencies)
+    p50 = ordered[len(ordered) // 2] * 1000
+    p99 = ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)] * 1000
+    rps = len(ordered) / elapsed
+    print(f"{name:<20} {rps:>10.0f} {p50:>9.3f} {p99:>9.3f}")
+
+
+async def run(requests: int, concurrency: int) -> None:
+    # Drop log events after the call so the middleware itself is measured
+    structlog.configure(processors=[], logger_factory=structlog.ReturnLoggerFactory())
+    stacks = {
+        "BaseHTTPMiddleware": (BaseHTTPLoggingMiddleware, BaseHTTPRateLimitMiddleware),
+        "plain ASGI": (LoggingMiddleware, RateLimitMiddleware),
+    }
+    print(f"{'stack':<20} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, (logging, rate_limit) in stacks.items():
+        app = build_app(logging, rate_limit, limit=requests * 2)
+        # Warm up before measuring
+        await measure(app, min(requests, 200), concurrency)
+        started = time.perf_counter()
+        latencies = await measure(app, requests, concurrency)
+        report(name, latencies, time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Middleware stack overhead")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,490 @@
+# --------------------------------------------------------------------------
+# Load test of the gateway proxy path against local stub upstreams
+#
+# Usage:
+#   python -m benchmarks.proxy_load run [--upstream asgi|loopback]
+#       [--mode concurrency|rate] [--concurrency 10 50] [--rate 500 1000]
+#       [--duration 10] [--latency-ms 1] [--payload-bytes 1024]
+#       [--output results.json]
+#   python -m benchmarks.proxy_load compare baseline.json candidate.json
+#       [--threshold 0.1]
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+import structlog
+from fastapi import FastAPI
+
+from src.core.middleware import (
+    LoggingMiddleware,
+    MetricsMiddleware,
+    RateLimitMiddleware,
+)
+from src.core.pools import ConnectionPoolManager
+from src.core.ratelimit import LocalRateLimiter
+from src.core.router import router
+from src.core.services import ServiceRegistry
+
+# Time the stub spent on a request, so the client can subtract it
+STUB_SECONDS_HEADER = "x-stub-seconds"
+SERVICE = "bench"
+RESULTS_VERSION = 1
+
+# Metric name -> True when higher is better
+COMPARED_METRICS = {
+    "rps": True,
+    "latency_ms.p50": False,
+    "latency_ms.p99": False,
+    "latency_ms.p999": False,
+    "overhead_ms.p50": False,
+    "overhead_ms.p99": False,
+    "peak_rss_mb": False,
+}
+
+
+class PayloadStream(httpx.AsyncByteStream):
+    """Response body read from the stub as it would be from a socket"""
+
+    def __init__(self, payload: bytes):
+        self.payload = payload
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        yield self.payload
+
+
+class StubUpstream:
+    """Upstream answering every request with a fixed payload after a delay"""
+
+    def __init__(self, latency: float, jitter: float, payload_bytes: int, seed: int):
+        self.latency = latency
+        self.jitter = jitter
+        self.payload = b"x" * payload_bytes
+        self.random = random.Random(seed)
+
+    async def respond(self) -> Tuple[bytes, float]:
+        started = time.perf_counter()
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return self.payload, time.perf_counter() - started
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        """In-process upstream, behind an httpx.MockTransport"""
+        await request.aread()
+        payload, elapsed = await self.respond()
+        return httpx.Response(
+            200,
+            headers={
+                "content-length": str(len(payload)),
+                STUB_SECONDS_HEADER: f"{elapsed:.9f}",
+            },
+            stream=PayloadStream(payload),
+        )
+
+
+class LoopbackServer:
+    """Minimal HTTP/1.1 keep-alive server for a StubUpstream on 127.0.0.1"""
+
+    def __init__(self, stub: StubUpstream):
+        self.stub = stub
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        assert self.server is not None
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n")[1:]:
+                    name, _, value = line.partition(b":")
+                    if name.strip().lower() == b"content-length":
+                        length = int(value)
+                if length:
+                    await reader.readexactly(length)
+                payload, elapsed = await self.stub.respond()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"content-type: application/octet-stream\r\n"
+                    + f"content-length: {len(payload)}\r\n".encode()
+                    + f"{STUB_SECONDS_HEADER}: {elapsed:.9f}\r\n\r\n".encode()
+                    + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def build_gateway(registry: ServiceRegistry) -> FastAPI:
+    """The gateway app with the middleware stack of src.main"""
+    app = FastAPI()
+    app.add_middleware(LoggingMiddleware)
+    app.state.rate_limiter = LocalRateLimiter()
+    # A limit the load never reaches, so the limiter cost is measured
+    app.add_middleware(RateLimitMiddleware, limit=10**9, backend=app.state.rate_limiter)
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(router, prefix="/api/v1")
+    app.state.service_registry = registry
+    return app
+
+
+class Sample:
+    __slots__ = ("latency", "overhead", "ok")
+
+    def __init__(self, latency: float, overhead: Optional[float], ok: bool):
+        self.latency = latency
+        self.overhead = overhead
+        self.ok = ok
+
+
+async def send(client: httpx.AsyncClient, scheduled: float) -> Sample:
+    """One proxied request; latency counts from when it was due"""
+    try:
+        response = await client.get(f"/api/v1/{SERVICE}/items")
+    except httpx.HTTPError:
+        return Sample(time.perf_counter() - scheduled, None, False)
+    latency = time.perf_counter() - scheduled
+    upstream = response.headers.get(STUB_SECONDS_HEADER)
+    overhead = latency - float(upstream) if upstream is not None else None
+    return Sample(latency, overhead, response.status_code == 200)
+
+
+async def closed_loop(
+    client: httpx.AsyncClient, concurrency: int, duration: float
+) -> List[Sample]:
+    """Each of ``concurrency`` clients sends its next request on a response"""
+    samples: List[Sample] = []
+    deadline = time.perf_counter() + duration
+
+    async def worker() -> None:
+        while time.perf_counter() < deadline:
+            samples.append(await send(client, time.perf_counter()))
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return samples
+
+
+async def open_loop(
+    client: httpx.AsyncClient, rate: float, duration: float
+) -> List[Sample]:
+    """Requests arrive at ``rate`` per second whether or not earlier ones finished
+
+    Latency is measured from each request's scheduled arrival, so a
+    gateway that falls behind is charged for the queueing it causes.
+    """
+    started = time.perf_counter()
+    tasks: List["asyncio.Task[Sample]"] = []
+    for index in range(int(rate * duration)):
+        scheduled = started + index / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(client, scheduled)))
+    return list(await asyncio.gather(*tasks))
+
+
+async def drive(
+    client: httpx.AsyncClient, mode: str, load: float, duration: float
+) -> List[Sample]:
+    if mode == "concurrency":
+        return await closed_loop(client, int(load), duration)
+    return await open_loop(client, load, duration)
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def distribution_ms(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    return {
+        "mean": round(sum(ordered) / len(ordered) * 1000, 4) if ordered else 0.0,
+        "p50": round(percentile(ordered, 0.5) * 1000, 4),
+        "p99": round(percentile(ordered, 0.99) * 1000, 4),
+        "p999": round(percentile(ordered, 0.999) * 1000, 4),
+    }
+
+
+def rss_mb() -> Tuple[float, float]:
+    """Current and peak resident set size of this process"""
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2**20
+    try:
+        with open("/proc/self/statm") as statm:
+            current = int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        current = peak
+    return round(current, 1), round(peak, 1)
+
+
+def summarize(
+    scenario: Dict[str, Any], samples: List[Sample], elapsed: float
+) -> Dict[str, Any]:
+    ok = [sample for sample in samples if sample.ok]
+    current_rss, peak_rss = rss_mb()
+    return {
+        "scenario": scenario,
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "duration_s": round(elapsed, 3),
+        "rps": round(len(ok) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": distribution_ms([sample.latency for sample in ok]),
+        "overhead_ms": distribution_ms(
+            [sample.overhead for sample in ok if sample.overhead is not None]
+        ),
+        "rss_mb": current_rss,
+        "peak_rss_mb": peak_rss,
+    }
+
+
+def scenario_key(scenario: Dict[str, Any]) -> str:
+    load = (
+        f"c{scenario['concurrency']}"
+        if scenario["mode"] == "concurrency"
+        else f"r{scenario['rate']:g}"
+    )
+    return (
+        f"{scenario['upstream']}/{scenario['mode']}/{load}"
+        f"/{scenario['latency_ms']:g}ms/{scenario['payload_bytes']}B"
+    )
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    # Drop log events after the call so the gateway itself is measured
+    structlog.configure(processors=[], logger_factory=structlog.ReturnLoggerFactory())
+
+    stub = StubUpstream(
+        args.latency_ms / 1000, args.jitter_ms / 1000, args.payload_bytes, args.seed
+    )
+    loopback: Optional[LoopbackServer] = None
+    if args.upstream == "loopback":
+        loopback = LoopbackServer(stub)
+        await loopback.start()
+        registry = ServiceRegistry()
+        url = loopback.url
+    else:
+        registry = ServiceRegistry(
+            ConnectionPoolManager(lambda name, config: httpx.MockTransport(stub.handle))
+        )
+        url = "http://stub"
+    await registry.add_service(
+        SERVICE,
+        {
+            "url": url,
+            "pool": {
+                "max_connections": args.pool_size,
+                "max_keepalive_connections": args.pool_size,
+            },
+        },
+    )
+
+    app = build_gateway(registry)
+    loads: List[Tuple[str, float]] = (
+        [("concurrency", c) for c in args.concurrency]
+        if args.mode == "concurrency"
+        else [("rate", r) for r in args.rate]
+    )
+    results: List[Dict[str, Any]] = []
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url="http://gateway",
+            timeout=30.0,
+        ) as client:
+            for mode, load in loads:
+                await drive(client, mode, load, args.warmup)
+                started = time.perf_counter()
+                samples = await drive(client, mode, load, args.duration)
+                elapsed = time.perf_counter() - started
+
+                scenario = {
+                    "upstream": args.upstream,
+                    "mode": mode,
+                    "concurrency": int(load) if mode == "concurrency" else None,
+                    "rate": load if mode == "rate" else None,
+                    "latency_ms": args.latency_ms,
+                    "jitter_ms": args.jitter_ms,
+                    "payload_bytes": args.payload_bytes,
+                }
+                result = summarize(scenario, samples, elapsed)
+                result["key"] = scenario_key(scenario)
+                results.append(result)
+                print_result(result)
+    finally:
+        await registry.cleanup()
+        if loopback is not None:
+            await loopback.stop()
+
+    return {
+        "version": RESULTS_VERSION,
+        "benchmark": "proxy_load",
+        "environment": environment(),
+        "results": results,
+    }
+
+
+def print_result(result: Dict[str, Any]) -> None:
+    latency, overhead = result["latency_ms"], result["overhead_ms"]
+    print(
+        f"{result['key']:<40} {result['rps']:>9.0f} {latency['p50']:>8.3f}"
+        f" {latency['p99']:>8.3f} {latency['p999']:>8.3f} {overhead['p50']:>8.3f}"
+        f" {overhead['p99']:>8.3f} {result['errors']:>6} {result['peak_rss_mb']:>7.1f}"
+    )
+
+
+def metric(result: Dict[str, Any], name: str) -> float:
+    value: Any = result
+    for part in name.split("."):
+        value = value[part]
+    return float(value)
+
+
+def compare(
+    baseline: Dict[str, Any],
+    candidate: Dict[str, Any],
+    threshold: float,
+    min_delta_ms: float,
+) -> List[str]:
+    """Print metric changes per scenario; return the regressions"""
+    before = {result["key"]: result for result in baseline["results"]}
+    regressions: List[str] = []
+    print(
+        f"{'scenario':<40} {'metric':<16} {'baseline':>10} {'candidate':>10} {'change':>8}"
+    )
+    for result in candidate["results"]:
+        previous = before.get(result["key"])
+        if previous is None:
+            print(f"{result['key']:<40} (not in baseline)")
+            continue
+        for name, higher_is_better in COMPARED_METRICS.items():
+            old, new = metric(previous, name), metric(result, name)
+            change = (new - old) / old if old else 0.0
+            worse = -change if higher_is_better else change
+            # Sub-threshold absolute latency changes are noise, not regressions
+            noise = "_ms." in name and new - old < min_delta_ms
+            regressed = worse > threshold and not noise
+            flag = "  REGRESSION" if regressed else ""
+            print(
+                f"{result['key']:<40} {name:<16} {old:>10.3f} {new:>10.3f}"
+                f" {change:>+8.1%}{flag}"
+            )
+            if regressed:
+                regressions.append(f"{result['key']} {name} {change:+.1%}")
+        if result["errors"] > previous["errors"]:
+            regressions.append(
+                f"{result['key']} errors {previous['errors']} -> {result['errors']}"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Gateway proxy load test")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="drive the gateway and report")
+    run_parser.add_argument("--upstream", choices=["asgi", "loopback"], default="asgi")
+    run_parser.add_argument(
+        "--mode", choices=["concurrency", "rate"], default="concurrency"
+    )
+    run_parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50])
+    run_parser.add_argument("--rate", type=float, nargs="+", default=[500.0])
+    run_parser.add_argument("--duration", type=float, default=10.0)
+    run_parser.add_argument("--warmup", type=float, default=2.0)
+    run_parser.add_argument("--latency-ms", type=float, default=1.0)
+    run_parser.add_argument("--jitter-ms", type=float, default=0.0)
+    run_parser.add_argument("--payload-bytes", type=int, default=1024)
+    run_parser.add_argument("--pool-size", type=int, default=100)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", help="write the results as JSON here")
+
+    compare_parser = commands.add_parser("compare", help="flag regressions")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative change counted as a regression (0.1 = 10%%)",
+    )
+    compare_parser.add_argument(
+        "--min-delta-ms",
+        type=float,
+        default=0.05,
+        help="latency increases smaller than this are ignored",
+    )
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.candidate) as f:
+            candidate = json.load(f)
+        regressions = compare(baseline, candidate, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s):")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        return
+
+    print(
+        f"{'scenario':<40} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'p999 ms':>8}"
+        f" {'gw p50':>8} {'gw p99':>8} {'errors':>6} {'rss MB':>7}"
+    )
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# --------------------------------------------------------------------------
+# Micro-benchmark of route table matching cost
+#
+# Usage: python -m benchmarks.route_match [--routes 10 100 1000 10000]
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import argparse
+import random
+import timeit
+from typing import Any, Dict, List
+
+from src.core.routes import RouteTable
+
+
+def build_services(count: int) -> Dict[str, Dict[str, Any]]:
+    """Services with nested routes, some behind host and method conditions"""
+    services: Dict[str, Dict[str, Any]] = {}
+    for index in range(count):
+        routes: List[Dict[str, Any]] = [
+            {"prefix": f"/svc-{index}/v1/items"},
+            {"prefix": f"/svc-{index}/v1/items/admin", "methods": ["POST"]},
+        ]
+        if index % 10 == 0:
+            routes.append({"prefix": f"/svc-{index}/v1", "hosts": ["*.example.com"]})
+        services[f"svc-{index}"] = {"url": f"http://svc-{index}", "routes": routes}
+    return services
+
+
+def run(counts: List[int], number: int) -> None:
+    print(f"{'services':>10} {'routes':>8} {'compile ms':>11} {'match ns':>9}")
+    for count in counts:
+        services = build_services(count)
+        started = timeit.default_timer()
+        table = RouteTable.compile(services)
+        compile_ms = (timeit.default_timer() - started) * 1000
+
+        rng = random.Random(count)
+        paths = [
+            f"/svc-{rng.randrange(count)}/v1/items/{rng.randrange(1000)}/details"
+            for _ in range(1000)
+        ]
+        seconds = timeit.timeit(
+            "for path in paths: match(path, 'api.example.com', 'GET')",
+            globals={"paths": paths, "match": table.match},
+            number=number,
+        )
+        match_ns = seconds / (number * len(paths)) * 1e9
+        print(
+            f"{count:>10} {len(table.routes):>8} {compile_ms:>11.1f} {match_ns:>9.0f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Route table matching cost")
+    parser.add_argument("--routes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--number", type=int, default=50)
+    args = parser.parse_args()
+    run(args.routes, args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+# --------------------------------------------------------------------------
+# Offline bearer token verification for the API Gateway service
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import structlog
+from jose import JWTError, jwt
+
+from ..config import settings
+from .metrics import AUTH_REQUESTS
+
+logger = structlog.get_logger()
+
+# Identity headers set by the gateway; never taken from clients
+USER_ID_HEADER = "x-user-id"
+USER_SCOPES_HEADER = "x-user-scopes"
+TRUSTED_HEADERS = (USER_ID_HEADER, USER_SCOPES_HEADER)
+
+DEFAULT_AUTH_CONFIG: Dict[str, Any] = {
+    # Reject requests without a valid token; when false a token is verified
+    # if present and the request goes through anonymously otherwise
+    "required": True,
+}
+
+
+class AuthError(Exception):
+    """Raised when a bearer token is missing or invalid"""
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+def auth_settings(value: Any) -> Optional[Dict[str, Any]]:
+    """Resolve an ``auth`` config value, None when the route is public"""
+    if not value:
+        return None
+    if value is True:
+        return dict(DEFAULT_AUTH_CONFIG)
+    return {**DEFAULT_AUTH_CONFIG, **value}
+
+
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    """Token of an ``Authorization: Bearer`` header"""
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return None
+    return token.strip()
+
+
+def token_scopes(claims: Dict[str, Any]) -> List[str]:
+    """Scopes granted by verified claims, from ``scope`` or ``scopes``"""
+    scopes = claims.get("scope", claims.get("scopes")) or []
+    return scopes.split() if isinstance(scopes, str) else list(scopes)
+
+
+def identity_headers(
+    headers: Dict[str, str], claims: Optional[Dict[str, Any]]
+) -> Dict[str, str]:
+    """Drop client-sent identity headers and add those of verified claims"""
+    headers = {
+        name: value for name, value in headers.items() if name not in TRUSTED_HEADERS
+    }
+    if claims is None:
+        return headers
+    headers[USER_ID_HEADER] = str(claims.get("sub", ""))
+    scopes = token_scopes(claims)
+    if scopes:
+        headers[USER_SCOPES_HEADER] = " ".join(scopes)
+    return headers
+
+
+class KeySet:
+    """Verification keys of the auth server, refreshed in the background
+
+    Keys are read from the auth server's JWKS document. With an HMAC
+    algorithm the shared secret is used instead and nothing is fetched.
+    """
+
+    def __init__(
+        self,
+        jwks_url: Optional[str],
+        secret: Optional[str] = None,
+        refresh_interval: float = 300.0,
+        min_refresh_interval: float = 30.0,
+        client: Optional[httpx.AsyncClient] = None,
+    ):
+        self.jwks_url = jwks_url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.client = client or httpx.AsyncClient(timeout=5.0)
+        self.keys: Dict[Optional[str], Any] = {}
+        if secret is not None:
+            self.keys[None] = secret
+        self._refreshed_at = float("-inf")
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._lock = asyncio.Lock()
+
+    def get(self, kid: Optional[str]) -> Any:
+        key = self.keys.get(kid)
+        if key is None and kid is None and len(self.keys) == 1:
+            # Tokens without a kid are accepted while there is a single key
+            key = next(iter(self.keys.values()))
+        return key
+
+    async def refresh(self) -> None:
+        """Fetch the JWKS document and replace the known keys"""
+        if self.jwks_url is None:
+            return
+        async with self._lock:
+            self._refreshed_at = time.monotonic()
+            try:
+                response = await self.client.get(self.jwks_url)
+                response.raise_for_status()
+                keys = response.json()["keys"]
+            except (httpx.HTTPError, ValueError, KeyError) as e:
+                logger.warning(
+                    "Signing keys could not be loaded", url=self.jwks_url, error=str(e)
+                )
+                return
+            self.keys = {key.get("kid"): key for key in keys}
+            logger.info("Signing keys loaded", count=len(self.keys))
+
+    async def refresh_for(self, kid: Optional[str]) -> Any:
+        """Refresh early for an unknown key id, at most every min_refresh_interval"""
+        if time.monotonic() - self._refreshed_at >= self.min_refresh_interval:
+            await self.refresh()
+        return self.get(kid)
+
+    async def start(self) -> None:
+        await self.refresh()
+        if self.jwks_url is not None and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.refresh()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.client.aclose()
+
+
+class Authenticator:
+    """Verifies bearer tokens locally and caches the verified claims
+
+    Claims are cached under the SHA-256 of the token until the token
+    expires or ``cache_ttl`` passes, whichever comes first, so repeated
+    requests with one token cost a hash and a dict lookup.
+    """
+
+    def __init__(
+        self,
+        keys: KeySet,
+        algorithms: Tuple[str, ...],
+        issuer: Optional[str] = None,
+        audience: Optional[str] = None,
+        cache_size: int = 10_000,
+        cache_ttl: float = 60.0,
+    ):
+        self.keys = keys
+        self.algorithms = list(algorithms)
+        self.issuer = issuer
+        self.audience = audience
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache: "OrderedDict[bytes, Tuple[Dict[str, Any], float]]" = OrderedDict()
+
+    async def verify(self, token: str) -> Dict[str, Any]:
+        """Claims of a valid access token; raises AuthError otherwise"""
+        digest = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+        cached = self._cache.get(digest)
+        if cached is not None:
+            claims, expires_at = cached
+            if expires_at > now:
+                self._cache.move_to_end(digest)
+                AUTH_REQUESTS.labels(result="cached").inc()
+                return claims
+            del self._cache[digest]
+
+        try:
+            claims = await self._decode(token)
+        except AuthError:
+            AUTH_REQUESTS.labels(result="rejected").inc()
+            raise
+        AUTH_REQUESTS.labels(result="verified").inc()
+
+        expires_at = now + self.cache_ttl
+        if "exp" in claims:
+            expires_at = min(expires_at, float(claims["exp"]))
+        self._cache[digest] = (claims, expires_at)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return claims
+
+    async def _decode(self, token: str) -> Dict[str, Any]:
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except JWTError:
+            raise AuthError("Malformed token")
+        key = self.keys.get(kid)
+        if key is None:
+            # The auth server may have rotated its keys since the last refresh
+            key = await self.keys.refresh_for(kid)
+        if key is None:
+            raise AuthError("Unknown signing key")
+
+        try:
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=self.algorithms,
+                issuer=self.issuer,
+                audience=self.audience,
+                options={"verify_aud": self.audience is not None},
+            )
+        except JWTError as e:
+            raise AuthError(str(e))
+        if claims.get("type") == "refresh":
+            raise AuthError("Refresh tokens cannot be used for requests")
+        if "sub" not in claims:
+            raise AuthError("Token has no subject")
+        return claims
+
+    def stats(self) -> Dict[str, Any]:
+        return {"cached_tokens": len(self._cache), "keys": len(self.keys.keys)}
+
+    async def start(self) -> None:
+        await self.keys.start()
+
+    async def stop(self) -> None:
+        await self.keys.stop()
+
+
+def create_authenticator() -> Authenticator:
+    """Build the authenticator from the JWT settings"""
+    hmac = settings.JWT_ALGORITHM.startswith("HS")
+    keys = KeySet(
+        jwks_url=None if hmac else settings.AUTH_JWKS_URL,
+        secret=settings.JWT_SECRET_KEY if hmac else None,
+        refresh_interval=settings.AUTH_JWKS_REFRESH_SECONDS,
+    )
+    return Authenticator(
+        keys,
+        algorithms=(settings.JWT_ALGORITHM,),
+        issuer=settings.JWT_ISSUER,
+        audience=settings.JWT_AUDIENCE,
+        cache_size=settings.AUTH_CACHE_SIZE,
+        cache_ttl=settings.AUTH_CACHE_TTL,
+    )
@@ -0,0 +1,267 @@
+# --------------------------------------------------------------------------
+# Upstream endpoint load balancing for the API Gateway service
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import bisect
+import hashlib
+import math
+import random
+import time
+from typing import Any, Collection, Dict, List, Optional, Type
+
+import structlog
+
+logger = structlog.get_logger()
+
+# Defaults applied to a service's "load_balancer" section
+DEFAULT_BALANCER_CONFIG: Dict[str, Any] = {
+    "policy": "round_robin",
+    "hash_header": None,
+    "ewma_decay": 10.0,
+    "virtual_nodes": 100,
+}
+
+# Cost of an unmeasured endpoint that already has a request in flight
+UNMEASURED_PENALTY = 1e6
+
+
+class NoEndpointAvailable(Exception):
+    """Raised when every endpoint of a service is excluded"""
+
+
+class Endpoint:
+    """One upstream instance of a service and its observed load"""
+
+    def __init__(self, url: str, weight: int = 1):
+        self.url = url.rstrip("/")
+        self.weight = max(int(weight), 1)
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.ewma = 0.0
+        self._ewma_at = time.monotonic()
+        # Smooth weighted round-robin state
+        self.current_weight = 0
+
+    def start(self) -> None:
+        """Count a request sent to the endpoint"""
+        self.outstanding += 1
+        self.requests += 1
+
+    def release(self) -> None:
+        """Stop counting a request started with start()"""
+        self.outstanding = max(self.outstanding - 1, 0)
+
+    def observe(self, latency: float, success: bool, decay: float) -> None:
+        """Record the latency and outcome of a response"""
+        if not success:
+            self.failures += 1
+
+        now = time.monotonic()
+        if latency > self.ewma:
+            # Peak-sensitive: react to slowdowns immediately, recover slowly
+            self.ewma = latency
+        else:
+            weight = math.exp(-(now - self._ewma_at) / decay)
+            self.ewma = self.ewma * weight + latency * (1 - weight)
+        self._ewma_at = now
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ewma_latency": round(self.ewma, 6),
+        }
+
+
+def parse_endpoints(config: Dict[str, Any]) -> List[Endpoint]:
+    """Build the endpoints of a service from "endpoints" or its single "url" """
+    entries = config.get("endpoints") or [{"url": config["url"]}]
+    return [
+        Endpoint(entry, 1) if isinstance(entry, str) else Endpoint(**entry)
+        for entry in entries
+    ]
+
+
+class LoadBalancer:
+    """Base class of the endpoint selection policies"""
+
+    policy = ""
+
+    def __init__(self, endpoints: List[Endpoint], config: Dict[str, Any]):
+        self.endpoints = endpoints
+        self.config = config
+
+    def _candidates(self, exclude: Collection[str]) -> List[Endpoint]:
+        candidates = [e for e in self.endpoints if e.url not in exclude]
+        if not candidates:
+            raise NoEndpointAvailable("No upstream endpoint available")
+        return candidates
+
+    def select(
+        self, hash_key: Optional[str] = None, exclude: Collection[str] = ()
+    ) -> Endpoint:
+        """Pick the endpoint for the next request"""
+        raise NotImplementedError
+
+    def hash_key(
+        self, headers: Dict[str, str], client_ip: Optional[str]
+    ) -> Optional[str]:
+        """Request attribute used by hashing policies, None for the others"""
+        return None
+
+    def observe(self, endpoint: Endpoint, latency: float, success: bool) -> None:
+        """Feed a response seen from an endpoint into the balancer state"""
+        endpoint.observe(latency, success, self.config["ewma_decay"])
+
+    def record(self, endpoint: Endpoint, latency: float, success: bool) -> None:
+        """Feed a finished request back into the balancer state"""
+        self.observe(endpoint, latency, success)
+        endpoint.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints],
+        }
+
+
+class RoundRobinBalancer(LoadBalancer):
+    """Smooth weighted round-robin, as used by nginx"""
+
+    policy = "round_robin"
+
+    def select(
+        self, hash_key: Optional[str] = None, exclude: Collection[str] = ()
+    ) -> Endpoint:
+        candidates = self._candidates(exclude)
+        total = 0
+        for endpoint in candidates:
+            endpoint.current_weight += endpoint.weight
+            total += endpoint.weight
+        chosen = max(candidates, key=lambda e: e.current_weight)
+        chosen.current_weight -= total
+        return chosen
+
+
+class LeastOutstandingBalancer(LoadBalancer):
+    """Fewest in-flight requests per unit of weight"""
+
+    policy = "least_outstanding"
+
+    def select(
+        self, hash_key: Optional[str] = None, exclude: Collection[str] = ()
+    ) -> Endpoint:
+        candidates = self._candidates(exclude)
+        lowest = min(e.outstanding / e.weight for e in candidates)
+        return random.choice(
+            [e for e in candidates if e.outstanding / e.weight == lowest]
+        )
+
+
+class PeakEwmaBalancer(LoadBalancer):
+    """Lowest peak-EWMA latency scaled by in-flight requests (Finagle style)"""
+
+    policy = "peak_ewma"
+
+    def select(
+        self, hash_key: Optional[str] = None, exclude: Collection[str] = ()
+    ) -> Endpoint:
+        candidates = self._candidates(exclude)
+        return min(candidates, key=lambda e: (self._cost(e), random.random()))
+
+    @staticmethod
+    def _cost(endpoint: Endpoint) -> float:
+        if endpoint.ewma == 0:
+            # Unmeasured endpoints get a single probe request at a time
+            return 0.0 if endpoint.outstanding == 0 else UNMEASURED_PENALTY
+        return endpoint.ewma * (endpoint.outstanding + 1) / endpoint.weight
+
+
+class ConsistentHashBalancer(LoadBalancer):
+    """Hash ring on a request header or the client IP, for cache locality"""
+
+    policy = "consistent_hash"
+
+    def __init__(self, endpoints: List[Endpoint], config: Dict[str, Any]):
+        super().__init__(endpoints, config)
+        ring = []
+        for endpoint in endpoints:
+            for replica in range(config["virtual_nodes"] * endpoint.weight):
+                ring.append((_hash(f"{endpoint.url}#{replica}"), endpoint))
+        ring.sort(key=lambda point: point[0])
+        self._points = [point for point, _ in ring]
+        self._ring = [endpoint for _, endpoint in ring]
+        self._fallback = RoundRobinBalancer(endpoints, config)
+
+    def hash_key(
+        self, headers: Dict[str, str], client_ip: Optional[str]
+    ) -> Optional[str]:
+        header = self.config["hash_header"]
+        if header:
+            return headers.get(header.lower())
+        return client_ip
+
+    def select(
+        self, hash_key: Optional[str] = None, exclude: Collection[str] = ()
+    ) -> Endpoint:
+        if hash_key is None:
+            return self._fallback.select(exclude=exclude)
+
+        self._candidates(exclude)
+        start = bisect.bisect(self._points, _hash(hash_key))
+        for offset in range(len(self._ring)):
+            endpoint = self._ring[(start + offset) % len(self._ring)]
+            if endpoint.url not in exclude:
+                return endpoint
+        raise NoEndpointAvailable("No upstream endpoint available")
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+BALANCER_POLICIES: Dict[str, Type[LoadBalancer]] = {
+    policy.policy: policy
+    for policy in (
+        RoundRobinBalancer,
+        LeastOutstandingBalancer,
+        PeakEwmaBalancer,
+        ConsistentHashBalancer,
+    )
+}
+
+
+def build_balancer(config: Dict[str, Any]) -> LoadBalancer:
+    """Create the load balancer described by a service configuration"""
+    balancer_config = {**DEFAULT_BALANCER_CONFIG, **config.get("load_balancer", {})}
+    policy = BALANCER_POLICIES.get(balancer_config["policy"])
+    if policy is None:
+        raise ValueError(f"Unknown load balancing policy '{balancer_config['policy']}'")
+    return policy(parse_endpoints(config), balancer_config)
+
+
+class BalancerManager:
+    """Load balancer state of every registered service"""
+
+    def __init__(self) -> None:
+        self.balancers: Dict[str, LoadBalancer] = {}
+
+    def configure(self, name: str, config: Dict[str, Any]) -> None:
+        self.balancers[name] = build_balancer(config)
+
+    def remove(self, name: str) -> None:
+        self.balancers.pop(name, None)
+
+    def get(self, name: str) -> LoadBalancer:
+        balancer = self.balancers.get(name)
+        if balancer is None:
+            raise ValueError(f"Service '{name}' not found")
+        return balancer
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: balancer.stats() for name, balancer in self.balancers.items()}
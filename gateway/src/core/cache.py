@@ -0,0 +1,396 @@
+# --------------------------------------------------------------------------
+# HTTP response cache for proxied GET requests
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlencode
+
+import httpx
+import structlog
+
+from .metrics import CACHE_EVICTIONS, CACHE_REQUESTS
+
+logger = structlog.get_logger()
+
+# Defaults applied to a service's "cache" section
+DEFAULT_CACHE_CONFIG: Dict[str, Any] = {
+    "enabled": True,
+    "ttl": 60,
+    "max_bytes": 16 * 1024 * 1024,
+    "max_entry_bytes": 1024 * 1024,
+    "stale_while_revalidate": 0,
+}
+
+# Status codes a shared cache may store (RFC 9111, heuristically cacheable)
+CACHEABLE_STATUS_CODES = frozenset({200, 203, 204, 300, 301, 404, 405, 410, 414, 501})
+
+# Cache outcomes, also used as the X-Cache response header value
+HIT = "HIT"
+MISS = "MISS"
+STALE = "STALE"
+REVALIDATED = "REVALIDATED"
+BYPASS = "BYPASS"
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """Parse a Cache-Control header into a directive -> argument mapping"""
+    directives: Dict[str, Optional[str]] = {}
+    if not value:
+        return directives
+    for part in value.split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') if argument else None
+    return directives
+
+
+def _seconds(value: Optional[str]) -> Optional[int]:
+    """Parse a delta-seconds directive argument"""
+    try:
+        return max(int(value), 0) if value is not None else None
+    except ValueError:
+        return None
+
+
+def cache_key(path: str, params: Optional[Dict[str, str]] = None) -> str:
+    """Build the primary cache key from the path and a normalized query"""
+    if not params:
+        return path
+    return f"{path}?{urlencode(sorted(params.items()))}"
+
+
+class CachedResponse:
+    """Fully buffered upstream response held by the cache"""
+
+    __slots__ = (
+        "status_code",
+        "headers",
+        "body",
+        "fresh_for",
+        "stale_for",
+        "stored_at",
+        "etag",
+        "last_modified",
+        "shared",
+    )
+
+    def __init__(
+        self,
+        status_code: int,
+        headers: Headers,
+        body: bytes,
+        fresh_for: float = 0,
+        stale_for: float = 0,
+        stored_at: Optional[float] = None,
+    ):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.fresh_for = fresh_for
+        self.stale_for = stale_for
+        self.stored_at = time.monotonic() if stored_at is None else stored_at
+        self.etag = self.header("etag")
+        self.last_modified = self.header("last-modified")
+        # Whether the cache holds this response, for every client to reuse
+        self.shared = False
+
+    def header(self, name: str) -> Optional[str]:
+        """Get the first value of a response header"""
+        encoded = name.encode("latin-1")
+        for key, value in self.headers:
+            if key == encoded:
+                return value.decode("latin-1")
+        return None
+
+    @property
+    def size(self) -> int:
+        """Approximate number of bytes the entry occupies"""
+        return len(self.body) + sum(len(k) + len(v) for k, v in self.headers)
+
+    def age(self, now: float) -> int:
+        return int(now - self.stored_at)
+
+    def is_fresh(self, now: float) -> bool:
+        return now - self.stored_at < self.fresh_for
+
+    def is_stale_usable(self, now: float) -> bool:
+        """Whether the entry may be served while it is revalidated"""
+        return now - self.stored_at < self.fresh_for + self.stale_for
+
+    def copy(self) -> "CachedResponse":
+        """Copy of the entry with its own header list
+
+        The body is immutable bytes, so copies share it safely.
+        """
+        copy = CachedResponse(
+            self.status_code,
+            list(self.headers),
+            self.body,
+            self.fresh_for,
+            self.stale_for,
+            self.stored_at,
+        )
+        copy.shared = self.shared
+        return copy
+
+    def refreshed(
+        self, not_modified: httpx.Response, config: Dict[str, Any]
+    ) -> "CachedResponse":
+        """Build the entry that results from a 304 revalidation"""
+        updated = {key.lower() for key, _ in not_modified.headers.raw}
+        headers = [(k, v) for k, v in self.headers if k not in updated]
+        headers.extend(
+            (k.lower(), v)
+            for k, v in not_modified.headers.raw
+            if k.lower()
+            not in (b"content-length", b"content-encoding", b"transfer-encoding")
+        )
+        fresh_for, stale_for = freshness(not_modified.headers, config)
+        return CachedResponse(
+            self.status_code, headers, self.body, fresh_for, stale_for
+        )
+
+
+def cache_settings(value: Any) -> Optional[Dict[str, Any]]:
+    """Resolve a "cache" setting (true or an object), None when disabled"""
+    if value is True:
+        value = {}
+    if isinstance(value, dict) and value.get("enabled", True):
+        return {**DEFAULT_CACHE_CONFIG, **value}
+    return None
+
+
+def freshness(headers: httpx.Headers, config: Dict[str, Any]) -> Tuple[float, float]:
+    """Compute the fresh and stale-while-revalidate lifetimes of a response"""
+    directives = parse_cache_control(headers.get("cache-control"))
+    if "no-cache" in directives:
+        fresh_for = 0
+    else:
+        explicit = _seconds(directives.get("s-maxage"))
+        if explicit is None:
+            explicit = _seconds(directives.get("max-age"))
+        fresh_for = config["ttl"] if explicit is None else explicit
+
+    stale_for = _seconds(directives.get("stale-while-revalidate"))
+    if stale_for is None:
+        stale_for = config["stale_while_revalidate"]
+    return fresh_for, stale_for
+
+
+def is_storable(
+    request_headers: Dict[str, str], response: httpx.Response, config: Dict[str, Any]
+) -> bool:
+    """Whether a shared cache may store the response (RFC 9111 section 3)"""
+    if response.status_code not in CACHEABLE_STATUS_CODES:
+        return False
+
+    directives = parse_cache_control(response.headers.get("cache-control"))
+    if "no-store" in directives or "private" in directives:
+        return False
+    if response.headers.get("vary", "").strip() == "*":
+        return False
+    if "set-cookie" in response.headers:
+        return False
+    if "authorization" in request_headers and not (
+        "public" in directives or "s-maxage" in directives
+    ):
+        return False
+    return len(response.content) <= config["max_entry_bytes"]
+
+
+def vary_names(headers: httpx.Headers) -> Tuple[str, ...]:
+    """Request headers the response varies on
+
+    Bodies are stored decoded, so Accept-Encoding never selects a variant.
+    """
+    names = {
+        name.strip().lower()
+        for value in headers.get_list("vary")
+        for name in value.split(",")
+        if name.strip()
+    }
+    names.discard("accept-encoding")
+    return tuple(sorted(names))
+
+
+class _CacheSlot:
+    """All stored variants of one primary cache key"""
+
+    __slots__ = ("vary", "variants")
+
+    def __init__(self, vary: Tuple[str, ...]):
+        self.vary = vary
+        self.variants: Dict[Tuple[str, ...], CachedResponse] = {}
+
+    def variant_key(self, request_headers: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(request_headers.get(name, "") for name in self.vary)
+
+    @property
+    def size(self) -> int:
+        return sum(entry.size for entry in self.variants.values())
+
+
+class ResponseCache:
+    """Byte-budgeted LRU cache of one service's responses"""
+
+    def __init__(self, service_name: str, config: Dict[str, Any]):
+        self.service_name = service_name
+        self.config = {**DEFAULT_CACHE_CONFIG, **config}
+        self.current_bytes = 0
+        self.counters: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "stale_hits": 0,
+            "revalidations": 0,
+            "bypasses": 0,
+            "evictions": 0,
+        }
+        self._slots: "OrderedDict[str, _CacheSlot]" = OrderedDict()
+        self._revalidating: Set[str] = set()
+        self._tasks: Set["asyncio.Task[None]"] = set()
+
+    def lookup(
+        self, key: str, request_headers: Dict[str, str]
+    ) -> Optional[CachedResponse]:
+        """Find the variant stored for a request, marking it recently used"""
+        slot = self._slots.get(key)
+        if slot is None:
+            return None
+        self._slots.move_to_end(key)
+        return slot.variants.get(slot.variant_key(request_headers))
+
+    def store(
+        self,
+        key: str,
+        request_headers: Dict[str, str],
+        vary: Tuple[str, ...],
+        entry: CachedResponse,
+    ) -> None:
+        """Store a response variant and evict least recently used keys"""
+        slot = self._slots.get(key)
+        if slot is not None and slot.vary != vary:
+            # The upstream changed what it varies on; older variants are unusable
+            self._drop(key)
+            slot = None
+        if slot is None:
+            slot = self._slots[key] = _CacheSlot(vary)
+
+        variant = slot.variant_key(request_headers)
+        previous = slot.variants.get(variant)
+        if previous is not None:
+            self.current_bytes -= previous.size
+        slot.variants[variant] = entry
+        entry.shared = True
+        self.current_bytes += entry.size
+        self._slots.move_to_end(key)
+
+        while self.current_bytes > self.config["max_bytes"] and self._slots:
+            _, evicted = self._slots.popitem(last=False)
+            self.current_bytes -= evicted.size
+            self.counters["evictions"] += 1
+            CACHE_EVICTIONS.labels(service=self.service_name).inc()
+
+    def _drop(self, key: str) -> None:
+        slot = self._slots.pop(key, None)
+        if slot is not None:
+            self.current_bytes -= slot.size
+
+    def purge(self, path_prefix: Optional[str] = None) -> int:
+        """Remove every key, or only those under a path prefix"""
+        keys = [
+            k for k in self._slots if path_prefix is None or k.startswith(path_prefix)
+        ]
+        for key in keys:
+            self._drop(key)
+        return len(keys)
+
+    def record(self, result: str) -> None:
+        """Count a cache outcome"""
+        counter = {
+            HIT: "hits",
+            MISS: "misses",
+            STALE: "stale_hits",
+            REVALIDATED: "revalidations",
+            BYPASS: "bypasses",
+        }[result]
+        self.counters[counter] += 1
+        CACHE_REQUESTS.labels(service=self.service_name, result=result.lower()).inc()
+
+    def start_revalidation(self, key: str, coroutine: Any) -> None:
+        """Run a background revalidation unless one is already running for key"""
+        if key in self._revalidating:
+            coroutine.close()
+            return
+        self._revalidating.add(key)
+
+        async def run() -> None:
+            try:
+                await coroutine
+            except Exception as e:
+                logger.warning(
+                    "Background revalidation failed",
+                    service_name=self.service_name,
+                    key=key,
+                    error=str(e),
+                )
+            finally:
+                self._revalidating.discard(key)
+
+        task = asyncio.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "keys": len(self._slots),
+            "bytes": self.current_bytes,
+            "max_bytes": self.config["max_bytes"],
+        }
+
+
+class ResponseCacheManager:
+    """Response caches of every service that enables caching"""
+
+    def __init__(self) -> None:
+        self.caches: Dict[str, ResponseCache] = {}
+
+    def build(self, name: str, config: Dict[str, Any]) -> Optional[ResponseCache]:
+        """Create the cache of a service without registering it"""
+        cache_config = cache_settings(config.get("cache"))
+        if cache_config is None:
+            # A route may cache part of a service that is not cached as a whole
+            routes = [cache_settings(r.get("cache")) for r in config.get("routes", [])]
+            cache_config = next((c for c in routes if c is not None), None)
+        if cache_config is None:
+            return None
+        return ResponseCache(name, cache_config)
+
+    def configure(self, name: str, config: Dict[str, Any]) -> None:
+        """Create, replace or drop the cache of a service from its config"""
+        self.caches.pop(name, None)
+        cache = self.build(name, config)
+        if cache is not None:
+            self.caches[name] = cache
+
+    def remove(self, name: str) -> None:
+        self.caches.pop(name, None)
+
+    def get(self, name: str) -> Optional[ResponseCache]:
+        return self.caches.get(name)
+
+    def purge(
+        self, name: Optional[str] = None, path_prefix: Optional[str] = None
+    ) -> int:
+        """Purge one service's cache, or all of them"""
+        caches = [self.caches[name]] if name is not None else list(self.caches.values())
+        return sum(cache.purge(path_prefix) for cache in caches)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: cache.stats() for name, cache in self.caches.items()}
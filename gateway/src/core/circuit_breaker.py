@@ -0,0 +1,228 @@
+# --------------------------------------------------------------------------
+# Circuit breakers and passive outlier ejection for upstream endpoints
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set
+
+import structlog
+
+from .balancer import NoEndpointAvailable
+from .metrics import CIRCUIT_TRANSITIONS
+
+logger = structlog.get_logger()
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Defaults applied to a service's "circuit_breaker" section
+DEFAULT_BREAKER_CONFIG: Dict[str, Any] = {
+    "enabled": True,
+    # Trip after this many failures in a row
+    "consecutive_failures": 5,
+    # ...or when the failure (or slow call) rate over the window is too high
+    "window": 30.0,
+    "min_requests": 20,
+    "error_rate_threshold": 0.5,
+    "slow_call_threshold": None,
+    "slow_call_rate_threshold": 0.5,
+    # Time an open circuit fails fast before letting probe requests through
+    "open_duration": 30.0,
+    "half_open_max_calls": 1,
+}
+
+
+class CircuitOpenError(NoEndpointAvailable):
+    """Raised when every endpoint of a service has an open circuit"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker guarding one upstream endpoint"""
+
+    def __init__(self, service_name: str, endpoint: str, config: Dict[str, Any]):
+        self.service_name = service_name
+        self.endpoint = endpoint
+        self.config = config
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.consecutive_failures = 0
+        self.half_open_calls = 0
+        # Per-second buckets of [second, total, failures, slow]
+        self._buckets: Deque[List[int]] = deque()
+
+    def available(self, now: float) -> bool:
+        """Whether a request may be sent now (without reserving it)"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return now - self.opened_at >= self.config["open_duration"]
+        return self.half_open_calls < self.config["half_open_max_calls"]
+
+    def acquire(self, now: float) -> None:
+        """Reserve a request slot, moving an expired open circuit to half-open"""
+        if self.state == OPEN and self.available(now):
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            self.half_open_calls += 1
+
+    def retry_after(self, now: float) -> int:
+        """Seconds until an open circuit lets a probe through"""
+        if self.state != OPEN:
+            return 0
+        remaining = self.opened_at + self.config["open_duration"] - now
+        return max(math.ceil(remaining), 1)
+
+    def record(self, latency: float, success: Optional[bool]) -> None:
+        """Feed back the outcome of a request; None releases it without verdict"""
+        if self.state == HALF_OPEN:
+            self.half_open_calls = max(self.half_open_calls - 1, 0)
+        if success is None:
+            return
+
+        slow_threshold = self.config["slow_call_threshold"]
+        slow = slow_threshold is not None and latency >= slow_threshold
+
+        if self.state == HALF_OPEN:
+            if success and not slow:
+                self._transition(CLOSED)
+            else:
+                self._trip("probe request failed")
+            return
+
+        now = time.monotonic()
+        self._count(now, success, slow)
+        self.consecutive_failures = 0 if success else self.consecutive_failures + 1
+        if self.consecutive_failures >= self.config["consecutive_failures"]:
+            self._trip("consecutive failures")
+            return
+
+        total, failures, slow_calls = self._window_totals(now)
+        if total >= self.config["min_requests"]:
+            if failures / total >= self.config["error_rate_threshold"]:
+                self._trip("error rate")
+            elif slow_threshold is not None and (
+                slow_calls / total >= self.config["slow_call_rate_threshold"]
+            ):
+                self._trip("slow call rate")
+
+    def _count(self, now: float, success: bool, slow: bool) -> None:
+        second = int(now)
+        if not self._buckets or self._buckets[-1][0] != second:
+            self._buckets.append([second, 0, 0, 0])
+        bucket = self._buckets[-1]
+        bucket[1] += 1
+        bucket[2] += 0 if success else 1
+        bucket[3] += 1 if slow else 0
+
+    def _window_totals(self, now: float) -> List[int]:
+        horizon = now - self.config["window"]
+        while self._buckets and self._buckets[0][0] < horizon:
+            self._buckets.popleft()
+        return [sum(bucket[i] for bucket in self._buckets) for i in (1, 2, 3)]
+
+    def _trip(self, reason: str) -> None:
+        self.opened_at = time.monotonic()
+        logger.warning(
+            "Circuit opened",
+            service_name=self.service_name,
+            endpoint=self.endpoint,
+            reason=reason,
+        )
+        self._transition(OPEN)
+
+    def _transition(self, state: str) -> None:
+        self.state = state
+        self.half_open_calls = 0
+        if state == CLOSED:
+            self.consecutive_failures = 0
+            self._buckets.clear()
+        CIRCUIT_TRANSITIONS.labels(service=self.service_name, state=state).inc()
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        total, failures, slow_calls = self._window_totals(now)
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "window_requests": total,
+            "window_failures": failures,
+            "window_slow_calls": slow_calls,
+            "retry_after": self.retry_after(now),
+        }
+
+
+class ServiceBreakers:
+    """Circuit breakers of every endpoint of one service"""
+
+    def __init__(
+        self, service_name: str, endpoints: Iterable[str], config: Dict[str, Any]
+    ):
+        self.service_name = service_name
+        self.breakers = {
+            url: CircuitBreaker(service_name, url, config) for url in endpoints
+        }
+
+    def unavailable(self, now: float) -> Set[str]:
+        """Endpoints the balancer must skip right now"""
+        return {url for url, b in self.breakers.items() if not b.available(now)}
+
+    def open_error(self, now: float) -> CircuitOpenError:
+        retry_after = min(b.retry_after(now) for b in self.breakers.values()) or 1
+        return CircuitOpenError(
+            f"Circuit open for every endpoint of '{self.service_name}'", retry_after
+        )
+
+    @property
+    def state(self) -> str:
+        """Service-level state: open only when no endpoint is closed"""
+        states = {breaker.state for breaker in self.breakers.values()}
+        if CLOSED in states:
+            return CLOSED
+        return HALF_OPEN if HALF_OPEN in states else OPEN
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "endpoints": {url: b.stats(now) for url, b in self.breakers.items()},
+        }
+
+
+class CircuitBreakerManager:
+    """Circuit breakers of every service that enables them"""
+
+    def __init__(self) -> None:
+        self.services: Dict[str, ServiceBreakers] = {}
+
+    def build(
+        self, name: str, config: Dict[str, Any], endpoints: Iterable[str]
+    ) -> Optional[ServiceBreakers]:
+        """Create the breakers of a service without registering them"""
+        breaker_config = {**DEFAULT_BREAKER_CONFIG, **config.get("circuit_breaker", {})}
+        if not breaker_config["enabled"]:
+            return None
+        return ServiceBreakers(name, endpoints, breaker_config)
+
+    def configure(
+        self, name: str, config: Dict[str, Any], endpoints: Iterable[str]
+    ) -> None:
+        self.services.pop(name, None)
+        breakers = self.build(name, config, endpoints)
+        if breakers is not None:
+            self.services[name] = breakers
+
+    def remove(self, name: str) -> None:
+        self.services.pop(name, None)
+
+    def get(self, name: str) -> Optional[ServiceBreakers]:
+        return self.services.get(name)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        return {name: breakers.stats(now) for name, breakers in self.services.items()}
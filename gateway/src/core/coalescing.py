@@ -0,0 +1,102 @@
+# --------------------------------------------------------------------------
+# Request coalescing (single-flight) for identical upstream GETs
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import structlog
+
+from .metrics import COALESCED_REQUESTS
+
+logger = structlog.get_logger()
+
+T = TypeVar("T")
+
+# Request headers that can change an upstream response and therefore
+# always take part in the coalescing key
+DEFAULT_KEY_HEADERS: Tuple[str, ...] = (
+    "accept",
+    "accept-language",
+    "authorization",
+    "cookie",
+)
+
+# Request headers asking for a response of their own (304, 206, 412);
+# requests carrying them are never coalesced
+UNSHAREABLE_HEADERS = frozenset(
+    [
+        "if-match",
+        "if-none-match",
+        "if-modified-since",
+        "if-unmodified-since",
+        "if-range",
+        "range",
+    ]
+)
+
+CoalescingKey = Tuple[Any, ...]
+
+
+def is_shareable(headers: Dict[str, str]) -> bool:
+    """Whether a GET may share its response with other requests"""
+    return not any(name.lower() in UNSHAREABLE_HEADERS for name in headers)
+
+
+def coalescing_key(
+    service_name: str,
+    method: str,
+    path: str,
+    headers: Dict[str, str],
+    params: Optional[Dict[str, str]] = None,
+    key_headers: Tuple[str, ...] = DEFAULT_KEY_HEADERS,
+) -> CoalescingKey:
+    """Build the key under which identical requests share one upstream call"""
+    query = tuple(sorted((params or {}).items()))
+    header_values = tuple(headers.get(name, "") for name in key_headers)
+    return (service_name, method.upper(), path, query, header_values)
+
+
+class RequestCoalescer:
+    """Shares one in-flight upstream call among concurrent identical requests"""
+
+    def __init__(self) -> None:
+        self._in_flight: Dict[CoalescingKey, "asyncio.Future[Any]"] = {}
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    async def run(
+        self, key: CoalescingKey, fetch: Callable[[], Awaitable[T]]
+    ) -> Tuple[T, bool]:
+        """Await the shared call for key, starting it if none is running
+
+        Returns the result and whether this caller joined an existing call.
+        The call runs in its own task, so a leader whose client goes away
+        does not cancel the followers.
+        """
+        service_name = key[0]
+        future = self._in_flight.get(key)
+        collapsed = future is not None
+        if future is None:
+            future = asyncio.ensure_future(fetch())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        self._count(service_name, "collapsed" if collapsed else "leaders")
+        return await asyncio.shield(future), collapsed
+
+    def _count(self, service_name: str, role: str) -> None:
+        counters = self.counters.setdefault(
+            service_name, {"leaders": 0, "collapsed": 0}
+        )
+        counters[role] += 1
+        COALESCED_REQUESTS.labels(service=service_name, role=role).inc()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {**counters, "in_flight": self._in_flight_for(name)}
+            for name, counters in self.counters.items()
+        }
+
+    def _in_flight_for(self, service_name: str) -> int:
+        return sum(1 for key in self._in_flight if key[0] == service_name)
@@ -0,0 +1,391 @@
+# --------------------------------------------------------------------------
+# Negotiated response compression for the API Gateway service
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from .metrics import COMPRESSION_BYTES, COMPRESSION_CPU_SECONDS
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+GZIP = "gzip"
+BROTLI = "br"
+ZSTD = "zstd"
+
+# Defaults applied to a service's "compression" section
+DEFAULT_COMPRESSION_CONFIG: Dict[str, Any] = {
+    "enabled": True,
+    "min_size": 1024,
+    # Prefixes of compressible media types; "+json" and "+xml" always are
+    "content_types": [
+        "text/",
+        "application/json",
+        "application/javascript",
+        "application/xml",
+        "image/svg+xml",
+    ],
+    # Server preference among encodings the client accepts equally
+    "encodings": [BROTLI, ZSTD, GZIP],
+    "levels": {GZIP: 6, BROTLI: 4, ZSTD: 3},
+    # Byte budget of already-compressed bodies of cacheable responses
+    "cache_bytes": 4 * 1024 * 1024,
+}
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+def available_encodings() -> List[str]:
+    """Encodings the installed libraries can produce"""
+    encodings = [GZIP]
+    if brotli is not None:
+        encodings.append(BROTLI)
+    if zstandard is not None:
+        encodings.append(ZSTD)
+    return encodings
+
+
+def negotiate(
+    accept_encoding: Optional[str], preference: Sequence[str]
+) -> Optional[str]:
+    """Pick the content-coding for a response from Accept-Encoding (RFC 9110)"""
+    if not accept_encoding:
+        return None
+
+    qualities: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+
+    wildcard = qualities.get("*", 0.0)
+    best: Optional[str] = None
+    best_quality = 0.0
+    for encoding in preference:
+        quality = qualities.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def header(headers: Headers, name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key == name:
+            return value
+    return None
+
+
+def vary_accept_encoding(headers: Headers) -> Headers:
+    """Add Accept-Encoding to the Vary header of a response"""
+    vary = header(headers, b"vary")
+    if vary is None:
+        return headers + [(b"vary", b"Accept-Encoding")]
+    names = {name.strip().lower() for name in vary.split(b",")}
+    if b"accept-encoding" in names or b"*" in names:
+        return headers
+    return [(k, v + b", Accept-Encoding" if k == b"vary" else v) for k, v in headers]
+
+
+def _encoded_headers(headers: Headers, encoding: str) -> Headers:
+    """Headers of a response once the gateway has compressed its body"""
+    encoded = []
+    for key, value in headers:
+        if key == b"content-length":
+            continue
+        if key == b"etag" and not value.startswith(b"W/"):
+            # The representation changed, so only a weak validator still holds
+            value = b"W/" + value
+        encoded.append((key, value))
+    encoded.append((b"content-encoding", encoding.encode("latin-1")))
+    return encoded
+
+
+class Compressor:
+    """Incremental compressor that flushes after every chunk"""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == GZIP:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif encoding == BROTLI:
+            self._compressor = brotli.Compressor(quality=level)
+        elif encoding == ZSTD:
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            raise ValueError(f"Unsupported content-coding '{encoding}'")
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress a chunk, flushing so it can be sent right away"""
+        if self.encoding == GZIP:
+            return self._compressor.compress(data) + self._compressor.flush(
+                zlib.Z_SYNC_FLUSH
+            )
+        if self.encoding == BROTLI:
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self) -> bytes:
+        if self.encoding == BROTLI:
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress(body: bytes, encoding: str, level: int) -> bytes:
+    """Compress a whole body in one go"""
+    if encoding == GZIP:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress(body) + compressor.flush()
+    if encoding == BROTLI:
+        return brotli.compress(body, quality=level)
+    if encoding == ZSTD:
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    raise ValueError(f"Unsupported content-coding '{encoding}'")
+
+
+class EncodedBodyCache:
+    """LRU of compressed bodies, keyed by the identity of the original body
+
+    Response cache entries (and their copies and revalidated successors)
+    share one immutable body object, so its identity names the payload.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[bytes, bytes]]" = (
+            OrderedDict()
+        )
+
+    def get(self, body: bytes, encoding: str) -> Optional[bytes]:
+        key = (id(body), encoding)
+        entry = self._entries.get(key)
+        # The original body is held, so its id cannot have been reused
+        if entry is None or entry[0] is not body:
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, body: bytes, encoding: str, encoded: bytes) -> None:
+        size = len(body) + len(encoded)
+        if size > self.max_bytes:
+            return
+        key = (id(body), encoding)
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.current_bytes -= len(previous[0]) + len(previous[1])
+        self._entries[key] = (body, encoded)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            _, (old_body, old_encoded) = self._entries.popitem(last=False)
+            self.current_bytes -= len(old_body) + len(old_encoded)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ServiceCompression:
+    """Compression settings, encoded-body cache and counters of one service"""
+
+    def __init__(self, service_name: str, config: Dict[str, Any]):
+        self.service_name = service_name
+        self.config = {**DEFAULT_COMPRESSION_CONFIG, **config}
+        self.levels = {
+            **DEFAULT_COMPRESSION_CONFIG["levels"],
+            **config.get("levels", {}),
+        }
+        available = available_encodings()
+        self.encodings = [e for e in self.config["encodings"] if e in available]
+        self.content_types = tuple(t.lower() for t in self.config["content_types"])
+        self.cache = EncodedBodyCache(self.config["cache_bytes"])
+        self.counters: Dict[str, Dict[str, float]] = {}
+        self.cache_hits = 0
+
+    def compressible(self, headers: Headers) -> bool:
+        """Whether the media type of a response is worth compressing"""
+        content_type = header(headers, b"content-type")
+        if content_type is None:
+            return False
+        media_type = content_type.decode("latin-1").split(";")[0].strip().lower()
+        return media_type.startswith(self.content_types) or media_type.endswith(
+            ("+json", "+xml")
+        )
+
+    def choose(
+        self,
+        accept_encoding: Optional[str],
+        status_code: int,
+        headers: Headers,
+        size: Optional[int],
+    ) -> Optional[str]:
+        """Encoding to apply to a response, or None to send it as it is
+
+        ``size`` is None when the length of a streamed body is unknown.
+        """
+        if status_code < 200 or status_code in (204, 206, 304):
+            return None
+        if header(headers, b"content-encoding") is not None:
+            return None
+        if size is not None and size < self.config["min_size"]:
+            return None
+        cache_control = header(headers, b"cache-control") or b""
+        if b"no-transform" in cache_control.lower():
+            return None
+        if not self.compressible(headers):
+            return None
+        return negotiate(accept_encoding, self.encodings)
+
+    def encode_response(
+        self,
+        status_code: int,
+        headers: Headers,
+        body: bytes,
+        accept_encoding: Optional[str],
+        cacheable: bool = False,
+    ) -> Tuple[bytes, Headers]:
+        """Compress a buffered response body when the client accepts it"""
+        if self.compressible(headers):
+            headers = vary_accept_encoding(headers)
+        encoding = self.choose(accept_encoding, status_code, headers, len(body))
+        if encoding is None:
+            return body, headers
+        return self.encode(body, encoding, cacheable), _encoded_headers(
+            headers, encoding
+        )
+
+    def stream_response(
+        self,
+        status_code: int,
+        headers: Headers,
+        chunks: AsyncIterator[bytes],
+        accept_encoding: Optional[str],
+    ) -> Tuple[AsyncIterator[bytes], Headers]:
+        """Compress a streamed response body when the client accepts it"""
+        if self.compressible(headers):
+            headers = vary_accept_encoding(headers)
+        content_length = header(headers, b"content-length")
+        size = int(content_length) if content_length is not None else None
+        encoding = self.choose(accept_encoding, status_code, headers, size)
+        if encoding is None:
+            return chunks, headers
+        return self.encode_stream(chunks, encoding), _encoded_headers(headers, encoding)
+
+    def encode(self, body: bytes, encoding: str, cacheable: bool) -> bytes:
+        """Compress a buffered body, reusing earlier work for cacheable ones"""
+        if cacheable:
+            encoded = self.cache.get(body, encoding)
+            if encoded is not None:
+                self.cache_hits += 1
+                return encoded
+
+        started = time.thread_time()
+        encoded = compress(body, encoding, self.levels[encoding])
+        self.record(encoding, len(body), len(encoded), time.thread_time() - started)
+        if cacheable:
+            self.cache.put(body, encoding, encoded)
+        return encoded
+
+    async def encode_stream(
+        self, chunks: AsyncIterator[bytes], encoding: str
+    ) -> AsyncIterator[bytes]:
+        """Compress a streamed body chunk by chunk"""
+        compressor = Compressor(encoding, self.levels[encoding])
+        size = encoded_size = 0
+        cpu = 0.0
+        try:
+            async for chunk in chunks:
+                started = time.thread_time()
+                encoded = compressor.compress(chunk)
+                cpu += time.thread_time() - started
+                size += len(chunk)
+                encoded_size += len(encoded)
+                if encoded:
+                    yield encoded
+            started = time.thread_time()
+            tail = compressor.finish()
+            cpu += time.thread_time() - started
+            encoded_size += len(tail)
+            yield tail
+        finally:
+            self.record(encoding, size, encoded_size, cpu)
+
+    def record(self, encoding: str, size: int, encoded_size: int, cpu: float) -> None:
+        counters = self.counters.setdefault(
+            encoding,
+            {"responses": 0, "bytes_in": 0, "bytes_out": 0, "cpu_seconds": 0.0},
+        )
+        counters["responses"] += 1
+        counters["bytes_in"] += size
+        counters["bytes_out"] += encoded_size
+        counters["cpu_seconds"] += cpu
+        COMPRESSION_BYTES.labels(self.service_name, encoding, "in").inc(size)
+        COMPRESSION_BYTES.labels(self.service_name, encoding, "out").inc(encoded_size)
+        COMPRESSION_CPU_SECONDS.labels(self.service_name, encoding).inc(cpu)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "encodings": self.encodings,
+            "cache_entries": len(self.cache),
+            "cache_bytes": self.cache.current_bytes,
+            "cache_hits": self.cache_hits,
+            "by_encoding": {
+                encoding: {
+                    **counters,
+                    "ratio": (
+                        round(counters["bytes_out"] / counters["bytes_in"], 4)
+                        if counters["bytes_in"]
+                        else None
+                    ),
+                }
+                for encoding, counters in self.counters.items()
+            },
+        }
+
+
+class CompressionManager:
+    """Response compression of every service that has not disabled it"""
+
+    def __init__(self) -> None:
+        self.services: Dict[str, ServiceCompression] = {}
+
+    def build(self, name: str, config: Dict[str, Any]) -> Optional[ServiceCompression]:
+        """Create the compression state of a service without registering it"""
+        compression = config.get("compression", True)
+        if compression is True:
+            compression = {}
+        if isinstance(compression, dict) and compression.get("enabled", True):
+            return ServiceCompression(name, compression)
+        return None
+
+    def configure(self, name: str, config: Dict[str, Any]) -> None:
+        self.services.pop(name, None)
+        service = self.build(name, config)
+        if service is not None:
+            self.services[name] = service
+
+    def remove(self, name: str) -> None:
+        self.services.pop(name, None)
+
+    def get(self, name: str) -> Optional[ServiceCompression]:
+        return self.services.get(name)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: service.stats() for name, service in self.services.items()}
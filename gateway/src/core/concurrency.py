@@ -0,0 +1,278 @@
+# --------------------------------------------------------------------------
+# Adaptive per-service concurrency limits and load shedding
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+import math
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+import structlog
+
+from .metrics import CONCURRENCY_LIMIT, CONCURRENCY_QUEUED, REQUESTS_SHED
+
+logger = structlog.get_logger()
+
+# Defaults applied to a service's "concurrency" section
+DEFAULT_CONCURRENCY_CONFIG: Dict[str, Any] = {
+    # "gradient" follows latency against its long-term average, "aimd" backs
+    # off on errors and slow responses and grows by one otherwise
+    "algorithm": "gradient",
+    "initial_limit": 20,
+    "min_limit": 1,
+    "max_limit": 200,
+    # Requests waiting for a slot; more are shed at once
+    "queue_size": 50,
+    # Seconds a request may wait for a slot before it is shed
+    "queue_timeout": 1.0,
+    # gradient: weight of each new limit, and latency increase tolerated
+    "smoothing": 0.2,
+    "tolerance": 1.5,
+    # aimd: multiplier on a drop, and latency (seconds) counted as a drop
+    "backoff": 0.9,
+    "latency_threshold": None,
+}
+
+
+class ConcurrencyLimitExceeded(Exception):
+    """Raised when a request is shed instead of being sent upstream"""
+
+    def __init__(self, service: str, reason: str):
+        super().__init__(f"Service '{service}' is overloaded ({reason})")
+        self.service = service
+        self.reason = reason
+
+
+class GradientLimit:
+    """Limit scaled by the ratio of long-term to current latency
+
+    While latency stays near its long-term average the limit grows by
+    about its square root (the queue it allows at the upstream); when
+    latency rises beyond ``tolerance`` times the average it shrinks, by at
+    most half per update.
+    """
+
+    def __init__(
+        self,
+        initial_limit: float,
+        min_limit: float,
+        max_limit: float,
+        smoothing: float = 0.2,
+        tolerance: float = 1.5,
+        long_window: int = 600,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.smoothing = smoothing
+        self.tolerance = tolerance
+        self.long_window = long_window
+        self.long_rtt: Optional[float] = None
+
+    def update(self, rtt: float, in_flight: int, dropped: bool) -> float:
+        rtt = max(rtt, 1e-6)
+        if self.long_rtt is None:
+            self.long_rtt = rtt
+        else:
+            self.long_rtt += (rtt - self.long_rtt) / self.long_window
+            # Follow a latency drop quickly so the limit can grow again
+            if self.long_rtt / rtt > 2:
+                self.long_rtt *= 0.95
+
+        # Requests well under the limit say nothing about where it should be
+        if in_flight < self.limit / 2:
+            return self.limit
+
+        gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / rtt))
+        target = self.limit * gradient + math.sqrt(self.limit)
+        limit = self.limit * (1 - self.smoothing) + target * self.smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, limit))
+        return self.limit
+
+
+class AIMDLimit:
+    """Additive increase, multiplicative decrease on drops"""
+
+    def __init__(
+        self,
+        initial_limit: float,
+        min_limit: float,
+        max_limit: float,
+        backoff: float = 0.9,
+        latency_threshold: Optional[float] = None,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_threshold = latency_threshold
+
+    def update(self, rtt: float, in_flight: int, dropped: bool) -> float:
+        if dropped or (
+            self.latency_threshold is not None and rtt > self.latency_threshold
+        ):
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif in_flight * 2 >= self.limit:
+            self.limit = min(self.max_limit, self.limit + 1)
+        return self.limit
+
+
+class ConcurrencyPermit:
+    """A request slot of a limiter; released once"""
+
+    __slots__ = ("limiter", "_released")
+
+    def __init__(self, limiter: "ConcurrencyLimiter"):
+        self.limiter = limiter
+        self._released = False
+
+    def observe(self, latency: float, dropped: bool) -> None:
+        self.limiter.sample(latency, dropped)
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.limiter.release()
+
+
+class ConcurrencyLimiter:
+    """Upstream requests of one service, bounded by an adaptive limit
+
+    Requests over the limit wait in a FIFO queue of ``queue_size`` for at
+    most ``queue_timeout`` seconds. A request that finds the queue full,
+    or is still waiting at the deadline, is shed so that the service's
+    backlog cannot take over the gateway.
+    """
+
+    def __init__(self, name: str, config: Dict[str, Any]):
+        self.name = name
+        self.queue_size = config["queue_size"]
+        self.queue_timeout = config["queue_timeout"]
+        self.algorithm_name = config["algorithm"]
+        if self.algorithm_name == "aimd":
+            self.algorithm: Any = AIMDLimit(
+                config["initial_limit"],
+                config["min_limit"],
+                config["max_limit"],
+                backoff=config["backoff"],
+                latency_threshold=config["latency_threshold"],
+            )
+        else:
+            self.algorithm = GradientLimit(
+                config["initial_limit"],
+                config["min_limit"],
+                config["max_limit"],
+                smoothing=config["smoothing"],
+                tolerance=config["tolerance"],
+            )
+        self.in_flight = 0
+        self.waiters: Deque["asyncio.Future[None]"] = deque()
+        self.shed: Dict[str, int] = {"queue_full": 0, "timeout": 0}
+
+    @property
+    def limit(self) -> int:
+        return max(1, int(self.algorithm.limit))
+
+    async def acquire(self, timeout: Optional[float] = None) -> ConcurrencyPermit:
+        """Take a slot, waiting in the queue if needed; raises when shed
+
+        A ``timeout`` shorter than the queue timeout (what is left of the
+        request's deadline) raises ``asyncio.TimeoutError`` when it runs
+        out, without counting the request as shed.
+        """
+        if self.in_flight < self.limit and not self.waiters:
+            self.in_flight += 1
+            return ConcurrencyPermit(self)
+        if len(self.waiters) >= self.queue_size:
+            self._shed("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        CONCURRENCY_QUEUED.labels(service=self.name).inc()
+        wait = self.queue_timeout
+        if timeout is not None and timeout < wait:
+            wait = timeout
+        try:
+            await asyncio.wait_for(waiter, wait)
+        except asyncio.TimeoutError:
+            if wait < self.queue_timeout:
+                raise
+            self._shed("timeout")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over as the request went away
+                self.release()
+            raise
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            CONCURRENCY_QUEUED.labels(service=self.name).dec()
+        return ConcurrencyPermit(self)
+
+    def _shed(self, reason: str) -> None:
+        self.shed[reason] += 1
+        REQUESTS_SHED.labels(service=self.name, reason=reason).inc()
+        logger.warning("Request shed", service_name=self.name, reason=reason)
+        raise ConcurrencyLimitExceeded(self.name, reason)
+
+    def sample(self, latency: float, dropped: bool) -> None:
+        """Adjust the limit from the latency of a finished upstream call"""
+        self.algorithm.update(latency, self.in_flight, dropped)
+        CONCURRENCY_LIMIT.labels(service=self.name).set(self.limit)
+        self._wake()
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        # Slots are handed to waiters directly, so newcomers cannot overtake them
+        while self.waiters and self.in_flight < self.limit:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "algorithm": self.algorithm_name,
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queued": len(self.waiters),
+            "shed": dict(self.shed),
+        }
+
+
+class ConcurrencyManager:
+    """Concurrency limiter of every service that has not disabled it"""
+
+    def __init__(self) -> None:
+        self.limiters: Dict[str, ConcurrencyLimiter] = {}
+
+    def build(self, name: str, config: Dict[str, Any]) -> Optional[ConcurrencyLimiter]:
+        """Create the limiter of a service without registering it"""
+        concurrency = config.get("concurrency", True)
+        if concurrency is True:
+            concurrency = {}
+        if isinstance(concurrency, dict) and concurrency.get("enabled", True):
+            return ConcurrencyLimiter(
+                name, {**DEFAULT_CONCURRENCY_CONFIG, **concurrency}
+            )
+        return None
+
+    def configure(self, name: str, config: Dict[str, Any]) -> None:
+        self.limiters.pop(name, None)
+        limiter = self.build(name, config)
+        if limiter is not None:
+            self.limiters[name] = limiter
+            CONCURRENCY_LIMIT.labels(service=name).set(limiter.limit)
+
+    def remove(self, name: str) -> None:
+        self.limiters.pop(name, None)
+
+    def get(self, name: str) -> Optional[ConcurrencyLimiter]:
+        return self.limiters.get(name)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
@@ -0,0 +1,344 @@
+# --------------------------------------------------------------------------
+# WebSocket and server-sent event proxying for the API Gateway service
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import structlog
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from .metrics import CONNECTIONS_REJECTED, OPEN_CONNECTIONS, STREAM_MESSAGES
+
+try:
+    import websockets
+    from websockets.exceptions import ConnectionClosed, InvalidHandshake
+except ImportError:  # pragma: no cover - installed with uvicorn[standard]
+    websockets = None
+
+logger = structlog.get_logger()
+
+WEBSOCKET = "websocket"
+EVENT_STREAM = "sse"
+
+# Defaults applied when a service entry has no "connections" section
+DEFAULT_CONNECTION_CONFIG: Dict[str, Any] = {
+    # Open WebSocket and event-stream connections per worker
+    "max_connections": 1000,
+    # Seconds without a message in either direction before closing
+    "idle_timeout": 300.0,
+    # Largest WebSocket message relayed, in bytes
+    "max_message_size": 1024 * 1024,
+    # Upstream messages read ahead of a slow client
+    "max_queue": 16,
+}
+
+# Handshake headers generated again for the upstream connection
+WEBSOCKET_HANDSHAKE_HEADERS = frozenset(
+    {
+        "connection",
+        "upgrade",
+        "host",
+        "sec-websocket-key",
+        "sec-websocket-version",
+        "sec-websocket-extensions",
+        "sec-websocket-protocol",
+    }
+)
+
+# Close codes (RFC 6455)
+CLOSE_GOING_AWAY = 1001
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_MESSAGE_TOO_BIG = 1009
+CLOSE_INTERNAL_ERROR = 1011
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class ConnectionLimitExceeded(Exception):
+    """Raised when a service already has its maximum of open connections"""
+
+
+def connection_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    return {**DEFAULT_CONNECTION_CONFIG, **config.get("connections", {})}
+
+
+def accepts_event_stream(headers: Dict[str, str]) -> bool:
+    """Whether a request asks for server-sent events"""
+    return "text/event-stream" in headers.get("accept", "")
+
+
+def websocket_url(url: str) -> str:
+    """Upstream WebSocket URL of an http(s) endpoint"""
+    if url.startswith("https://"):
+        return "wss://" + url[len("https://") :]
+    if url.startswith("http://"):
+        return "ws://" + url[len("http://") :]
+    return url
+
+
+def upstream_handshake_headers(headers: Dict[str, str]) -> List[Tuple[str, str]]:
+    return [
+        (name, value)
+        for name, value in headers.items()
+        if name.lower() not in WEBSOCKET_HANDSHAKE_HEADERS
+    ]
+
+
+class ConnectionSlot:
+    """One open connection counted against its service; released once"""
+
+    __slots__ = ("manager", "service", "protocol", "_released")
+
+    def __init__(self, manager: "ConnectionManager", service: str, protocol: str):
+        self.manager = manager
+        self.service = service
+        self.protocol = protocol
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.manager._release(self)
+
+
+class ConnectionManager:
+    """Long-lived connection settings and open counts of every service
+
+    Counts are per worker and survive a service being reconfigured, so
+    connections opened under the old settings are still accounted for.
+    """
+
+    def __init__(self) -> None:
+        self.settings: Dict[str, Dict[str, Any]] = {}
+        self.open: Dict[Tuple[str, str], int] = {}
+        self.rejected: Dict[str, int] = {}
+
+    def configure(self, name: str, config: Dict[str, Any]) -> None:
+        self.settings[name] = connection_settings(config)
+
+    def remove(self, name: str) -> None:
+        self.settings.pop(name, None)
+
+    def get(self, name: str) -> Dict[str, Any]:
+        return self.settings.get(name, DEFAULT_CONNECTION_CONFIG)
+
+    def count(self, name: str) -> int:
+        return sum(
+            open_count
+            for (service, _), open_count in self.open.items()
+            if service == name
+        )
+
+    def acquire(self, service: str, protocol: str) -> ConnectionSlot:
+        """Count a new connection, or raise if the service is at its cap"""
+        if self.count(service) >= self.get(service)["max_connections"]:
+            self.rejected[service] = self.rejected.get(service, 0) + 1
+            CONNECTIONS_REJECTED.labels(service=service, protocol=protocol).inc()
+            raise ConnectionLimitExceeded(
+                f"Service '{service}' has too many open connections"
+            )
+        key = (service, protocol)
+        self.open[key] = self.open.get(key, 0) + 1
+        OPEN_CONNECTIONS.labels(service=service, protocol=protocol).inc()
+        return ConnectionSlot(self, service, protocol)
+
+    def _release(self, slot: ConnectionSlot) -> None:
+        key = (slot.service, slot.protocol)
+        self.open[key] -= 1
+        if not self.open[key]:
+            del self.open[key]
+        OPEN_CONNECTIONS.labels(service=slot.service, protocol=slot.protocol).dec()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        names = set(self.settings) | {service for service, _ in self.open}
+        return {
+            name: {
+                "open": {
+                    protocol: count
+                    for (service, protocol), count in self.open.items()
+                    if service == name
+                },
+                "rejected": self.rejected.get(name, 0),
+                "max_connections": self.get(name)["max_connections"],
+            }
+            for name in sorted(names)
+        }
+
+
+async def relay_event_stream(
+    chunks: AsyncIterator[bytes],
+    slot: ConnectionSlot,
+    idle_timeout: float,
+) -> AsyncIterator[bytes]:
+    """Forward an event stream chunk by chunk as it arrives
+
+    The next chunk is read from the upstream only after the previous one
+    was handed to the client, so a slow client slows the upstream read
+    instead of growing a buffer. The stream ends after ``idle_timeout``
+    seconds without data, and its connection slot is released at the end.
+    """
+    messages = STREAM_MESSAGES.labels(
+        service=slot.service, protocol=EVENT_STREAM, direction="downstream"
+    )
+    iterator = chunks.__aiter__()
+    previous = b""
+    try:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), idle_timeout)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                logger.info("Idle event stream closed", service=slot.service)
+                return
+            # Events end with a blank line, which may span two chunks
+            events = chunk.count(b"\n\n")
+            if previous.endswith(b"\n") and chunk.startswith(b"\n"):
+                events += 1
+            if events:
+                messages.inc(events)
+            previous = chunk[-1:]
+            yield chunk
+    finally:
+        slot.release()
+
+
+class WebSocketRelay:
+    """Pumps messages between a client WebSocket and its upstream
+
+    Each direction forwards one message at a time and waits for it to be
+    written before reading the next, so at most ``max_queue`` upstream
+    messages are held per connection. The relay ends when either side
+    closes or nothing was sent for ``idle_timeout`` seconds, and closes
+    the other side with the same code.
+    """
+
+    def __init__(
+        self,
+        client: WebSocket,
+        upstream: Any,
+        service: str,
+        idle_timeout: float,
+        max_message_size: int,
+    ):
+        self.client = client
+        self.upstream = upstream
+        self.service = service
+        self.idle_timeout = idle_timeout
+        self.max_message_size = max_message_size
+        self.last_activity = time.monotonic()
+        self.close_code = 1000
+        self.close_reason = ""
+
+    def _count(self, direction: str) -> None:
+        self.last_activity = time.monotonic()
+        STREAM_MESSAGES.labels(
+            service=self.service, protocol=WEBSOCKET, direction=direction
+        ).inc()
+
+    async def _client_to_upstream(self) -> None:
+        while True:
+            message = await self.client.receive()
+            if message["type"] == "websocket.disconnect":
+                self.close_code = message.get("code", 1000)
+                return
+            data = message.get("text")
+            if data is None:
+                data = message.get("bytes") or b""
+            if len(data) > self.max_message_size:
+                self.close_code = CLOSE_MESSAGE_TOO_BIG
+                self.close_reason = "Message too big"
+                return
+            await self.upstream.send(data)
+            self._count("upstream")
+
+    async def _upstream_to_client(self) -> None:
+        try:
+            async for data in self.upstream:
+                if isinstance(data, str):
+                    await self.client.send_text(data)
+                else:
+                    await self.client.send_bytes(data)
+                self._count("downstream")
+        except ConnectionClosed:
+            pass
+        self.close_code = self.upstream.close_code or 1000
+        self.close_reason = self.upstream.close_reason or ""
+
+    async def _idle(self) -> None:
+        while True:
+            remaining = self.last_activity + self.idle_timeout - time.monotonic()
+            if remaining <= 0:
+                self.close_code = CLOSE_GOING_AWAY
+                self.close_reason = "Idle timeout"
+                return
+            await asyncio.sleep(remaining)
+
+    async def run(self) -> None:
+        tasks = [
+            asyncio.ensure_future(self._client_to_upstream()),
+            asyncio.ensure_future(self._upstream_to_client()),
+            asyncio.ensure_future(self._idle()),
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    error = task.exception()
+                    if not isinstance(error, (WebSocketDisconnect, ConnectionClosed)):
+                        logger.error(
+                            "WebSocket relay failed",
+                            service=self.service,
+                            error=str(error),
+                        )
+                        self.close_code = CLOSE_INTERNAL_ERROR
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.close()
+
+    async def close(self) -> None:
+        await self.upstream.close(
+            code=_sendable(self.close_code), reason=self.close_reason
+        )
+        try:
+            await self.client.close(
+                code=_sendable(self.close_code), reason=self.close_reason
+            )
+        except RuntimeError:
+            # The client already went away
+            pass
+
+
+def _sendable(code: int) -> int:
+    """Close codes that are only reported locally cannot be sent (RFC 6455 7.4.1)"""
+    return 1000 if code in (1005, 1006, 1015) else code
+
+
+async def connect_upstream(
+    url: str,
+    headers: Dict[str, str],
+    subprotocols: List[str],
+    settings: Dict[str, Any],
+    timeout: float,
+) -> Any:
+    """Open the upstream WebSocket of a proxied connection"""
+    if websockets is None:
+        raise RuntimeError("WebSocket proxying requires the websockets package")
+    return await websockets.connect(
+        url,
+        extra_headers=upstream_handshake_headers(headers),
+        subprotocols=subprotocols or None,
+        open_timeout=timeout,
+        max_size=settings["max_message_size"],
+        max_queue=settings["max_queue"],
+    )
+
+
+# Errors of an upstream that refused or failed the WebSocket handshake
+UPSTREAM_HANDSHAKE_ERRORS: Tuple[type, ...] = (OSError, asyncio.TimeoutError)
+if websockets is not None:
+    UPSTREAM_HANDSHAKE_ERRORS += (InvalidHandshake,)
@@ -0,0 +1,158 @@
+# --------------------------------------------------------------------------
+# Request deadlines and per-phase timeouts for the API Gateway service
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+import time
+from typing import Any, Dict, Mapping, Optional
+
+import httpx
+import structlog
+
+from .metrics import DEADLINE_EXCEEDED
+
+logger = structlog.get_logger()
+
+# Remaining time budget of a request in milliseconds, read from clients and
+# sent on to upstreams so every hop knows when the caller gives up
+DEADLINE_HEADER = "x-request-timeout-ms"
+
+# Defaults applied to a service's "timeouts" section, in seconds
+DEFAULT_TIMEOUT_CONFIG: Dict[str, Any] = {
+    # Waiting for a free connection of the service's pool
+    "pool": 5.0,
+    # Opening a connection (TCP and TLS handshake)
+    "connect": 5.0,
+    # Sending each chunk of the request
+    "write": 10.0,
+    # Waiting for each chunk of the response; None leaves it to the deadline
+    "read": None,
+}
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's time budget ran out before it was answered"""
+
+    def __init__(self, phase: str):
+        super().__init__(f"Request deadline exceeded ({phase})")
+        self.phase = phase
+
+
+def timeout_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    return {**DEFAULT_TIMEOUT_CONFIG, **config.get("timeouts", {})}
+
+
+def parse_budget(value: Optional[str]) -> Optional[float]:
+    """Seconds of a ``x-request-timeout-ms`` value; None when absent or invalid"""
+    if value is None:
+        return None
+    try:
+        milliseconds = float(value)
+    except ValueError:
+        return None
+    if milliseconds != milliseconds or milliseconds < 0:
+        return None
+    return milliseconds / 1000
+
+
+def phase_timeouts(
+    config: Dict[str, Any], budget: float, long_lived: bool = False
+) -> httpx.Timeout:
+    """httpx timeouts of each phase of a request to a service
+
+    No phase may take longer than the whole ``budget``. A ``long_lived``
+    response has no read timeout, its caller ends it when idle.
+    """
+    phases = timeout_settings(config)
+
+    def bounded(value: Optional[float]) -> float:
+        return budget if value is None else min(value, budget)
+
+    return httpx.Timeout(
+        connect=bounded(phases["connect"]),
+        read=None if long_lived else bounded(phases["read"]),
+        write=bounded(phases["write"]),
+        pool=bounded(phases["pool"]),
+    )
+
+
+def phase_of(error: BaseException) -> str:
+    """Phase that a timeout error ran out of time in"""
+    if isinstance(error, httpx.PoolTimeout):
+        return "pool"
+    if isinstance(error, httpx.ConnectTimeout):
+        return "connect"
+    if isinstance(error, httpx.WriteTimeout):
+        return "write"
+    if isinstance(error, DeadlineExceeded):
+        return error.phase
+    return "read"
+
+
+def count_exceeded(service: str, error: BaseException) -> str:
+    """Count a request that ran out of time and return its phase"""
+    phase = phase_of(error)
+    DEADLINE_EXCEEDED.labels(service=service, phase=phase).inc()
+    logger.warning("Request deadline exceeded", service_name=service, phase=phase)
+    return phase
+
+
+class Deadline:
+    """Point in time by which a request must have been answered
+
+    The budget is the route or service timeout, shortened by the client's
+    ``x-request-timeout-ms`` header when it asks for less. A budget that
+    came from the client is the client's choice, so running out of it says
+    nothing about the upstream.
+    """
+
+    __slots__ = ("budget", "expires_at", "requested")
+
+    def __init__(self, budget: float, requested: bool = False):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+        self.requested = requested
+
+    @classmethod
+    def for_request(cls, headers: Mapping[str, str], budget: float) -> "Deadline":
+        requested = parse_budget(headers.get(DEADLINE_HEADER))
+        if requested is not None and requested < budget:
+            return cls(requested, requested=True)
+        return cls(budget)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self, phase: str) -> None:
+        """Raise if the budget is spent, before starting ``phase``"""
+        if self.expired():
+            raise DeadlineExceeded(phase)
+
+    def clamp(self, timeout: httpx.Timeout) -> httpx.Timeout:
+        """Phase timeouts cut down to the remaining budget"""
+        remaining = self.remaining()
+
+        def bounded(value: Optional[float]) -> Optional[float]:
+            return None if value is None else min(value, remaining)
+
+        return httpx.Timeout(
+            connect=bounded(timeout.connect),
+            read=bounded(timeout.read),
+            write=bounded(timeout.write),
+            pool=bounded(timeout.pool),
+        )
+
+    def header(self) -> str:
+        """Remaining budget for the next hop, in whole milliseconds"""
+        return str(int(self.remaining() * 1000))
+
+    async def run(self, awaitable: Any, phase: str) -> Any:
+        """Await within the remaining budget; raises DeadlineExceeded when it runs out"""
+        try:
+            return await asyncio.wait_for(awaitable, self.remaining())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(phase)
@@ -0,0 +1,213 @@
+# --------------------------------------------------------------------------
+# Background active health checking of upstream endpoints
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+import random
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional, Set
+
+import structlog
+
+from .metrics import UPSTREAM_HEALTHY
+
+if TYPE_CHECKING:
+    from .services import ServiceRegistry
+
+logger = structlog.get_logger()
+
+# Defaults applied when "health_check" is a path or an object without them
+DEFAULT_HEALTH_CONFIG: Dict[str, Any] = {
+    "enabled": True,
+    "path": "/health",
+    "interval": 10.0,
+    "timeout": 2.0,
+    # Fraction of the interval each sleep is randomly shifted by
+    "jitter": 0.1,
+    "healthy_threshold": 1,
+    "unhealthy_threshold": 2,
+}
+
+
+def health_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Resolve the health check settings of a service"""
+    health_check = config.get("health_check", {})
+    if isinstance(health_check, str):
+        health_check = {"path": health_check}
+    return {**DEFAULT_HEALTH_CONFIG, **health_check}
+
+
+class EndpointHealth:
+    """Latest probe results of one upstream endpoint"""
+
+    def __init__(self) -> None:
+        # None until the first probe has completed
+        self.healthy: Optional[bool] = None
+        self.consecutive_successes = 0
+        self.consecutive_failures = 0
+        self.checked_at: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.status_code: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def update(
+        self,
+        success: bool,
+        latency: float,
+        status_code: Optional[int],
+        error: Optional[str],
+        config: Dict[str, Any],
+    ) -> None:
+        self.checked_at = time.time()
+        self.latency = latency
+        self.status_code = status_code
+        self.error = error
+        if success:
+            self.consecutive_successes += 1
+            self.consecutive_failures = 0
+            if self.healthy is None or (
+                self.consecutive_successes >= config["healthy_threshold"]
+            ):
+                self.healthy = True
+        else:
+            self.consecutive_failures += 1
+            self.consecutive_successes = 0
+            if self.healthy is None or (
+                self.consecutive_failures >= config["unhealthy_threshold"]
+            ):
+                self.healthy = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "checked_at": self.checked_at,
+            "latency": self.latency,
+            "status_code": self.status_code,
+            "error": self.error,
+        }
+
+
+class HealthTable:
+    """In-memory health state of every endpoint, read by the proxy path"""
+
+    def __init__(self) -> None:
+        self.services: Dict[str, Dict[str, EndpointHealth]] = {}
+
+    def endpoint(self, service_name: str, url: str) -> EndpointHealth:
+        endpoints = self.services.setdefault(service_name, {})
+        return endpoints.setdefault(url, EndpointHealth())
+
+    def unhealthy(self, service_name: str) -> Set[str]:
+        """Endpoints whose last known state is unhealthy"""
+        endpoints = self.services.get(service_name, {})
+        return {url for url, health in endpoints.items() if health.healthy is False}
+
+    def remove(self, service_name: str) -> None:
+        self.services.pop(service_name, None)
+
+    def service_health(self, service_name: str) -> Optional[Dict[str, Any]]:
+        """Health of a service, or None when it has never been probed"""
+        endpoints = self.services.get(service_name)
+        if not endpoints or all(h.healthy is None for h in endpoints.values()):
+            return None
+        return {
+            "healthy": any(h.healthy for h in endpoints.values()),
+            "endpoints": {url: h.stats() for url, h in endpoints.items()},
+        }
+
+
+class HealthChecker:
+    """Probes every registered service concurrently on its own interval"""
+
+    def __init__(self, registry: "ServiceRegistry"):
+        self.registry = registry
+        self.table = HealthTable()
+        self.running = False
+        self._tasks: Dict[str, "asyncio.Task[None]"] = {}
+
+    async def start(self) -> None:
+        """Start a probe loop for every registered service"""
+        self.running = True
+        for name, config in self.registry.services.items():
+            self.watch(name, config)
+        logger.info("Health checker started", services=len(self._tasks))
+
+    async def stop(self) -> None:
+        """Cancel every probe loop"""
+        self.running = False
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def watch(self, service_name: str, config: Dict[str, Any]) -> None:
+        """(Re)start the probe loop of a service once the checker runs"""
+        self.unwatch(service_name)
+        if self.running and health_config(config)["enabled"]:
+            self._tasks[service_name] = asyncio.create_task(self._loop(service_name))
+
+    def unwatch(self, service_name: str) -> None:
+        task = self._tasks.pop(service_name, None)
+        if task is not None:
+            task.cancel()
+
+    async def _loop(self, service_name: str) -> None:
+        while True:
+            config = health_config(self.registry.get_service(service_name) or {})
+            try:
+                await self.probe_service(service_name)
+            except Exception as e:
+                logger.error(
+                    "Health probe failed", service_name=service_name, error=str(e)
+                )
+            jitter = config["interval"] * config["jitter"]
+            await asyncio.sleep(config["interval"] + random.uniform(-jitter, jitter))
+
+    async def probe_service(self, service_name: str) -> Optional[Dict[str, Any]]:
+        """Probe every endpoint of a service concurrently and record results"""
+        service = self.registry.get_service(service_name)
+        if not service:
+            return None
+        config = health_config(service)
+        endpoints = self.registry.balancers.get(service_name).endpoints
+        await asyncio.gather(
+            *[self._probe(service_name, endpoint.url, config) for endpoint in endpoints]
+        )
+        return self.table.service_health(service_name)
+
+    async def _probe(self, service_name: str, url: str, config: Dict[str, Any]) -> None:
+        client = self.registry.pool_manager.get_client(service_name)
+        started = time.perf_counter()
+        status_code: Optional[int] = None
+        error: Optional[str] = None
+        try:
+            response = await client.get(
+                f"{url}{config['path']}", timeout=config["timeout"]
+            )
+            status_code = response.status_code
+        except Exception as e:
+            error = str(e) or type(e).__name__
+
+        health = self.table.endpoint(service_name, url)
+        was_healthy = health.healthy
+        health.update(
+            status_code is not None and 200 <= status_code < 300,
+            time.perf_counter() - started,
+            status_code,
+            error,
+            config,
+        )
+        UPSTREAM_HEALTHY.labels(service=service_name, endpoint=url).set(
+            1 if health.healthy else 0
+        )
+        if was_healthy is not None and was_healthy != health.healthy:
+            logger.warning(
+                "Endpoint health changed",
+                service_name=service_name,
+                endpoint=url,
+                healthy=health.healthy,
+                status_code=status_code,
+                error=error,
+            )
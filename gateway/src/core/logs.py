@@ -0,0 +1,139 @@
+# --------------------------------------------------------------------------
+# Non-blocking structured logging pipeline for the API Gateway service
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import atexit
+import logging
+import queue
+import sys
+import threading
+from typing import Any, List, Optional, TextIO
+
+import structlog
+
+from ..config import settings
+from .metrics import LOG_RECORDS_DROPPED
+
+# Cheap processors run on the caller; rendering happens on the writer thread
+SHARED_PROCESSORS: List[Any] = [
+    structlog.stdlib.add_logger_name,
+    structlog.stdlib.add_log_level,
+    structlog.stdlib.PositionalArgumentsFormatter(),
+    structlog.processors.TimeStamper(fmt="iso"),
+]
+
+
+class QueueLogHandler(logging.Handler):
+    """Hands records to a bounded queue, dropping them when it is full
+
+    Unlike ``logging.handlers.QueueHandler`` the record is not formatted
+    on the calling thread, so the event loop only pays for a queue put.
+    """
+
+    def __init__(self, records: "queue.Queue[Optional[logging.LogRecord]]"):
+        super().__init__()
+        self.records = records
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.records.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class LogWriter:
+    """Background thread that formats queued records and writes them in batches"""
+
+    def __init__(
+        self,
+        records: "queue.Queue[Optional[logging.LogRecord]]",
+        formatter: logging.Formatter,
+        stream: TextIO,
+        batch_size: int = 256,
+    ):
+        self.records = records
+        self.formatter = formatter
+        self.stream = stream
+        self.batch_size = batch_size
+        self._thread = threading.Thread(
+            target=self._run, name="bifrost-log-writer", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Write what is queued, then stop the thread"""
+        if not self._thread.is_alive():
+            return
+        # The stop sentinel must not be dropped, so this put may block
+        self.records.put(None)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.records.get()]
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is None
+            self._write([record for record in batch if record is not None])
+            if stopping:
+                return
+
+    def _write(self, batch: List[logging.LogRecord]) -> None:
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.formatter.format(record))
+            except Exception:
+                LOG_RECORDS_DROPPED.inc()
+        if not lines:
+            return
+        try:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+        except (OSError, ValueError):
+            LOG_RECORDS_DROPPED.inc(len(lines))
+
+
+def configure_logging(stream: TextIO = sys.stdout) -> LogWriter:
+    """Route structlog and stdlib logging through the queue and writer thread"""
+    structlog.configure(
+        processors=[
+            structlog.stdlib.filter_by_level,
+            *SHARED_PROCESSORS,
+            structlog.processors.StackInfoRenderer(),
+            # Exceptions are captured while the traceback is still current
+            structlog.processors.format_exc_info,
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter,
+        ],
+        context_class=dict,
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True,
+    )
+    formatter = structlog.stdlib.ProcessorFormatter(
+        foreign_pre_chain=SHARED_PROCESSORS,
+        processors=[
+            structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+            structlog.processors.UnicodeDecoder(),
+            structlog.processors.JSONRenderer(),
+        ],
+    )
+
+    records: "queue.Queue[Optional[logging.LogRecord]]" = queue.Queue(
+        settings.LOG_QUEUE_SIZE
+    )
+    root = logging.getLogger()
+    root.handlers = [QueueLogHandler(records)]
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    writer = LogWriter(records, formatter, stream, settings.LOG_BATCH_SIZE)
+    writer.start()
+    # Records queued at exit are still written
+    atexit.register(writer.stop)
+    return writer
@@ -0,0 +1,276 @@
+# --------------------------------------------------------------------------
+# Prometheus metrics for the API Gateway service
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.openmetrics import exposition as openmetrics
+
+# Gateway overhead is expected in the sub-millisecond to millisecond range
+OVERHEAD_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    1.0,
+)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Requests, labelled by route template (never the raw path)
+REQUEST_COUNT = Counter(
+    "http_requests_total", "Total HTTP requests", ["method", "endpoint", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency, to the last body byte",
+    ["method", "endpoint"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "bifrost_requests_in_flight",
+    "Requests being handled by the gateway",
+    multiprocess_mode="livesum",
+)
+RESPONSE_SIZE = Histogram(
+    "bifrost_response_size_bytes",
+    "Response body bytes sent to clients",
+    ["endpoint"],
+    buckets=SIZE_BUCKETS,
+)
+GATEWAY_OVERHEAD = Histogram(
+    "bifrost_gateway_overhead_seconds",
+    "Time to the response headers not spent waiting on the upstream",
+    ["service"],
+    buckets=OVERHEAD_BUCKETS,
+)
+UPSTREAM_LATENCY = Histogram(
+    "bifrost_upstream_duration_seconds",
+    "Upstream attempt latency (to the headers of streamed responses)",
+    ["service"],
+)
+
+# Upstream connection pools
+POOL_IN_FLIGHT = Gauge(
+    "bifrost_pool_in_flight",
+    "Upstream requests holding a connection of the service pool",
+    ["service"],
+    multiprocess_mode="livesum",
+)
+POOL_MAX_CONNECTIONS = Gauge(
+    "bifrost_pool_max_connections",
+    "Connection limit of the service pool, per worker",
+    ["service"],
+    multiprocess_mode="livesum",
+)
+
+# Response cache
+CACHE_REQUESTS = Counter(
+    "bifrost_cache_requests_total",
+    "Proxied GET requests by response cache outcome",
+    ["service", "result"],
+)
+CACHE_EVICTIONS = Counter(
+    "bifrost_cache_evictions_total",
+    "Response cache entries evicted to stay within the byte budget",
+    ["service"],
+)
+
+# Request coalescing
+COALESCED_REQUESTS = Counter(
+    "bifrost_coalesced_requests_total",
+    "Proxied GETs that led an upstream call or were collapsed into one",
+    ["service", "role"],
+)
+
+# Circuit breakers
+CIRCUIT_TRANSITIONS = Counter(
+    "bifrost_circuit_transitions_total",
+    "Circuit breaker state transitions per service",
+    ["service", "state"],
+)
+
+# Retries and hedging
+UPSTREAM_RETRIES = Counter(
+    "bifrost_upstream_retries_total",
+    "Extra upstream attempts sent as connection-error retries or hedges",
+    ["service", "kind"],
+)
+HEDGE_WINS = Counter(
+    "bifrost_hedge_wins_total",
+    "Hedged requests answered first by the hedge rather than the original",
+    ["service"],
+)
+
+# Response compression
+COMPRESSION_BYTES = Counter(
+    "bifrost_compression_bytes_total",
+    "Response bytes before (in) and after (out) gateway compression",
+    ["service", "encoding", "direction"],
+)
+COMPRESSION_CPU_SECONDS = Counter(
+    "bifrost_compression_cpu_seconds_total",
+    "CPU time spent compressing responses",
+    ["service", "encoding"],
+)
+
+# Rate limiting
+RATE_LIMIT_DECISIONS = Counter(
+    "bifrost_rate_limit_decisions_total",
+    "Rate limit decisions by where they were made and their result",
+    ["source", "result"],
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    "bifrost_rate_limit_rejections_total",
+    "Requests rejected with 429 by the limit that was exceeded",
+    ["limit"],
+)
+
+# Adaptive concurrency limits
+CONCURRENCY_LIMIT = Gauge(
+    "bifrost_concurrency_limit",
+    "Current adaptive limit on concurrent upstream requests, per worker",
+    ["service"],
+    multiprocess_mode="livesum",
+)
+CONCURRENCY_QUEUED = Gauge(
+    "bifrost_concurrency_queued",
+    "Requests waiting for a concurrency slot of the service",
+    ["service"],
+    multiprocess_mode="livesum",
+)
+REQUESTS_SHED = Counter(
+    "bifrost_requests_shed_total",
+    "Requests answered 503 without reaching the service, by reason",
+    ["service", "reason"],
+)
+
+# Request deadlines
+DEADLINE_EXCEEDED = Counter(
+    "bifrost_deadline_exceeded_total",
+    "Requests that ran out of their time budget, by the phase that used it up",
+    ["service", "phase"],
+)
+
+# Bearer token verification
+AUTH_REQUESTS = Counter(
+    "bifrost_auth_requests_total",
+    "Bearer tokens checked, by whether they were cached, verified or rejected",
+    ["result"],
+)
+
+# Active health checks
+UPSTREAM_HEALTHY = Gauge(
+    "bifrost_upstream_healthy",
+    "Whether the last health probes consider an upstream endpoint healthy",
+    ["service", "endpoint"],
+    multiprocess_mode="livemin",
+)
+
+# Upstream connection warm-up
+DNS_RESOLUTIONS = Counter(
+    "bifrost_dns_resolutions_total",
+    "Upstream host name lookups, by result (hit, miss, refresh, error)",
+    ["result"],
+)
+PREWARMED_CONNECTIONS = Counter(
+    "bifrost_prewarmed_connections_total",
+    "Upstream requests sent to open keep-alive connections before traffic",
+    ["service"],
+)
+
+# Long-lived connections (WebSocket and server-sent events)
+OPEN_CONNECTIONS = Gauge(
+    "bifrost_open_connections",
+    "Proxied WebSocket and event-stream connections currently open",
+    ["service", "protocol"],
+    multiprocess_mode="livesum",
+)
+CONNECTIONS_REJECTED = Counter(
+    "bifrost_connections_rejected_total",
+    "Long-lived connections refused because the service was at its cap",
+    ["service", "protocol"],
+)
+STREAM_MESSAGES = Counter(
+    "bifrost_stream_messages_total",
+    "Messages relayed over long-lived connections, by direction",
+    ["service", "protocol", "direction"],
+)
+
+# Tracing
+TRACES = Counter(
+    "bifrost_traces_total",
+    "Finished request traces, by sampling decision (head, error, slow, dropped)",
+    ["decision"],
+)
+SPANS_DROPPED = Counter(
+    "bifrost_spans_dropped_total",
+    "Sampled spans lost because the export queue was full or export failed",
+)
+
+# Logging pipeline
+LOG_RECORDS_DROPPED = Counter(
+    "bifrost_log_records_dropped_total",
+    "Log records dropped because the log queue was full or writing failed",
+)
+
+
+class RequestTimings:
+    """Per-request labels, upstream time and log sampling, filled in while proxying"""
+
+    __slots__ = ("endpoint", "service", "upstream_seconds", "log_sample_rate")
+
+    def __init__(self) -> None:
+        self.endpoint: Optional[str] = None
+        self.service: Optional[str] = None
+        self.upstream_seconds = 0.0
+        # Access log sample rate of the matched route, if it sets one
+        self.log_sample_rate: Optional[float] = None
+
+
+def request_timings(scope: Dict[str, Any]) -> RequestTimings:
+    """The timings of a request, shared by the middleware through its state"""
+    state = scope.setdefault("state", {})
+    timings = state.get("timings")
+    if timings is None:
+        timings = state["timings"] = RequestTimings()
+    return timings
+
+
+def render_metrics(accept: Optional[str] = None) -> Tuple[bytes, str]:
+    """Exposition of every metric and its content type
+
+    Under a multi-process server (``PROMETHEUS_MULTIPROC_DIR`` set) the
+    values written by every worker are aggregated. OpenMetrics is served
+    when the scraper asks for it, the Prometheus text format otherwise.
+    """
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    if accept and "application/openmetrics-text" in accept:
+        return openmetrics.generate_latest(registry), openmetrics.CONTENT_TYPE_LATEST
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """Drop the live gauges of an exiting worker"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
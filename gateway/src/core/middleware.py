@@ -3,97 +3,305 @@
 #
 # @author bnbong bbbong9@gmail.com
 # --------------------------------------------------------------------------
+import random
+import sys
 import time
-from typing import Callable
+from typing import Optional
 import structlog
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.datastructures import URL
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..config import settings
+from .metrics import (
+    GATEWAY_OVERHEAD,
+    RATE_LIMIT_REJECTIONS,
+    REQUEST_COUNT,
+    REQUEST_LATENCY,
+    REQUESTS_IN_FLIGHT,
+    RESPONSE_SIZE,
+    RequestTimings,
+    request_timings,
+)
+from .profiler import PROFILE_HEADER, SamplingProfiler, profiler as default_profiler
+from .ratelimit import LocalRateLimiter, RateLimiter, rate_limit_headers
+from .tracing import TRACEPARENT, TRACESTATE, Tracer, tracer as default_tracer
 
 logger = structlog.get_logger()
 
+# Anything else is counted as "other" to keep label cardinality bounded
+KNOWN_METHODS = frozenset(["GET", "HEAD", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"])
+
+
+def _header(scope: Scope, name: bytes) -> Optional[str]:
+    """Read a request header straight from the ASGI scope"""
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    """Logging middleware for request/response logging"""
+
+class LoggingMiddleware:
+    """Access logging middleware: one line per request
     
-    def __init__(self, app: ASGIApp):
-        super().__init__(app)
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        start_time = time.time()
-        
-        # Log request
-        logger.info(
-            "Request started",
-            method=request.method,
-            url=str(request.url),
-            client_ip=request.client.host if request.client else None,
-            user_agent=request.headers.get("user-agent"),
-        )
+    Plain ASGI: the status is read from ``http.response.start`` and body
+    messages are passed through untouched, so streaming is not affected.
+    Successful requests are sampled at the route's ``log_sample_rate``
+    (default ``ACCESS_LOG_SAMPLE_RATE``); errors and slow requests are
+    always logged.
+    """
+    
+    def __init__(
+        self,
+        app: ASGIApp,
+        sample_rate: Optional[float] = None,
+        slow_seconds: Optional[float] = None
+    ):
+        self.app = app
+        self.sample_rate = settings.ACCESS_LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.slow_seconds = settings.ACCESS_LOG_SLOW_SECONDS if slow_seconds is None else slow_seconds
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        # Process request
-        response = await call_next(request)
+        start_time = time.perf_counter()
+        timings = request_timings(scope)
+        status_code = 500
         
-        # Calculate duration
-        duration = time.time() - start_time
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
         
-        # Log response
-        logger.info(
+        failed = True
+        try:
+            # Process request
+            await self.app(scope, receive, send_with_status)
+            failed = False
+        finally:
+            duration = time.perf_counter() - start_time
+            if failed or status_code >= 400 or duration >= self.slow_seconds or self._sampled(timings):
+                self._log(scope, status_code, duration, timings, failed)
+    
+    def _sampled(self, timings: RequestTimings) -> bool:
+        rate = self.sample_rate if timings.log_sample_rate is None else timings.log_sample_rate
+        return rate >= 1.0 or random.random() < rate
+    
+    def _log(
+        self,
+        scope: Scope,
+        status_code: int,
+        duration: float,
+        timings: RequestTimings,
+        failed: bool
+    ) -> None:
+        client = scope.get("client")
+        span = default_tracer.current()
+        log = logger.error if failed or status_code >= 500 else logger.info
+        log(
             "Request completed",
-            method=request.method,
-            url=str(request.url),
-            status_code=response.status_code,
+            method=scope["method"],
+            url=str(URL(scope=scope)),
+            status_code=status_code,
             duration=duration,
+            service=timings.service,
+            upstream_duration=timings.upstream_seconds if timings.service else None,
+            client_ip=client[0] if client else None,
+            user_agent=_header(scope, b"user-agent"),
+            trace_id=span.trace.trace_id if span is not None else None,
         )
+
+
+class ProfilingMiddleware:
+    """Marks requests sent with ``X-Profile`` for a running "requests" profile
+    
+    Between profiles this is a single attribute check per request.
+    """
+    
+    def __init__(self, app: ASGIApp, profiler: Optional[SamplingProfiler] = None):
+        self.app = app
+        self.profiler = profiler or default_profiler
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            not self.profiler.marking
+            or scope["type"] != "http"
+            or _header(scope, PROFILE_HEADER.encode()) is None
+        ):
+            await self.app(scope, receive, send)
+            return
         
-        return response
+        # Samples are kept when this coroutine's frame is on the stack
+        frame = sys._getframe()
+        token = self.profiler.mark(frame)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.unmark(frame, token)
 
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    """Rate limiting middleware"""
+class TracingMiddleware:
+    """Root span of every request
+    
+    Continues the caller's trace when it sends ``traceparent``. The span is
+    named after the route template once the request is handled, and fails
+    on 5xx responses so that the trace is kept by tail sampling. With
+    tracing off this costs one attribute check per request.
+    """
+    
+    def __init__(self, app: ASGIApp, tracer: Optional[Tracer] = None):
+        self.app = app
+        self.tracer = tracer or default_tracer
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+        
+        timings = request_timings(scope)
+        span = self.tracer.start_trace(
+            scope["method"],
+            _header(scope, TRACEPARENT.encode()),
+            _header(scope, TRACESTATE.encode()),
+            {"http.method": scope["method"], "http.target": scope["path"]},
+        )
+        status_code = 500
+        
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+        
+        with span:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                span.name = f"{scope['method']} {_endpoint_label(scope, timings)}"
+                span.set("http.status_code", status_code)
+                if timings.service is not None:
+                    span.set("bifrost.service", timings.service)
+                if status_code >= 500:
+                    span.record_error()
+
+
+class MetricsMiddleware:
+    """Prometheus metrics of every request
+    
+    Requests are labelled by route template: the matched gateway route for
+    proxied requests, the FastAPI route otherwise. Gateway overhead is the
+    time to the response headers minus the time spent waiting on upstreams.
+    """
     
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
-        self.rate_limits: dict[str, list[float]] = {}
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start_time = time.perf_counter()
+        timings = request_timings(scope)
+        status_code = 500
+        response_size = 0
+        
+        async def send_with_metrics(message: Message) -> None:
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if timings.service is not None:
+                    overhead = time.perf_counter() - start_time - timings.upstream_seconds
+                    GATEWAY_OVERHEAD.labels(service=timings.service).observe(max(overhead, 0.0))
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+        
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            method = scope["method"] if scope["method"] in KNOWN_METHODS else "other"
+            endpoint = _endpoint_label(scope, timings)
+            REQUEST_COUNT.labels(method=method, endpoint=endpoint, status=str(status_code)).inc()
+            REQUEST_LATENCY.labels(method=method, endpoint=endpoint).observe(
+                time.perf_counter() - start_time
+            )
+            RESPONSE_SIZE.labels(endpoint=endpoint).observe(response_size)
+
+
+def _endpoint_label(scope: Scope, timings: RequestTimings) -> str:
+    """Low-cardinality endpoint label of a handled request"""
+    if timings.endpoint is not None:
+        return timings.endpoint
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class RateLimitMiddleware:
+    """Rate limiting middleware
+    
+    Enforces the per-client limit. Service and route limits are checked
+    by the proxy once the route is known and left in ``request.state``;
+    the ``RateLimit-*`` headers of the tightest limit are added here.
+    """
+    
+    def __init__(
+        self,
+        app: ASGIApp,
+        limit: Optional[int] = None,
+        backend: Optional[RateLimiter] = None
+    ):
+        self.app = app
+        self.limit = limit or settings.RATE_LIMIT_PER_MINUTE
+        self.backend = backend or LocalRateLimiter(settings.RATE_LIMIT_MAX_KEYS)
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        # Simple in-memory rate limiting (in production, use Redis)
-        client_ip = request.client.host if request.client else "unknown"
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
         
         # Check rate limit
-        if not self._check_rate_limit(client_ip):
+        with default_tracer.span("rate_limit.client"):
+            decision = await self.backend.check(f"client:{client_ip}", self.limit, 60.0)
+        
+        if not decision.allowed:
             logger.warning(
                 "Rate limit exceeded",
                 client_ip=client_ip,
-                method=request.method,
-                url=str(request.url),
-            )
-            return Response(
-                content="Rate limit exceeded",
-                status_code=429,
-                media_type="text/plain"
+                method=scope["method"],
+                path=scope["path"],
             )
+            RATE_LIMIT_REJECTIONS.labels(limit="client").inc()
+            response = PlainTextResponse("Rate limit exceeded", status_code=429)
+            response.raw_headers.extend(rate_limit_headers(decision))
+            await response(scope, receive, send)
+            return
+        
+        state = scope.setdefault("state", {})
+        
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                tightest = decision
+                route_decision = state.get("rate_limit")
+                if route_decision is not None and (
+                    not route_decision.allowed
+                    or route_decision.remaining < decision.remaining
+                ):
+                    tightest = route_decision
+                names = {name for name, _ in rate_limit_headers(tightest)}
+                headers = [
+                    (name, value) for name, value in message.get("headers", [])
+                    if name.lower() not in names
+                ]
+                message["headers"] = headers + rate_limit_headers(tightest)
+            await send(message)
         
-        return await call_next(request)
-    
-    def _check_rate_limit(self, client_ip: str) -> bool:
-        """Simple rate limit check (60 requests per minute)"""
-        current_time = time.time()
-        minute_ago = current_time - 60
-        
-        # Clean old entries
-        if client_ip in self.rate_limits:
-            self.rate_limits[client_ip] = [
-                timestamp for timestamp in self.rate_limits[client_ip]
-                if timestamp > minute_ago
-            ]
-        else:
-            self.rate_limits[client_ip] = []
-        
-        # Check limit
-        if len(self.rate_limits[client_ip]) >= 60:
-            return False
-        
-        # Add current request
-        self.rate_limits[client_ip].append(current_time)
-        return True
+        await self.app(scope, receive, send_with_headers)
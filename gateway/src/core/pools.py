@@ -0,0 +1,319 @@
+# --------------------------------------------------------------------------
+# Upstream connection pool management for the API Gateway service
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+import importlib.util
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, Set
+
+import httpcore
+import httpx
+import structlog
+
+from .metrics import POOL_IN_FLIGHT, POOL_MAX_CONNECTIONS
+from .resolver import CachedDnsBackend, DnsCache
+
+logger = structlog.get_logger()
+
+# Defaults applied when a service entry has no "pool" section
+DEFAULT_POOL_CONFIG: Dict[str, Any] = {
+    "max_connections": 100,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry": 5.0,
+    "http2": False,
+}
+
+TransportFactory = Callable[[str, Dict[str, Any]], httpx.AsyncBaseTransport]
+
+# httpcore errors and the httpx errors raised for them, most specific first
+_HTTPCORE_ERRORS = (
+    (httpcore.ConnectTimeout, httpx.ConnectTimeout),
+    (httpcore.ReadTimeout, httpx.ReadTimeout),
+    (httpcore.WriteTimeout, httpx.WriteTimeout),
+    (httpcore.PoolTimeout, httpx.PoolTimeout),
+    (httpcore.TimeoutException, httpx.TimeoutException),
+    (httpcore.ConnectError, httpx.ConnectError),
+    (httpcore.ReadError, httpx.ReadError),
+    (httpcore.WriteError, httpx.WriteError),
+    (httpcore.NetworkError, httpx.NetworkError),
+    (httpcore.ProxyError, httpx.ProxyError),
+    (httpcore.UnsupportedProtocol, httpx.UnsupportedProtocol),
+    (httpcore.LocalProtocolError, httpx.LocalProtocolError),
+    (httpcore.RemoteProtocolError, httpx.RemoteProtocolError),
+    (httpcore.ProtocolError, httpx.ProtocolError),
+)
+
+
+def pool_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Resolve the connection pool settings of a service
+
+    Raises ValueError for limits the pool cannot use, so services are
+    checked when they are loaded rather than when the pool is built.
+    """
+    pool_config = {**DEFAULT_POOL_CONFIG, **config.get("pool", {})}
+    for key, minimum in (("max_connections", 1), ("max_keepalive_connections", 0)):
+        if not isinstance(pool_config[key], int) or pool_config[key] < minimum:
+            raise ValueError(f"pool {key} must be an integer of at least {minimum}")
+    if not isinstance(pool_config["keepalive_expiry"], (int, float)):
+        raise ValueError("pool keepalive_expiry must be a number of seconds")
+    return pool_config
+
+
+def _http2_available() -> bool:
+    """Check whether the optional h2 package is installed"""
+    return importlib.util.find_spec("h2") is not None
+
+
+@contextmanager
+def _httpx_errors() -> Iterator[None]:
+    """Raise httpcore errors as the httpx errors callers handle"""
+    try:
+        yield
+    except Exception as e:
+        for error, mapped in _HTTPCORE_ERRORS:
+            if isinstance(e, error):
+                raise mapped(str(e)) from e
+        raise
+
+
+class _ResponseStream(httpx.AsyncByteStream):
+    def __init__(self, stream: Any):
+        self.stream = stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        with _httpx_errors():
+            async for chunk in self.stream:
+                yield chunk
+
+    async def aclose(self) -> None:
+        if hasattr(self.stream, "aclose"):
+            await self.stream.aclose()
+
+
+class PoolTransport(httpx.AsyncBaseTransport):
+    """httpx transport over an httpcore connection pool the gateway builds
+
+    Used instead of httpx.AsyncHTTPTransport, which neither accepts a
+    network backend (needed for the DNS cache) nor exposes its pool, so
+    both are reached through httpcore's public API.
+    """
+
+    def __init__(self, pool: httpcore.AsyncConnectionPool):
+        self.pool = pool
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        assert isinstance(request.stream, httpx.AsyncByteStream)
+        core_request = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(
+                scheme=request.url.raw_scheme,
+                host=request.url.raw_host,
+                port=request.url.port,
+                target=request.url.raw_path,
+            ),
+            headers=request.headers.raw,
+            content=request.stream,
+            extensions=request.extensions,
+        )
+        with _httpx_errors():
+            response = await self.pool.handle_async_request(core_request)
+
+        return httpx.Response(
+            status_code=response.status,
+            headers=response.headers,
+            stream=_ResponseStream(response.stream),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self.pool.aclose()
+
+
+class ConnectionPoolManager:
+    """Owns one long-lived HTTP client (and connection pool) per service"""
+
+    def __init__(
+        self,
+        transport_factory: Optional[TransportFactory] = None,
+        drain_seconds: float = 30.0,
+        dns_cache: Optional[DnsCache] = None,
+    ):
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        # Transports of the clients, which report their open connections
+        self.transports: Dict[str, httpx.AsyncBaseTransport] = {}
+        self.pool_configs: Dict[str, Dict[str, Any]] = {}
+        self.in_flight: Dict[str, int] = {}
+        self.transport_factory = transport_factory
+        # Replaced or removed pools stay open at least this long, and then
+        # until the requests counted against them are released
+        self.drain_seconds = drain_seconds
+        self._draining: Set["asyncio.Task[None]"] = set()
+        # Requests in flight per client, which outlive the name of a replaced pool
+        self._outstanding: Dict[httpx.AsyncClient, int] = {}
+        # Events of draining clients, set once their last request is released
+        self._drained: Dict[httpx.AsyncClient, asyncio.Event] = {}
+        # Upstream host addresses shared by every pool, if caching is on
+        self.dns_cache = dns_cache
+
+    def _build_transport(
+        self, name: str, pool_config: Dict[str, Any]
+    ) -> httpx.AsyncBaseTransport:
+        """Create the transport configured from the service pool settings"""
+        http2 = bool(pool_config["http2"])
+        if http2 and not _http2_available():
+            logger.warning(
+                "HTTP/2 requested but h2 is not installed, falling back to HTTP/1.1",
+                service_name=name,
+            )
+            http2 = False
+
+        if self.transport_factory is not None:
+            transport = self.transport_factory(name, pool_config)
+        else:
+            backend = None
+            if self.dns_cache is not None:
+                backend = CachedDnsBackend(self.dns_cache)
+            pool = httpcore.AsyncConnectionPool(
+                ssl_context=httpx.create_ssl_context(),
+                max_connections=pool_config["max_connections"],
+                max_keepalive_connections=pool_config["max_keepalive_connections"],
+                keepalive_expiry=pool_config["keepalive_expiry"],
+                http1=True,
+                http2=http2,
+                network_backend=backend,
+            )
+            transport = PoolTransport(pool)
+        return transport
+
+    async def create_pool(self, name: str, config: Dict[str, Any]) -> httpx.AsyncClient:
+        """Create (or replace) the connection pool of a service"""
+        pool_config = pool_settings(config)
+        await self.remove_pool(name, drain=True)
+
+        transport = self._build_transport(name, pool_config)
+        client = httpx.AsyncClient(transport=transport, timeout=30.0)
+        self.clients[name] = client
+        self.transports[name] = transport
+        self.pool_configs[name] = pool_config
+        self.in_flight.setdefault(name, 0)
+        POOL_MAX_CONNECTIONS.labels(service=name).set(pool_config["max_connections"])
+        logger.info("Connection pool created", service_name=name, **pool_config)
+        return client
+
+    async def remove_pool(self, name: str, drain: bool = False) -> bool:
+        """Close and forget the connection pool of a service
+
+        With ``drain`` the client is closed once ``drain_seconds`` have
+        passed and every request sent over it has been released, so idle
+        connections go within ``drain_seconds`` and long-lived streams,
+        downloads and uploads are never cut.
+        """
+        client = self.clients.pop(name, None)
+        self.transports.pop(name, None)
+        self.pool_configs.pop(name, None)
+        if client is None:
+            return False
+
+        if drain and self.drain_seconds > 0:
+            # In-flight counts are kept until the requests on it are released
+            self._drained[client] = asyncio.Event()
+            task = asyncio.create_task(self._close_later(name, client))
+            self._draining.add(task)
+            task.add_done_callback(self._draining.discard)
+            return True
+        self._forget(name)
+        await client.aclose()
+        logger.info("Connection pool closed", service_name=name)
+        return True
+
+    async def _close_later(self, name: str, client: httpx.AsyncClient) -> None:
+        drained = self._drained[client]
+        try:
+            await asyncio.sleep(self.drain_seconds)
+            while self._outstanding.get(client):
+                await drained.wait()
+        finally:
+            del self._drained[client]
+            self._outstanding.pop(client, None)
+            if name not in self.clients:
+                self._forget(name)
+            await client.aclose()
+            logger.info("Drained connection pool closed", service_name=name)
+
+    def _forget(self, name: str) -> None:
+        self.in_flight.pop(name, None)
+        for metric in (POOL_IN_FLIGHT, POOL_MAX_CONNECTIONS):
+            try:
+                metric.remove(name)
+            except KeyError:
+                pass
+
+    def get_client(self, name: str) -> httpx.AsyncClient:
+        """Get the HTTP client of a service"""
+        client = self.clients.get(name)
+        if client is None:
+            raise ValueError(f"No connection pool for service '{name}'")
+        return client
+
+    def acquire(self, name: str, client: httpx.AsyncClient) -> None:
+        """Count a request sent over client against the occupancy of a pool"""
+        self.in_flight[name] = self.in_flight.get(name, 0) + 1
+        self._outstanding[client] = self._outstanding.get(client, 0) + 1
+        POOL_IN_FLIGHT.labels(service=name).inc()
+
+    def release(self, name: str, client: Optional[httpx.AsyncClient]) -> None:
+        """Release a request previously counted with acquire()"""
+        if name in self.in_flight:
+            self.in_flight[name] -= 1
+            POOL_IN_FLIGHT.labels(service=name).dec()
+        if client is None:
+            return
+        outstanding = self._outstanding.get(client, 0) - 1
+        if outstanding > 0:
+            self._outstanding[client] = outstanding
+            return
+        self._outstanding.pop(client, None)
+        drained = self._drained.get(client)
+        if drained is not None:
+            drained.set()
+
+    @asynccontextmanager
+    async def track(self, name: str) -> AsyncIterator[httpx.AsyncClient]:
+        """Count a request against a pool for the duration of the block"""
+        client = self.get_client(name)
+        self.acquire(name, client)
+        try:
+            yield client
+        finally:
+            self.release(name, client)
+
+    def pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Report configuration and occupancy of every pool"""
+        stats: Dict[str, Dict[str, Any]] = {}
+        for name, transport in self.transports.items():
+            stats[name] = {
+                **self.pool_configs[name],
+                "in_flight": self.in_flight.get(name, 0),
+                **_connection_counts(transport),
+            }
+        return stats
+
+    async def close(self) -> None:
+        """Close every connection pool"""
+        for name in list(self.clients):
+            await self.remove_pool(name)
+        for task in list(self._draining):
+            task.cancel()
+        await asyncio.gather(*self._draining, return_exceptions=True)
+
+
+def _connection_counts(transport: httpx.AsyncBaseTransport) -> Dict[str, int]:
+    """Count the open/idle connections of the httpcore pool behind a transport"""
+    if not isinstance(transport, PoolTransport):
+        return {"connections": 0, "idle_connections": 0}
+
+    connections = transport.pool.connections
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {"connections": len(connections), "idle_connections": idle}
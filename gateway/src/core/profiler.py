@@ -0,0 +1,238 @@
+# --------------------------------------------------------------------------
+# On-demand sampling profiler for the API Gateway service
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar, Token
+from types import FrameType
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+# Requests carrying this header are sampled by a "requests" profile
+PROFILE_HEADER = "x-profile"
+
+PROFILE_MODES = ("all", "requests")
+
+# Leaf frames of threads blocked on I/O or a lock rather than running code
+IDLE_FRAMES = frozenset(
+    [
+        ("selectors.py", "select"),
+        ("threading.py", "wait"),
+        ("threading.py", "_wait_for_tstate_lock"),
+        ("queue.py", "get"),
+    ]
+)
+
+
+# Set in the context of marked requests, and so of the tasks they start
+_profiled: ContextVar[bool] = ContextVar("profiled", default=False)
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one runs"""
+
+
+def frame_label(frame: FrameType) -> str:
+    """``function (package/module.py:line)`` of the function a frame runs"""
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    directory, filename = os.path.split(code.co_filename)
+    return f"{name} ({os.path.basename(directory)}/{filename}:{code.co_firstlineno})"
+
+
+def _is_idle(frame: FrameType) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+
+
+class Profile:
+    """Stack samples of one profiling run, counted by collapsed stack"""
+
+    def __init__(self, mode: str, interval: float, idle: bool):
+        self.mode = mode
+        self.interval = interval
+        self.idle = idle
+        self.stacks: "Counter[str]" = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self.started = time.time()
+        self.duration = 0.0
+
+    def collapsed(self) -> str:
+        """One ``frame;frame;... count`` line per stack, for flamegraph tools"""
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "interval": self.interval,
+            "started": self.started,
+            "duration": round(self.duration, 3),
+            "samples": self.samples,
+            "idle_samples": self.idle_samples,
+            "stacks": dict(self.stacks.most_common()),
+        }
+
+
+class SamplingProfiler:
+    """Statistical profiler sampling the Python stacks of this process
+
+    While a profile runs, a thread wakes every ``interval`` seconds and
+    records the stack of every other thread (``all``), or only of the
+    requests marked with the ``X-Profile`` header (``requests``), counted
+    by collapsed stack. Threads blocked in the event loop's selector or on
+    a lock are counted as idle and left out unless ``idle`` is asked for.
+    Nothing runs between profiles; requests only check ``marking``.
+
+    A marked request is followed into the tasks it starts (hedged attempts,
+    coalesced fetches) by a task factory installed on its event loop for
+    the duration of the profile.
+    """
+
+    def __init__(self) -> None:
+        self.profile: Optional[Profile] = None
+        # Set while a "requests" profile runs, checked by the middleware
+        self.marking = False
+        # Frames of the marked requests' outermost coroutines
+        self.marked: Set[FrameType] = set()
+        # Event loops given a task factory, with the factory they had before
+        self._loops: Dict[asyncio.AbstractEventLoop, Tuple[Any, Callable[..., Any]]] = (
+            {}
+        )
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.profile is not None
+
+    def start(
+        self, mode: str = "all", interval: float = 0.01, idle: bool = False
+    ) -> None:
+        """Start sampling; raises ProfilerBusy if a profile already runs"""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{mode}'")
+        with self._lock:
+            if self.profile is not None:
+                raise ProfilerBusy("A profile is already running")
+            self.profile = Profile(mode, interval, idle)
+            self.marking = mode == "requests"
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(self.profile,),
+                name="bifrost-profiler",
+                daemon=True,
+            )
+            self._thread.start()
+        logger.info("Profiling started", mode=mode, interval=interval)
+
+    def stop(self) -> Profile:
+        """Stop sampling and return what was recorded"""
+        with self._lock:
+            profile, thread = self.profile, self._thread
+            if profile is None or thread is None:
+                raise RuntimeError("No profile is running")
+            self._stop.set()
+            thread.join()
+            self.marking = False
+            self.marked.clear()
+            for loop, (previous, factory) in self._loops.items():
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(_restore, loop, previous, factory)
+            self._loops.clear()
+            self.profile = None
+            self._thread = None
+        profile.duration = time.time() - profile.started
+        logger.info("Profiling stopped", samples=profile.samples)
+        return profile
+
+    def mark(self, frame: FrameType) -> "Token[bool]":
+        """Sample the request running ``frame`` and the tasks it starts"""
+        self.marked.add(frame)
+        self._follow_tasks(asyncio.get_running_loop())
+        return _profiled.set(True)
+
+    def unmark(self, frame: FrameType, token: "Token[bool]") -> None:
+        self.marked.discard(frame)
+        _profiled.reset(token)
+
+    def _follow_tasks(self, loop: asyncio.AbstractEventLoop) -> None:
+        if loop in self._loops:
+            return
+        previous = loop.get_task_factory()
+
+        def factory(
+            loop: asyncio.AbstractEventLoop, coro: Any, **kwargs: Any
+        ) -> "asyncio.Future[Any]":
+            if previous is None:
+                task = asyncio.Task(coro, loop=loop, **kwargs)
+            else:
+                task = previous(loop, coro, **kwargs)
+            frame = getattr(coro, "cr_frame", None)
+            if frame is not None and self.marking and _profiled.get():
+                self.marked.add(frame)
+                task.add_done_callback(lambda _: self.marked.discard(frame))
+            return task
+
+        self._loops[loop] = (previous, factory)
+        loop.set_task_factory(factory)
+
+    def _run(self, profile: Profile) -> None:
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not self._stop.wait(profile.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if ident not in names:
+                    names = {
+                        thread.ident: thread.name for thread in threading.enumerate()
+                    }
+                self._sample(profile, names.get(ident, str(ident)), frame)
+
+    def _sample(self, profile: Profile, thread_name: str, leaf: FrameType) -> None:
+        if not profile.idle and _is_idle(leaf):
+            if profile.mode == "all":
+                profile.idle_samples += 1
+            return
+        frames: List[FrameType] = []
+        frame: Optional[FrameType] = leaf
+        marked = profile.mode == "all"
+        while frame is not None:
+            frames.append(frame)
+            if not marked and frame in self.marked:
+                # Only the request's own frames, not the event loop's
+                marked = True
+                break
+            frame = frame.f_back
+        if not marked:
+            return
+        root = thread_name if profile.mode == "all" else "request"
+        labels = [root] + [frame_label(frame) for frame in reversed(frames)]
+        profile.stacks[";".join(labels)] += 1
+        profile.samples += 1
+
+
+def _restore(
+    loop: asyncio.AbstractEventLoop, previous: Any, factory: Callable[..., Any]
+) -> None:
+    # Unless another profile has wrapped the factory since
+    if loop.get_task_factory() is factory:
+        loop.set_task_factory(previous)
+
+
+# The process-wide profiler, idle until an admin starts a profile
+profiler = SamplingProfiler()
@@ -0,0 +1,308 @@
+# --------------------------------------------------------------------------
+# Rate limiting backends (GCRA) for the API Gateway service
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import math
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+import structlog
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from ..config import settings
+from .metrics import RATE_LIMIT_DECISIONS
+
+logger = structlog.get_logger()
+
+# Generic cell rate algorithm over Redis time, taking up to ARGV[3] tokens.
+# KEYS[1]: theoretical arrival time (ms) of the key
+# ARGV[1]: emission interval (ms), ARGV[2]: period (ms), ARGV[3]: tokens wanted
+# Returns {granted, remaining, ms}: ms is the reset time when tokens were
+# granted and the retry delay when none were.
+GCRA_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local wanted = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then
+  tat = now
+end
+local granted = math.min(wanted, math.floor((now + period - tat) / interval))
+if granted < 1 then
+  return {0, 0, math.ceil(tat + interval - period - now)}
+end
+tat = tat + granted * interval
+redis.call('SET', KEYS[1], string.format('%.3f', tat), 'PX', math.ceil(tat - now))
+return {granted, math.floor((now + period - tat) / interval), math.ceil(tat - now)}
+"""
+
+
+class RateLimitDecision:
+    """Outcome of a rate limit check"""
+
+    __slots__ = ("allowed", "limit", "remaining", "reset_after", "retry_after")
+
+    def __init__(
+        self,
+        allowed: bool,
+        limit: int,
+        remaining: int,
+        reset_after: float,
+        retry_after: float = 0.0,
+    ):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        # Seconds until the full limit is available again
+        self.reset_after = reset_after
+        # Seconds until the next request would be allowed (denials only)
+        self.retry_after = retry_after
+
+
+def rate_limit_settings(value: Any) -> Optional[Tuple[int, float]]:
+    """Resolve a ``rate_limit`` config value to (limit, period seconds)
+
+    An integer is requests per minute; an object sets ``limit`` and
+    ``period``. None and 0 mean unlimited. Raises ValueError for an invalid
+    value, so services are checked when they are loaded.
+    """
+    if isinstance(value, dict):
+        if "limit" not in value:
+            raise ValueError("rate_limit object needs a 'limit'")
+        limit, period = int(value["limit"]), float(value.get("period", 60.0))
+    elif not value:
+        return None
+    else:
+        limit, period = int(value), 60.0
+    if limit < 1 or period <= 0:
+        raise ValueError(
+            f"rate_limit must allow at least 1 request per period: {value}"
+        )
+    return limit, period
+
+
+def rate_limit_headers(decision: RateLimitDecision) -> List[Tuple[bytes, bytes]]:
+    """``RateLimit-*`` (and on denials ``Retry-After``) response headers"""
+    headers = [
+        (b"ratelimit-limit", str(decision.limit).encode()),
+        (b"ratelimit-remaining", str(decision.remaining).encode()),
+        (b"ratelimit-reset", str(math.ceil(decision.reset_after)).encode()),
+    ]
+    if not decision.allowed:
+        headers.append(
+            (b"retry-after", str(max(1, math.ceil(decision.retry_after))).encode())
+        )
+    return headers
+
+
+class RateLimiter:
+    """Interface of the rate limit backends"""
+
+    async def check(self, key: str, limit: int, period: float) -> RateLimitDecision:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalRateLimiter(RateLimiter):
+    """GCRA limiter in process memory: one timestamp per key, LRU-bounded
+
+    A key whose theoretical arrival time has passed holds no state beyond
+    "full budget", so when ``max_keys`` is reached such keys are evicted,
+    least recently used first. Keys still being limited are never evicted,
+    as that would reset their limit: while every tracked key is, requests
+    with a new key are rejected.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._tats: "OrderedDict[str, float]" = OrderedDict()
+
+    async def check(self, key: str, limit: int, period: float) -> RateLimitDecision:
+        return self.check_now(key, limit, period, time.monotonic())
+
+    def check_now(
+        self, key: str, limit: int, period: float, now: float
+    ) -> RateLimitDecision:
+        interval = period / limit
+        tat = max(self._tats.get(key, now), now)
+        new_tat = tat + interval
+        if new_tat > now + period:
+            if key in self._tats:
+                # Still in use, so not among the first keys to evict
+                self._tats.move_to_end(key)
+            return RateLimitDecision(False, limit, 0, tat - now, new_tat - period - now)
+
+        if key not in self._tats and len(self._tats) >= self.max_keys:
+            self._evict(now)
+            if len(self._tats) >= self.max_keys:
+                wait = next(iter(self._tats.values())) - now
+                return RateLimitDecision(False, limit, 0, wait, wait)
+        self._tats[key] = new_tat
+        self._tats.move_to_end(key)
+        remaining = int((now + period - new_tat) / interval)
+        return RateLimitDecision(True, limit, remaining, new_tat - now)
+
+    def _evict(self, now: float) -> None:
+        """Drop least recently used keys whose budget is whole again"""
+        while self._tats:
+            key, tat = next(iter(self._tats.items()))
+            if tat > now:
+                break
+            del self._tats[key]
+
+    def __len__(self) -> int:
+        return len(self._tats)
+
+
+class _Lease:
+    """Tokens taken from Redis in one call and handed out locally"""
+
+    __slots__ = ("tokens", "remaining", "expires_at", "reset_at", "denied_until")
+
+    def __init__(self) -> None:
+        self.tokens = 0
+        self.remaining = 0
+        self.expires_at = 0.0
+        # When the budget is whole again, as Redis reported with the grant
+        self.reset_at = 0.0
+        self.denied_until = 0.0
+
+
+class RedisRateLimiter(RateLimiter):
+    """GCRA limiter shared by every worker and replica through Redis
+
+    Each Redis call leases a small batch of tokens, so most requests are
+    decided locally, and a denial is remembered until its retry delay has
+    passed. Leased tokens that are not used within ``lease_ttl`` are lost,
+    which can make the limit slightly stricter, never looser.
+
+    When Redis fails the limiter falls back to ``failure_mode``: "open"
+    allows every request, "local" enforces the limit per process. Redis is
+    retried after ``retry_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        redis: Any,
+        failure_mode: str = "local",
+        batch_size: int = 10,
+        lease_ttl: float = 1.0,
+        retry_interval: float = 5.0,
+        prefix: str = "bifrost:ratelimit:",
+        max_keys: int = 100_000,
+    ):
+        if failure_mode not in ("open", "local"):
+            raise ValueError(f"Unknown rate limit failure mode '{failure_mode}'")
+        self.redis = redis
+        self.failure_mode = failure_mode
+        self.batch_size = batch_size
+        self.lease_ttl = lease_ttl
+        self.retry_interval = retry_interval
+        self.prefix = prefix
+        self.max_keys = max_keys
+        self.fallback = LocalRateLimiter(max_keys)
+        self._script = redis.register_script(GCRA_SCRIPT)
+        self._leases: "OrderedDict[str, _Lease]" = OrderedDict()
+        self._redis_down_until = 0.0
+
+    def _lease(self, key: str) -> _Lease:
+        lease = self._leases.get(key)
+        if lease is None:
+            lease = self._leases[key] = _Lease()
+            if len(self._leases) > self.max_keys:
+                self._leases.popitem(last=False)
+        else:
+            self._leases.move_to_end(key)
+        return lease
+
+    async def check(self, key: str, limit: int, period: float) -> RateLimitDecision:
+        now = time.monotonic()
+        lease = self._lease(key)
+        if lease.denied_until > now:
+            RATE_LIMIT_DECISIONS.labels(source="lease", result="limited").inc()
+            return RateLimitDecision(
+                False, limit, 0, lease.denied_until - now, lease.denied_until - now
+            )
+        if lease.tokens > 0 and lease.expires_at > now:
+            lease.tokens -= 1
+            RATE_LIMIT_DECISIONS.labels(source="lease", result="allowed").inc()
+            return RateLimitDecision(
+                True,
+                limit,
+                lease.remaining + lease.tokens,
+                max(0.0, lease.reset_at - now),
+            )
+
+        if now < self._redis_down_until:
+            return await self._fall_back(key, limit, period)
+
+        # Smaller batches for small limits, so no worker hoards the budget
+        wanted = max(1, min(self.batch_size, limit // 10))
+        try:
+            granted, remaining, delay_ms = await self._script(
+                keys=[f"{self.prefix}{key}"],
+                args=[period * 1000 / limit, period * 1000, wanted],
+            )
+        except (RedisError, OSError) as e:
+            self._redis_down_until = now + self.retry_interval
+            logger.warning(
+                "Rate limit backend unavailable, falling back",
+                failure_mode=self.failure_mode,
+                error=str(e),
+            )
+            return await self._fall_back(key, limit, period)
+
+        delay = int(delay_ms) / 1000
+        if int(granted) == 0:
+            lease.tokens = 0
+            lease.denied_until = now + delay
+            RATE_LIMIT_DECISIONS.labels(source="redis", result="limited").inc()
+            return RateLimitDecision(False, limit, 0, delay, delay)
+
+        lease.tokens = int(granted) - 1
+        lease.remaining = int(remaining)
+        lease.expires_at = now + self.lease_ttl
+        lease.reset_at = now + delay
+        RATE_LIMIT_DECISIONS.labels(source="redis", result="allowed").inc()
+        return RateLimitDecision(True, limit, lease.remaining + lease.tokens, delay)
+
+    async def _fall_back(
+        self, key: str, limit: int, period: float
+    ) -> RateLimitDecision:
+        if self.failure_mode == "open":
+            RATE_LIMIT_DECISIONS.labels(source="fail_open", result="allowed").inc()
+            return RateLimitDecision(True, limit, limit, 0.0)
+        decision = await self.fallback.check(key, limit, period)
+        RATE_LIMIT_DECISIONS.labels(
+            source="local", result="allowed" if decision.allowed else "limited"
+        ).inc()
+        return decision
+
+    async def close(self) -> None:
+        await self.redis.close()
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Build the configured rate limit backend"""
+    if settings.RATE_LIMIT_BACKEND != "redis":
+        return LocalRateLimiter(settings.RATE_LIMIT_MAX_KEYS)
+
+    client = Redis.from_url(
+        settings.REDIS_URL,
+        socket_timeout=settings.RATE_LIMIT_REDIS_TIMEOUT,
+        socket_connect_timeout=settings.RATE_LIMIT_REDIS_TIMEOUT,
+    )
+    return RedisRateLimiter(
+        client,
+        failure_mode=settings.RATE_LIMIT_FAILURE_MODE,
+        batch_size=settings.RATE_LIMIT_BATCH_SIZE,
+        lease_ttl=settings.RATE_LIMIT_LEASE_TTL,
+        max_keys=settings.RATE_LIMIT_MAX_KEYS,
+    )
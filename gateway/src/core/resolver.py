@@ -0,0 +1,270 @@
+# --------------------------------------------------------------------------
+# Cached DNS resolution of upstream hosts for the API Gateway service
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+import importlib.util
+import ipaddress
+import socket
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import httpcore
+import structlog
+
+from .metrics import DNS_RESOLUTIONS
+
+logger = structlog.get_logger()
+
+# Resolves a host name to its addresses and their TTL in seconds, if known
+Resolve = Callable[[str], Awaitable[Tuple[List[str], Optional[float]]]]
+
+
+def _dnspython_available() -> bool:
+    """Check whether the optional dnspython package is installed"""
+    return importlib.util.find_spec("dns") is not None
+
+
+def is_ip_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host.strip("[]"))
+    except ValueError:
+        return False
+    return True
+
+
+async def resolve_with_getaddrinfo(host: str) -> Tuple[List[str], Optional[float]]:
+    """Addresses from the system resolver, which does not report TTLs"""
+    infos = await asyncio.get_running_loop().getaddrinfo(
+        host, None, type=socket.SOCK_STREAM
+    )
+    addresses: List[str] = []
+    for _, _, _, _, sockaddr in infos:
+        if sockaddr[0] not in addresses:
+            addresses.append(sockaddr[0])
+    return addresses, None
+
+
+async def resolve_with_dnspython(host: str) -> Tuple[List[str], Optional[float]]:
+    """A and AAAA records with the lowest TTL among them"""
+    from dns import asyncresolver, exception, resolver
+
+    addresses: List[str] = []
+    ttls: List[float] = []
+    for record_type in ("A", "AAAA"):
+        try:
+            answer = await asyncresolver.resolve(host, record_type)
+        except (resolver.NoAnswer, resolver.NXDOMAIN):
+            continue
+        except exception.DNSException as e:
+            raise OSError(f"Cannot resolve {host}: {e}") from e
+        addresses.extend(record.to_text() for record in answer)
+        ttls.append(float(answer.rrset.ttl))
+    if not addresses:
+        # Names only the system knows (/etc/hosts, search domains)
+        return await resolve_with_getaddrinfo(host)
+    return addresses, min(ttls)
+
+
+class DnsEntry:
+    """Addresses of one host and when to look them up again"""
+
+    __slots__ = ("addresses", "ttl", "resolved_at", "refresh_at", "last_used")
+
+    def __init__(self, addresses: List[str], ttl: float, now: float):
+        self.addresses = addresses
+        self.ttl = ttl
+        self.resolved_at = now
+        # Refreshed before it expires, so lookups keep hitting
+        self.refresh_at = now + ttl * 0.8
+        self.last_used = now
+
+
+class DnsCache:
+    """Addresses of upstream hosts, kept fresh in the background
+
+    A host is looked up on the request path only the first time it is
+    connected to (warm-up does that ahead of traffic). Entries are resolved
+    again before their TTL runs out by a background task; while a refresh
+    is pending or failing the previous addresses are used. Hosts not
+    connected to for ``idle_expiry`` seconds are dropped instead.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 30.0,
+        max_ttl: float = 300.0,
+        idle_expiry: float = 600.0,
+        refresh_interval: float = 1.0,
+        resolve: Optional[Resolve] = None,
+    ):
+        # Used when the resolver does not report a TTL
+        self.ttl = ttl
+        self.max_ttl = max_ttl
+        self.idle_expiry = idle_expiry
+        self.refresh_interval = refresh_interval
+        if resolve is None:
+            resolve = (
+                resolve_with_dnspython
+                if _dnspython_available()
+                else resolve_with_getaddrinfo
+            )
+        self._resolve = resolve
+        self.entries: Dict[str, DnsEntry] = {}
+        self._lookups: Dict[str, "asyncio.Future[List[str]]"] = {}
+        self._refreshes: Set["asyncio.Task[None]"] = set()
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def resolve(self, host: str) -> List[str]:
+        """Addresses to connect to for ``host``, from the cache when possible"""
+        if is_ip_address(host):
+            return [host]
+        entry = self.entries.get(host)
+        if entry is None:
+            DNS_RESOLUTIONS.labels(result="miss").inc()
+            return await self.lookup(host)
+        now = time.monotonic()
+        entry.last_used = now
+        if now >= entry.refresh_at and host not in self._lookups:
+            # The background refresh is late; never wait for it here
+            task = asyncio.ensure_future(self._refresh(host))
+            self._refreshes.add(task)
+            task.add_done_callback(self._refreshes.discard)
+        DNS_RESOLUTIONS.labels(result="hit").inc()
+        return entry.addresses
+
+    async def lookup(self, host: str) -> List[str]:
+        """Resolve ``host`` now and cache it; concurrent lookups share one query"""
+        pending = self._lookups.get(host)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future: "asyncio.Future[List[str]]" = asyncio.ensure_future(self._query(host))
+        self._lookups[host] = future
+        future.add_done_callback(lambda _: self._lookups.pop(host, None))
+        return await asyncio.shield(future)
+
+    async def _query(self, host: str) -> List[str]:
+        try:
+            addresses, ttl = await self._resolve(host)
+            if not addresses:
+                raise OSError(f"No addresses for {host}")
+        except Exception:
+            DNS_RESOLUTIONS.labels(result="error").inc()
+            raise
+        ttl = self.ttl if ttl is None else min(max(ttl, 1.0), self.max_ttl)
+        self.entries[host] = DnsEntry(addresses, ttl, time.monotonic())
+        return addresses
+
+    async def _refresh(self, host: str) -> None:
+        entry = self.entries.get(host)
+        try:
+            await self.lookup(host)
+            DNS_RESOLUTIONS.labels(result="refresh").inc()
+        except Exception as e:
+            # Keep the last known addresses and try again shortly
+            if entry is not None:
+                entry.refresh_at = time.monotonic() + min(entry.ttl, 5.0)
+            logger.warning("DNS refresh failed", host=host, error=str(e))
+
+    async def refresh_due(self) -> None:
+        """Refresh entries about to expire and drop those no longer used"""
+        now = time.monotonic()
+        for host, entry in list(self.entries.items()):
+            if now - entry.last_used > self.idle_expiry:
+                del self.entries[host]
+            elif now >= entry.refresh_at and host not in self._lookups:
+                await self._refresh(host)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.refresh_due()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for task in list(self._refreshes):
+            task.cancel()
+        await asyncio.gather(*self._refreshes, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        return {
+            host: {
+                "addresses": entry.addresses,
+                "ttl": entry.ttl,
+                "age": round(now - entry.resolved_at, 3),
+            }
+            for host, entry in self.entries.items()
+        }
+
+
+class CachedDnsBackend(httpcore.AsyncNetworkBackend):
+    """httpcore network backend connecting to addresses from a DnsCache
+
+    TLS still verifies and sends SNI for the host name, since httpcore
+    takes it from the request URL rather than from the connected address.
+    """
+
+    def __init__(
+        self, cache: DnsCache, backend: Optional[httpcore.AsyncNetworkBackend] = None
+    ):
+        self.cache = cache
+        self.backend = backend or httpcore.AnyIOBackend()
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: Optional[float] = None,
+        local_address: Optional[str] = None,
+        socket_options: Optional[Iterable[Any]] = None,
+    ) -> httpcore.AsyncNetworkStream:
+        try:
+            addresses = await self.cache.resolve(host)
+        except OSError as e:
+            raise httpcore.ConnectError(str(e)) from e
+        error = httpcore.ConnectError(f"No address for {host}")
+        for address in addresses:
+            try:
+                return await self.backend.connect_tcp(
+                    address,
+                    port,
+                    timeout=timeout,
+                    local_address=local_address,
+                    socket_options=socket_options,
+                )
+            except httpcore.ConnectError as e:
+                # Try the host's next address
+                error = e
+        raise error
+
+    async def connect_unix_socket(
+        self,
+        path: str,
+        timeout: Optional[float] = None,
+        socket_options: Optional[Iterable[Any]] = None,
+    ) -> httpcore.AsyncNetworkStream:
+        return await self.backend.connect_unix_socket(
+            path, timeout=timeout, socket_options=socket_options
+        )
+
+    async def sleep(self, seconds: float) -> None:
+        await self.backend.sleep(seconds)
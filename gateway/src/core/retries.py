@@ -0,0 +1,175 @@
+# --------------------------------------------------------------------------
+# Hedged requests and budgeted retries for idempotent upstream calls
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import httpx
+
+from .metrics import HEDGE_WINS, UPSTREAM_RETRIES
+
+# Methods that may be sent twice without changing the outcome (RFC 9110)
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+# Methods eligible for hedging
+HEDGEABLE_METHODS = frozenset({"GET", "HEAD"})
+
+# Errors raised before the upstream could have acted on the request
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+# Defaults applied to a service's "retries" section
+DEFAULT_RETRY_CONFIG: Dict[str, Any] = {
+    "max_retries": 1,
+}
+
+# Defaults applied to a service's "hedging" section
+DEFAULT_HEDGING_CONFIG: Dict[str, Any] = {
+    "enabled": True,
+    # Send the hedge once this percentile of recent latency has elapsed
+    "percentile": 95,
+    "min_delay": 0.005,
+    # Hedging starts only once enough latencies have been observed
+    "min_samples": 20,
+}
+
+
+def retry_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    return {**DEFAULT_RETRY_CONFIG, **config.get("retries", {})}
+
+
+def hedging_settings(config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Hedging settings of a service, or None when it does not hedge"""
+    hedging = config.get("hedging")
+    if hedging is True:
+        hedging = {}
+    if not isinstance(hedging, dict):
+        return None
+    hedging = {**DEFAULT_HEDGING_CONFIG, **hedging}
+    return hedging if hedging["enabled"] else None
+
+
+class LatencyTracker:
+    """Recent upstream latencies per service, for hedge delays"""
+
+    def __init__(self, window: int = 500, refresh_every: int = 50):
+        self.window = window
+        self.refresh_every = refresh_every
+        self._samples: Dict[str, Deque[float]] = {}
+        self._fresh_samples: Dict[str, int] = {}
+        self._percentiles: Dict[str, Dict[int, float]] = {}
+
+    def record(self, service_name: str, latency: float) -> None:
+        samples = self._samples.get(service_name)
+        if samples is None:
+            samples = self._samples[service_name] = deque(maxlen=self.window)
+        samples.append(latency)
+        self._fresh_samples[service_name] = self._fresh_samples.get(service_name, 0) + 1
+
+    def percentile(self, service_name: str, percentile: int) -> Optional[float]:
+        """Latency percentile, recomputed only every refresh_every samples"""
+        samples = self._samples.get(service_name)
+        if not samples:
+            return None
+
+        cached = self._percentiles.setdefault(service_name, {})
+        if (
+            percentile not in cached
+            or self._fresh_samples[service_name] >= self.refresh_every
+        ):
+            ordered = sorted(samples)
+            if self._fresh_samples[service_name] >= self.refresh_every:
+                cached.clear()
+                self._fresh_samples[service_name] = 0
+            index = min(int(len(ordered) * percentile / 100), len(ordered) - 1)
+            cached[percentile] = ordered[index]
+        return cached[percentile]
+
+    def hedge_delay(self, service_name: str, config: Dict[str, Any]) -> Optional[float]:
+        """Time to wait before hedging, None while there is too little data"""
+        if len(self._samples.get(service_name, ())) < config["min_samples"]:
+            return None
+        delay = self.percentile(service_name, config["percentile"])
+        return None if delay is None else max(delay, config["min_delay"])
+
+    def remove(self, service_name: str) -> None:
+        self._samples.pop(service_name, None)
+        self._fresh_samples.pop(service_name, None)
+        self._percentiles.pop(service_name, None)
+
+
+class RetryBudget:
+    """Caps retries and hedges at a share of overall traffic
+
+    Every request deposits ``ratio`` of a token and every retry or hedge
+    withdraws one, over a sliding window of ``window`` seconds, plus a
+    floor of ``min_per_second`` so low-traffic services can still retry.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, window: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        # Per-second buckets of [second, requests, retries]
+        self._buckets: Deque[List[int]] = deque()
+        self.rejected = 0
+
+    def _bucket(self, now: float) -> List[int]:
+        second = int(now)
+        if not self._buckets or self._buckets[-1][0] != second:
+            self._buckets.append([second, 0, 0])
+        horizon = now - self.window
+        while self._buckets[0][0] < horizon:
+            self._buckets.popleft()
+        return self._buckets[-1]
+
+    def deposit(self) -> None:
+        """Count a request against the budget"""
+        self._bucket(time.monotonic())[1] += 1
+
+    def withdraw(self) -> bool:
+        """Take one retry from the budget, returning False when it is spent"""
+        bucket = self._bucket(time.monotonic())
+        requests = sum(b[1] for b in self._buckets)
+        retries = sum(b[2] for b in self._buckets)
+        if retries >= self.min_per_second * self.window + self.ratio * requests:
+            self.rejected += 1
+            return False
+        bucket[2] += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        self._bucket(time.monotonic())
+        return {
+            "ratio": self.ratio,
+            "min_per_second": self.min_per_second,
+            "window": self.window,
+            "requests": sum(b[1] for b in self._buckets),
+            "retries": sum(b[2] for b in self._buckets),
+            "rejected": self.rejected,
+        }
+
+
+class RetryPolicy:
+    """Global retry budget plus latency history and counters per service"""
+
+    def __init__(self, budget: RetryBudget):
+        self.budget = budget
+        self.latencies = LatencyTracker()
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    def count(self, service_name: str, event: str) -> None:
+        """Count a retry, hedge or hedge win of a service"""
+        counters = self.counters.setdefault(
+            service_name, {"retries": 0, "hedges": 0, "hedge_wins": 0}
+        )
+        counters[event] += 1
+        if event == "hedge_wins":
+            HEDGE_WINS.labels(service=service_name).inc()
+        else:
+            UPSTREAM_RETRIES.labels(service=service_name, kind=event[:-1]).inc()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"budget": self.budget.stats(), "services": self.counters}
@@ -3,12 +3,48 @@
 #
 # @author bnbong bbbong9@gmail.com
 # --------------------------------------------------------------------------
-from typing import Dict, Any
-from fastapi import APIRouter, Request, Response, HTTPException, Depends
-from fastapi.responses import StreamingResponse
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+import httpx
+from fastapi import APIRouter, Request, Response, HTTPException, Depends, Query, WebSocket
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.requests import HTTPConnection
 import structlog
 
-from .services import ServiceRegistry, ServiceProxy
+from ..config import settings
+from .auth import AuthError, bearer_token, identity_headers, token_scopes
+from .balancer import NoEndpointAvailable
+from .cache import BYPASS, MISS, CachedResponse
+from .circuit_breaker import CircuitOpenError
+from .compression import ServiceCompression, vary_accept_encoding
+from .concurrency import ConcurrencyLimitExceeded
+from .connections import (
+    CLOSE_INTERNAL_ERROR,
+    CLOSE_POLICY_VIOLATION,
+    CLOSE_TRY_AGAIN_LATER,
+    EVENT_STREAM,
+    UPSTREAM_HANDSHAKE_ERRORS,
+    WEBSOCKET,
+    ConnectionLimitExceeded,
+    WebSocketRelay,
+    accepts_event_stream,
+    relay_event_stream,
+)
+from .deadlines import DeadlineExceeded, count_exceeded
+from .metrics import RATE_LIMIT_REJECTIONS
+from .profiler import PROFILE_MODES, ProfilerBusy, profiler
+from .ratelimit import rate_limit_headers, rate_limit_settings
+from .routes import Route
+from .services import (
+    ServiceProxy,
+    ServiceRegistry,
+    filter_response_headers,
+    iter_request_body,
+)
+from .snapshot import InvalidServiceConfig
+from .tracing import traced
 
 logger = structlog.get_logger()
 router = APIRouter()
@@ -22,17 +58,67 @@ async def get_service_registry(request: Request) -> ServiceRegistry:
 async def get_service_proxy(request: Request) -> ServiceProxy:
     """Get service proxy from request state"""
     service_registry = request.app.state.service_registry
-    return ServiceProxy(service_registry)
+    client_ip = request.client.host if request.client else None
+    timings = getattr(request.state, "timings", None)
+    return ServiceProxy(service_registry, client_ip=client_ip, timings=timings)
+
+
+async def require_admin(request: Request) -> Dict[str, Any]:
+    """Claims of the request's bearer token, which must grant ADMIN_SCOPE
+    
+    The guard of every admin endpoint: 401 without a valid token, 403 when
+    the token lacks the scope.
+    """
+    token = bearer_token(request.headers.get("authorization"))
+    if token is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    claims = await _verify_token(request, token)
+    if settings.ADMIN_SCOPE not in token_scopes(claims):
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return claims
 
 
 @router.get("/services")
 async def list_services(
+    request: Request,
+    service_registry: ServiceRegistry = Depends(get_service_registry)
+) -> Response:
+    """List all registered services
+    
+    The body is serialized once per registry snapshot and tagged with the
+    snapshot version, so unchanged registries answer 304 to If-None-Match.
+    """
+    snapshot = service_registry.snapshot
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == snapshot.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(snapshot.services_body, media_type="application/json", headers=headers)
+
+
+@router.get("/services/circuits")
+async def circuit_states(
     service_registry: ServiceRegistry = Depends(get_service_registry)
 ) -> Dict[str, Any]:
-    """List all registered services"""
-    services = service_registry.list_services()
+    """Report live circuit breaker state of every service"""
+    return {"circuit_breakers": service_registry.circuit_states()}
+
+
+@router.get("/services/health")
+async def services_health(
+    service_registry: ServiceRegistry = Depends(get_service_registry)
+) -> Dict[str, Any]:
+    """Report cached health of every service in one call"""
+    services = service_registry.all_health()
     return {
-        "services": services,
+        "services": {
+            name: health or {"healthy": None, "endpoints": {}}
+            for name, health in services.items()
+        },
+        "healthy": sum(1 for health in services.values() if health and health["healthy"]),
         "count": len(services)
     }
 
@@ -44,48 +130,400 @@ async def service_health(
 ) -> Dict[str, Any]:
     """Check health of a specific service"""
     is_healthy = await service_registry.health_check(service_name)
+    health = service_registry.service_health(service_name) or {}
     return {
         "service": service_name,
-        "healthy": is_healthy
+        "healthy": is_healthy,
+        "endpoints": health.get("endpoints", {})
     }
 
 
-@router.api_route("/{service_name}/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
-async def proxy_request(
+@router.post("/admin/services")
+async def add_service(
+    service_data: Dict[str, Any],
+    service_registry: ServiceRegistry = Depends(get_service_registry)
+) -> Dict[str, Any]:
+    """Add a new service to the registry (admin only)"""
+    # TODO: Add authentication/authorization
+    name = service_data.get("name")
+    config = service_data.get("config", {})
+    
+    if not name:
+        raise HTTPException(status_code=400, detail="Service name is required")
+    
+    success = await service_registry.add_service(name, config)
+    if not success:
+        raise HTTPException(status_code=400, detail="Failed to add service")
+    
+    return {"message": f"Service '{name}' added successfully"}
+
+
+@router.post("/admin/services/reload", dependencies=[Depends(require_admin)])
+async def reload_services(
+    service_registry: ServiceRegistry = Depends(get_service_registry)
+) -> Dict[str, Any]:
+    """Reload the services file into a new registry snapshot (admin only)"""
+    try:
+        snapshot = await service_registry.reload()
+    except InvalidServiceConfig as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"version": snapshot.version, "count": len(snapshot.services)}
+
+
+@router.get("/admin/registry", dependencies=[Depends(require_admin)])
+async def registry_status(
+    service_registry: ServiceRegistry = Depends(get_service_registry)
+) -> Dict[str, Any]:
+    """Registry version of this worker and of every synced worker (admin only)"""
+    snapshot = service_registry.snapshot
+    status: Dict[str, Any] = {"version": snapshot.version, "etag": snapshot.etag}
+    if service_registry.sync is None:
+        status["sync"] = None
+    else:
+        status["sync"] = await service_registry.sync.stats()
+    return status
+
+
+@router.delete("/admin/services/{service_name}")
+async def remove_service(
     service_name: str,
+    service_registry: ServiceRegistry = Depends(get_service_registry)
+) -> Dict[str, Any]:
+    """Remove a service from the registry (admin only)"""
+    # TODO: Add authentication/authorization
+    success = await service_registry.remove_service(service_name)
+    if not success:
+        raise HTTPException(status_code=404, detail=f"Service '{service_name}' not found")
+    
+    return {"message": f"Service '{service_name}' removed successfully"}
+
+
+@router.get("/admin/pools", dependencies=[Depends(require_admin)])
+async def list_pools(
+    service_registry: ServiceRegistry = Depends(get_service_registry)
+) -> Dict[str, Any]:
+    """Report upstream connection pool occupancy per service (admin only)"""
+    return {"pools": service_registry.pool_manager.pool_stats()}
+
+
+@router.get("/admin/cache", dependencies=[Depends(require_admin)])
+async def cache_stats(
+    service_registry: ServiceRegistry = Depends(get_service_registry)
+) -> Dict[str, Any]:
+    """Report response cache counters per service (admin only)"""
+    return {"caches": service_registry.response_caches.stats()}
+
+
+@router.delete("/admin/cache", dependencies=[Depends(require_admin)])
+async def purge_cache(
+    path_prefix: Optional[str] = None,
+    service_registry: ServiceRegistry = Depends(get_service_registry)
+) -> Dict[str, Any]:
+    """Purge the response cache of every service (admin only)"""
+    purged = service_registry.response_caches.purge(path_prefix=path_prefix)
+    return {"message": "Response caches purged", "purged": purged}
+
+
+@router.delete("/admin/cache/{service_name}", dependencies=[Depends(require_admin)])
+async def purge_service_cache(
+    service_name: str,
+    path_prefix: Optional[str] = None,
+    service_registry: ServiceRegistry = Depends(get_service_registry)
+) -> Dict[str, Any]:
+    """Purge the response cache of a service (admin only)"""
+    if service_registry.response_caches.get(service_name) is None:
+        raise HTTPException(status_code=404, detail=f"No response cache for service '{service_name}'")
+    
+    purged = service_registry.response_caches.purge(service_name, path_prefix)
+    return {"message": f"Response cache of '{service_name}' purged", "purged": purged}
+
+
+@router.get("/admin/coalescing", dependencies=[Depends(require_admin)])
+async def coalescing_stats(
+    service_registry: ServiceRegistry = Depends(get_service_registry)
+) -> Dict[str, Any]:
+    """Report how many requests were collapsed per service (admin only)"""
+    return {"coalescing": service_registry.coalescer.stats()}
+
+
+@router.get("/admin/retries", dependencies=[Depends(require_admin)])
+async def retry_stats(
+    service_registry: ServiceRegistry = Depends(get_service_registry)
+) -> Dict[str, Any]:
+    """Report the retry budget and retry/hedge counters per service (admin only)"""
+    return {"retries": service_registry.retry_policy.stats()}
+
+
+@router.get("/admin/compression", dependencies=[Depends(require_admin)])
+async def compression_stats(
+    service_registry: ServiceRegistry = Depends(get_service_registry)
+) -> Dict[str, Any]:
+    """Report compression ratio and CPU time per service (admin only)"""
+    return {"compression": service_registry.compression.stats()}
+
+
+@router.get("/admin/auth", dependencies=[Depends(require_admin)])
+async def auth_stats(request: Request) -> Dict[str, Any]:
+    """Report signing keys and cached verified tokens (admin only)"""
+    authenticator = getattr(request.app.state, "authenticator", None)
+    return {"auth": authenticator.stats() if authenticator is not None else None}
+
+
+@router.get("/admin/endpoints", dependencies=[Depends(require_admin)])
+async def list_endpoints(
+    service_registry: ServiceRegistry = Depends(get_service_registry)
+) -> Dict[str, Any]:
+    """Report load balancer state of every service (admin only)"""
+    return {"services": service_registry.balancers.stats()}
+
+
+@router.get("/admin/routes", dependencies=[Depends(require_admin)])
+async def list_routes(
+    service_registry: ServiceRegistry = Depends(get_service_registry)
+) -> Dict[str, Any]:
+    """Report the compiled route table (admin only)"""
+    routes = service_registry.route_table.routes
+    return {"routes": [route.describe() for route in routes], "count": len(routes)}
+
+
+@router.get("/admin/concurrency", dependencies=[Depends(require_admin)])
+async def concurrency_stats(
+    service_registry: ServiceRegistry = Depends(get_service_registry)
+) -> Dict[str, Any]:
+    """Report the adaptive concurrency limit, queue and shed requests per service (admin only)"""
+    return {"concurrency": service_registry.concurrency.stats()}
+
+
+@router.get("/admin/connections", dependencies=[Depends(require_admin)])
+async def connection_stats(
+    service_registry: ServiceRegistry = Depends(get_service_registry)
+) -> Dict[str, Any]:
+    """Report open WebSocket and event-stream connections per service (admin only)"""
+    return {"connections": service_registry.connections.stats()}
+
+
+@router.get("/admin/warmup", dependencies=[Depends(require_admin)])
+async def warmup_stats(
+    service_registry: ServiceRegistry = Depends(get_service_registry)
+) -> Dict[str, Any]:
+    """Report upstream warm-up results and cached DNS entries (admin only)"""
+    return {"warmup": service_registry.warmup.stats()}
+
+
+@router.post("/admin/profile", response_model=None)
+async def profile(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(10.0, ge=1, le=1000),
+    mode: str = Query("all"),
+    output: str = Query("collapsed"),
+    idle: bool = False,
+    claims: Dict[str, Any] = Depends(require_admin)
+) -> Any:
+    """Sample this worker's Python stacks for a while (admin only)
+    
+    ``mode=requests`` only samples requests sent with ``X-Profile`` while
+    the profile runs. The collapsed stacks are ready for flamegraph.pl or
+    speedscope; ``output=json`` returns them with the sample counts.
+    """
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if mode not in PROFILE_MODES or output not in ("collapsed", "json"):
+        raise HTTPException(status_code=400, detail="Unknown profile mode or output")
+    if seconds > settings.PROFILING_MAX_SECONDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Profiles last at most {settings.PROFILING_MAX_SECONDS:g} seconds"
+        )
+    logger.info("Profile requested", user=claims.get("sub"), mode=mode, seconds=seconds)
+    try:
+        profiler.start(mode, interval_ms / 1000, idle)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        # Also when the client gives up waiting
+        result = profiler.stop()
+    if output == "json":
+        return result.to_dict()
+    return PlainTextResponse(result.collapsed())
+
+
+@router.websocket("/{path:path}")
+async def proxy_websocket(websocket: WebSocket, path: str) -> None:
+    """Proxy a WebSocket connection to the backend service of the matching route"""
+    service_registry: ServiceRegistry = websocket.app.state.service_registry
+    route = service_registry.match_route(f"/{path}", websocket.headers.get("host"), "GET")
+    if route is None:
+        await websocket.close(code=CLOSE_POLICY_VIOLATION, reason="No route")
+        return
+    service_name = route.service
+    try:
+        await _check_rate_limits(websocket, route, service_registry)
+        claims = await _authenticate(websocket, route)
+    except HTTPException as e:
+        # The handshake is refused; close codes are all a client can see
+        code = CLOSE_TRY_AGAIN_LATER if e.status_code >= 500 else CLOSE_POLICY_VIOLATION
+        await websocket.close(code=code, reason=str(e.detail))
+        return
+    
+    try:
+        slot = service_registry.connections.acquire(service_name, WEBSOCKET)
+    except ConnectionLimitExceeded as e:
+        logger.warning("Connection limit reached", service_name=service_name, protocol=WEBSOCKET)
+        await websocket.close(code=CLOSE_TRY_AGAIN_LATER, reason=str(e))
+        return
+    
+    client_ip = websocket.client.host if websocket.client else None
+    service_proxy = ServiceProxy(service_registry, client_ip=client_ip, route=route)
+    connection_config = service_registry.connections.get(service_name)
+    try:
+        try:
+            upstream, attempt = await service_proxy.open_websocket(
+                service_name,
+                route.upstream_path(f"/{path}"),
+                identity_headers(dict(websocket.headers), claims),
+                dict(websocket.query_params),
+                websocket.scope.get("subprotocols", [])
+            )
+        except (CircuitOpenError, NoEndpointAvailable):
+            await websocket.close(code=CLOSE_TRY_AGAIN_LATER, reason="Service unavailable")
+            return
+        except DeadlineExceeded as e:
+            count_exceeded(service_name, e)
+            await websocket.close(code=CLOSE_TRY_AGAIN_LATER, reason="Deadline exceeded")
+            return
+        except UPSTREAM_HANDSHAKE_ERRORS:
+            await websocket.close(code=CLOSE_INTERNAL_ERROR, reason="Upstream unavailable")
+            return
+        
+        try:
+            await websocket.accept(subprotocol=upstream.subprotocol)
+            relay = WebSocketRelay(
+                websocket,
+                upstream,
+                service_name,
+                idle_timeout=connection_config["idle_timeout"],
+                max_message_size=connection_config["max_message_size"]
+            )
+            await relay.run()
+        finally:
+            attempt.release()
+    finally:
+        slot.release()
+
+
+@router.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
+async def proxy_request(
     path: str,
     request: Request,
+    service_registry: ServiceRegistry = Depends(get_service_registry),
     service_proxy: ServiceProxy = Depends(get_service_proxy)
 ) -> Response:
-    """Proxy request to backend service"""
+    """Proxy request to the backend service of the matching route"""
+    route = service_registry.match_route(f"/{path}", request.headers.get("host"), request.method)
+    if route is None:
+        raise HTTPException(status_code=404, detail=f"No route for '/{path}'")
+    service_name = route.service
+    service_proxy.route = route
+    upstream_path = route.upstream_path(f"/{path}")
+    # Label metrics with the route prefix rather than the request path
+    mount = request.url.path[: len(request.url.path) - len(path)].rstrip("/")
+    service_proxy.timings.endpoint = f"{mount}{route.prefix}"
+    service_proxy.timings.service = service_name
+    service_proxy.timings.log_sample_rate = route.log_sample_rate
+    # The budget starts now, so time spent in the gateway counts against it
+    deadline = service_proxy.start_deadline(service_name, request.headers)
+    await _check_rate_limits(request, route, service_registry)
+    claims = await _authenticate(request, route)
+    
     try:
-        # Get request body
-        body = await request.body()
+        # A client that has already given up is not worth an upstream call
+        deadline.check("gateway")
         
         # Get query parameters
         params = dict(request.query_params)
         
-        # Get headers
-        headers = dict(request.headers)
+        # Get headers, with identity headers only from verified claims
+        headers = identity_headers(dict(request.headers), claims)
+        compression = service_registry.compression.get(service_name)
+        
+        if accepts_event_stream(headers):
+            return await _proxy_event_stream(
+                service_proxy, service_name, upstream_path, request, headers, params
+            )
+        
+        if request.method == "GET" and service_proxy.is_cacheable(service_name):
+            entry, outcome = await service_proxy.forward_cached_request(
+                service_name=service_name,
+                path=upstream_path,
+                headers=headers,
+                params=params
+            )
+            return _cached_response(entry, outcome, headers, compression)
+        
+        if request.method == "GET" and service_proxy.is_coalescing(service_name):
+            entry = await service_proxy.forward_coalesced_request(
+                service_name=service_name,
+                path=upstream_path,
+                headers=headers,
+                params=params
+            )
+            return _buffered_response(entry, compression, headers.get("accept-encoding"))
+        
+        if service_proxy.is_streaming(service_name):
+            return await _stream_proxy_request(
+                service_proxy, service_name, upstream_path, request, headers, params
+            )
+        
+        # Get request body
+        body = await request.body()
         
         # Forward request
         response = await service_proxy.forward_request(
             service_name=service_name,
             method=request.method,
-            path=f"/{path}",
+            path=upstream_path,
             headers=headers,
             body=body if body else None,
             params=params
         )
         
         # Create response
-        return StreamingResponse(
-            iter([response.content]),
-            status_code=response.status_code,
-            headers=dict(response.headers),
-            media_type=response.headers.get("content-type")
-        )
+        content = response.content
+        raw_headers = filter_response_headers(response.headers, decoded=True)
+        if compression is not None:
+            content, raw_headers = compression.encode_response(
+                response.status_code, raw_headers, content, headers.get("accept-encoding")
+            )
+        proxied = Response(content=content, status_code=response.status_code)
+        proxied.raw_headers = raw_headers
+        proxied.headers["content-length"] = str(len(content))
+        return proxied
         
+    except CircuitOpenError as e:
+        logger.warning("Circuit open, failing fast", service_name=service_name, error=str(e))
+        raise HTTPException(
+            status_code=503,
+            detail=f"Service '{service_name}' is unavailable",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except NoEndpointAvailable as e:
+        logger.error("No upstream endpoint available", service_name=service_name, error=str(e))
+        raise HTTPException(status_code=503, detail=f"Service '{service_name}' is unavailable")
+    except ConnectionLimitExceeded as e:
+        logger.warning("Connection limit reached", service_name=service_name, protocol=EVENT_STREAM)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ConcurrencyLimitExceeded:
+        # Shed before reaching the upstream, so a retry elsewhere is safe
+        raise HTTPException(
+            status_code=503,
+            detail=f"Service '{service_name}' is overloaded",
+            headers={"Retry-After": "1"},
+        )
+    except (DeadlineExceeded, httpx.TimeoutException) as e:
+        count_exceeded(service_name, e)
+        raise HTTPException(status_code=504, detail=f"Service '{service_name}' did not answer in time")
     except ValueError as e:
         logger.error("Service not found", service_name=service_name, error=str(e))
         raise HTTPException(status_code=404, detail=f"Service '{service_name}' not found")
@@ -94,35 +532,226 @@ async def proxy_request(
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
-@router.post("/admin/services")
-async def add_service(
-    service_data: Dict[str, Any],
-    service_registry: ServiceRegistry = Depends(get_service_registry)
+@traced("rate_limit.route")
+async def _check_rate_limits(
+    request: HTTPConnection,
+    route: Route,
+    service_registry: ServiceRegistry
+) -> None:
+    """Enforce the per-client limits of the service and the route
+    
+    The tightest decision is left in ``request.state.rate_limit`` for the
+    rate limit middleware to turn into ``RateLimit-*`` headers.
+    """
+    limiter = getattr(request.app.state, "rate_limiter", None)
+    if limiter is None:
+        return
+    client_ip = request.client.host if request.client else "unknown"
+    service_config = service_registry.services.get(route.service, {})
+    # The narrower limit first, so its denials do not use up the service's
+    limits = [
+        (f"route:{route.service}{route.prefix}:{client_ip}", route.rate_limit),
+        (
+            f"service:{route.service}:{client_ip}",
+            rate_limit_settings(service_config.get("rate_limit"))
+        ),
+    ]
+    
+    tightest = None
+    for key, resolved in limits:
+        if resolved is None:
+            continue
+        decision = await limiter.check(key, *resolved)
+        if tightest is None or decision.remaining < tightest.remaining:
+            tightest = decision
+        if not decision.allowed:
+            request.state.rate_limit = decision
+            RATE_LIMIT_REJECTIONS.labels(limit=key.partition(":")[0]).inc()
+            logger.warning(
+                "Rate limit exceeded",
+                client_ip=client_ip,
+                service=route.service,
+                limit_key=key.partition(":")[0],
+            )
+            raise HTTPException(
+                status_code=429,
+                detail="Rate limit exceeded",
+                headers={
+                    name.decode(): value.decode()
+                    for name, value in rate_limit_headers(decision)
+                },
+            )
+    if tightest is not None:
+        request.state.rate_limit = tightest
+
+
+@traced("auth.verify")
+async def _authenticate(request: HTTPConnection, route: Route) -> Optional[Dict[str, Any]]:
+    """Verify the bearer token of a request when its route has an auth policy"""
+    if route.auth is None:
+        return None
+    token = bearer_token(request.headers.get("authorization"))
+    if token is None:
+        if route.auth["required"]:
+            raise HTTPException(
+                status_code=401,
+                detail="Not authenticated",
+                headers={"WWW-Authenticate": "Bearer"}
+            )
+        return None
+    return await _verify_token(request, token, route.service)
+
+
+async def _verify_token(
+    request: HTTPConnection,
+    token: str,
+    service: Optional[str] = None
 ) -> Dict[str, Any]:
-    """Add a new service to the registry (admin only)"""
-    # TODO: Add authentication/authorization
-    name = service_data.get("name")
-    config = service_data.get("config", {})
+    """Claims of a valid bearer token; raises a 401 for an invalid one"""
+    authenticator = getattr(request.app.state, "authenticator", None)
+    if authenticator is None:
+        raise HTTPException(status_code=503, detail="Authentication unavailable")
+    try:
+        return await authenticator.verify(token)
+    except AuthError as e:
+        logger.info("Token rejected", service=service, reason=e.detail)
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid token",
+            headers={"WWW-Authenticate": 'Bearer error="invalid_token"'}
+        )
+
+
+def _buffered_response(
+    entry: CachedResponse,
+    compression: Optional[ServiceCompression] = None,
+    accept_encoding: Optional[str] = None,
+    cacheable: bool = False
+) -> Response:
+    """Build the client response for a fully buffered upstream response"""
+    body, headers = entry.body, entry.headers
+    if compression is not None:
+        body, headers = compression.encode_response(
+            entry.status_code, headers, body, accept_encoding, cacheable
+        )
+    response = Response(content=body, status_code=entry.status_code)
+    response.raw_headers = headers + [
+        (b"content-length", str(len(body)).encode("latin-1"))
+    ]
+    return response
+
+
+def _cached_response(
+    entry: CachedResponse,
+    outcome: str,
+    headers: Dict[str, str],
+    compression: Optional[ServiceCompression] = None
+) -> Response:
+    """Build the client response for an answer of the response cache"""
+    if entry.etag and entry.etag in headers.get("if-none-match", ""):
+        response = Response(status_code=304)
+        raw_headers = [(k, v) for k, v in entry.headers if k != b"content-length"]
+        if compression is not None and compression.compressible(raw_headers):
+            raw_headers = vary_accept_encoding(raw_headers)
+        response.raw_headers = raw_headers
+    else:
+        # Stored entries are shared, so their compressed bodies can be reused;
+        # a private or uncacheable response must not be
+        response = _buffered_response(
+            entry, compression, headers.get("accept-encoding"), cacheable=entry.shared
+        )
+    response.headers["x-cache"] = outcome
+    if outcome != MISS and outcome != BYPASS:
+        response.headers["age"] = str(entry.age(time.monotonic()))
+    return response
+
+
+async def _stream_proxy_request(
+    service_proxy: ServiceProxy,
+    service_name: str,
+    path: str,
+    request: Request,
+    headers: Dict[str, str],
+    params: Dict[str, str],
+) -> Response:
+    """Pipe the request body upstream and the raw response body back"""
+    buffer_size = settings.PROXY_BUFFER_SIZE
+    has_body = "content-length" in headers or "transfer-encoding" in headers
+    body = iter_request_body(request.stream(), buffer_size) if has_body else None
     
-    if not name:
-        raise HTTPException(status_code=400, detail="Service name is required")
+    streamed_body = await service_proxy.stream_request(
+        service_name=service_name,
+        method=request.method,
+        path=path,
+        headers=headers,
+        body=body,
+        params=params,
+        chunk_size=buffer_size
+    )
     
-    success = await service_registry.add_service(name, config)
-    if not success:
-        raise HTTPException(status_code=400, detail="Failed to add service")
+    status_code = streamed_body.response.status_code
+    chunks: AsyncIterator[bytes] = streamed_body
+    raw_headers = filter_response_headers(streamed_body.response.headers)
+    compression = service_proxy.service_registry.compression.get(service_name)
+    if compression is not None:
+        chunks, raw_headers = compression.stream_response(
+            status_code, raw_headers, chunks, headers.get("accept-encoding")
+        )
     
-    return {"message": f"Service '{name}' added successfully"}
+    response = StreamingResponse(
+        chunks,
+        status_code=status_code,
+        background=BackgroundTask(streamed_body.aclose),
+    )
+    response.raw_headers = raw_headers
+    return response
 
 
-@router.delete("/admin/services/{service_name}")
-async def remove_service(
+async def _proxy_event_stream(
+    service_proxy: ServiceProxy,
     service_name: str,
-    service_registry: ServiceRegistry = Depends(get_service_registry)
-) -> Dict[str, Any]:
-    """Remove a service from the registry (admin only)"""
-    # TODO: Add authentication/authorization
-    success = await service_registry.remove_service(service_name)
-    if not success:
-        raise HTTPException(status_code=404, detail=f"Service '{service_name}' not found")
+    path: str,
+    request: Request,
+    headers: Dict[str, str],
+    params: Dict[str, str],
+) -> Response:
+    """Relay server-sent events unbuffered for as long as the client listens"""
+    connections = service_proxy.service_registry.connections
+    idle_timeout = connections.get(service_name)["idle_timeout"]
+    buffer_size = settings.PROXY_BUFFER_SIZE
+    # A POST may open the stream with a body, which is piped upstream
+    has_body = "content-length" in headers or "transfer-encoding" in headers
+    body = iter_request_body(request.stream(), buffer_size) if has_body else None
+    slot = connections.acquire(service_name, EVENT_STREAM)
+    try:
+        streamed_body = await service_proxy.stream_request(
+            service_name=service_name,
+            method=request.method,
+            path=path,
+            headers=headers,
+            body=body,
+            params=params,
+            chunk_size=None,
+            long_lived=True
+        )
+    except BaseException:
+        slot.release()
+        raise
     
-    return {"message": f"Service '{service_name}' removed successfully"}
+    async def close() -> None:
+        try:
+            await streamed_body.aclose()
+        finally:
+            slot.release()
+    
+    # Never compressed: a compressor would hold events back until it flushes
+    response = StreamingResponse(
+        relay_event_stream(streamed_body, slot, idle_timeout),
+        status_code=streamed_body.response.status_code,
+        background=BackgroundTask(close),
+    )
+    # Ask buffering reverse proxies in front of the gateway (nginx) to pass events on
+    response.raw_headers = filter_response_headers(streamed_body.response.headers) + [
+        (b"x-accel-buffering", b"no")
+    ]
+    return response
@@ -0,0 +1,216 @@
+# --------------------------------------------------------------------------
+# Precompiled route table mapping request paths to upstream services
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from .auth import auth_settings
+from .cache import cache_settings
+from .ratelimit import rate_limit_settings
+
+
+def _segments(path: str) -> List[str]:
+    return [segment for segment in path.split("/") if segment]
+
+
+def _normalize_prefix(prefix: str) -> str:
+    return "/" + "/".join(_segments(prefix))
+
+
+class Route:
+    """A path prefix (plus optional host and method conditions) of a service"""
+
+    __slots__ = (
+        "service",
+        "prefix",
+        "hosts",
+        "methods",
+        "strip_prefix",
+        "rewrite",
+        "timeout",
+        "cache",
+        "rate_limit",
+        "log_sample_rate",
+        "auth",
+        "_depth",
+    )
+
+    def __init__(
+        self,
+        service: str,
+        prefix: str,
+        hosts: Iterable[str] = (),
+        methods: Iterable[str] = (),
+        strip_prefix: bool = True,
+        rewrite: Optional[str] = None,
+        timeout: Optional[float] = None,
+        cache: Optional[Dict[str, Any]] = None,
+        rate_limit: Optional[Tuple[int, float]] = None,
+        log_sample_rate: Optional[float] = None,
+        auth: Optional[Dict[str, Any]] = None,
+    ):
+        self.service = service
+        self.prefix = _normalize_prefix(prefix)
+        self.hosts: FrozenSet[str] = frozenset(host.lower() for host in hosts)
+        self.methods: FrozenSet[str] = frozenset(method.upper() for method in methods)
+        self.strip_prefix = strip_prefix
+        self.rewrite = rewrite.rstrip("/") if rewrite is not None else None
+        self.timeout = timeout
+        # Resolved cache settings of the route, None when it is not cached
+        self.cache = cache
+        # Per-client (limit, period seconds) of the route, on top of the service's
+        self.rate_limit = rate_limit
+        # Fraction of successful requests written to the access log
+        self.log_sample_rate = log_sample_rate
+        # Resolved auth policy of the route, None when it is public
+        self.auth = auth
+        self._depth = len(_segments(self.prefix))
+
+    def matches(self, host: Optional[str], method: str) -> bool:
+        """Check the host and method conditions (the prefix already matched)"""
+        if self.methods and method not in self.methods:
+            return False
+        if not self.hosts:
+            return True
+        if host is None:
+            return False
+        if host in self.hosts:
+            return True
+        # "*.example.com" matches any subdomain of example.com
+        _, _, parent = host.partition(".")
+        return f"*.{parent}" in self.hosts
+
+    def upstream_path(self, path: str) -> str:
+        """Path to request from the upstream for a matched request path"""
+        if self.rewrite is None and not self.strip_prefix:
+            return path
+        remainder = "/".join(_segments(path)[self._depth :])
+        if path.endswith("/") and remainder:
+            remainder += "/"
+        return f"{self.rewrite or ''}/{remainder}"
+
+    @property
+    def specificity(self) -> Tuple[int, int]:
+        """Order of routes sharing a prefix: exact hosts, then wildcards, then none"""
+        exact = any(not host.startswith("*.") for host in self.hosts)
+        return (2 if exact else 1 if self.hosts else 0, 1 if self.methods else 0)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "service": self.service,
+            "prefix": self.prefix,
+            "hosts": sorted(self.hosts),
+            "methods": sorted(self.methods),
+            "strip_prefix": self.strip_prefix,
+            "rewrite": self.rewrite,
+            "timeout": self.timeout,
+            "cache": self.cache is not None,
+            "rate_limit": (
+                {"limit": self.rate_limit[0], "period": self.rate_limit[1]}
+                if self.rate_limit is not None
+                else None
+            ),
+            "log_sample_rate": self.log_sample_rate,
+            "auth": self.auth,
+        }
+
+
+class _Node:
+    __slots__ = ("children", "routes")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_Node"] = {}
+        self.routes: List[Route] = []
+
+
+class RouteTable:
+    """Segment trie of routes, matched by longest prefix
+
+    Matching walks the trie once along the request path, so its cost grows
+    with the number of path segments rather than the number of routes.
+    """
+
+    def __init__(self, routes: Iterable[Route] = ()):
+        self._root = _Node()
+        self.routes: List[Route] = []
+        for route in routes:
+            self.add(route)
+
+    def add(self, route: Route) -> None:
+        node = self._root
+        for segment in _segments(route.prefix):
+            node = node.children.setdefault(segment, _Node())
+        node.routes.append(route)
+        # Stable sort keeps the configuration order among equals
+        node.routes.sort(key=lambda r: r.specificity, reverse=True)
+        self.routes.append(route)
+
+    def match(
+        self, path: str, host: Optional[str] = None, method: str = "GET"
+    ) -> Optional[Route]:
+        """The most specific route with the longest prefix of path, if any"""
+        if host is not None:
+            host = host.split(":", 1)[0].lower()
+        node = self._root
+        candidates = [node] if node.routes else []
+        for segment in path.split("/"):
+            if not segment:
+                continue
+            child = node.children.get(segment)
+            if child is None:
+                break
+            node = child
+            if node.routes:
+                candidates.append(node)
+
+        for node in reversed(candidates):
+            for route in node.routes:
+                if route.matches(host, method):
+                    return route
+        return None
+
+    @classmethod
+    def compile(cls, services: Dict[str, Dict[str, Any]]) -> "RouteTable":
+        """Build the table of every service's "routes" plus its default route
+
+        Each service keeps the default ``/{service_name}`` prefix route unless
+        one of its routes already uses that prefix without conditions.
+        """
+        table = cls()
+        for name, config in services.items():
+            rate_limit_settings(config.get("rate_limit"))
+            routes = [_route(name, config, entry) for entry in config.get("routes", [])]
+            default = _route(name, config, {"prefix": f"/{name}"})
+            if not any(
+                r.prefix == default.prefix and not r.hosts and not r.methods
+                for r in routes
+            ):
+                routes.append(default)
+            for route in routes:
+                table.add(route)
+        return table
+
+
+def _route(service: str, config: Dict[str, Any], entry: Dict[str, Any]) -> Route:
+    """Build a route, inheriting unset settings from its service"""
+    service_cache = config.get("cache")
+    cache = entry.get("cache", service_cache)
+    if cache is True:
+        cache = {}
+    if isinstance(cache, dict) and isinstance(service_cache, dict):
+        # Route cache settings refine those of the service
+        cache = {**service_cache, "enabled": True, **cache}
+    return Route(
+        service,
+        entry["prefix"],
+        hosts=entry.get("hosts", []),
+        methods=entry.get("methods", []),
+        strip_prefix=entry.get("strip_prefix", True),
+        rewrite=entry.get("rewrite"),
+        timeout=entry.get("timeout", config.get("timeout")),
+        cache=cache_settings(cache),
+        rate_limit=rate_limit_settings(entry.get("rate_limit")),
+        log_sample_rate=entry.get("log_sample_rate", config.get("log_sample_rate")),
+        auth=auth_settings(entry.get("auth", config.get("auth"))),
+    )
@@ -3,34 +3,149 @@
 #
 # @author bnbong bbbong9@gmail.com
 # --------------------------------------------------------------------------
-import json
+import asyncio
+import time
 import httpx
-from typing import Dict, Optional, Any
+from typing import Any, AsyncIterator, Awaitable, Callable, Collection, Dict, List, Mapping, Optional, Set, Tuple
 from pathlib import Path
 import structlog
 
+from ..config import settings
+from .balancer import BalancerManager, Endpoint, LoadBalancer, NoEndpointAvailable, build_balancer
+from .cache import (
+    BYPASS,
+    HIT,
+    MISS,
+    REVALIDATED,
+    STALE,
+    CachedResponse,
+    ResponseCache,
+    ResponseCacheManager,
+    cache_key,
+    freshness,
+    is_storable,
+    parse_cache_control,
+    vary_names,
+)
+from .circuit_breaker import CircuitBreaker, CircuitBreakerManager
+from .coalescing import DEFAULT_KEY_HEADERS, RequestCoalescer, coalescing_key, is_shareable
+from .compression import CompressionManager
+from .concurrency import ConcurrencyManager, ConcurrencyPermit
+from .connections import (
+    UPSTREAM_HANDSHAKE_ERRORS,
+    ConnectionManager,
+    connect_upstream,
+    connection_settings,
+    websocket_url,
+)
+from .deadlines import DEADLINE_HEADER, Deadline, DeadlineExceeded, phase_timeouts
+from .health import HealthChecker
+from .metrics import UPSTREAM_LATENCY, RequestTimings
+from .pools import ConnectionPoolManager, pool_settings
+from .resolver import DnsCache
+from .retries import (
+    HEDGEABLE_METHODS,
+    IDEMPOTENT_METHODS,
+    RETRYABLE_ERRORS,
+    RetryBudget,
+    RetryPolicy,
+    hedging_settings,
+    retry_settings,
+)
+from .routes import Route, RouteTable
+from .snapshot import (
+    ConfigWatcher,
+    InvalidServiceConfig,
+    RegistrySnapshot,
+    read_services_file,
+    validate_services,
+)
+from .sync import RegistrySync, SyncBackend
+from .tracing import traced, tracer
+from .warmup import WarmupManager, prewarm_settings
+
 logger = structlog.get_logger()
 
+# Connection-scoped headers that must not be forwarded by a proxy (RFC 9110)
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+})
+
+# Headers describing the encoded body, invalid once httpx has decoded it
+DECODED_BODY_HEADERS = frozenset({"content-encoding", "content-length"})
+
 
 class ServiceRegistry:
-    """Service registry for managing API endpoints"""
+    """Service registry for managing API endpoints
+    
+    Services, routes and the serialized ``GET /services`` body live in an
+    immutable ``RegistrySnapshot``; every change builds a new snapshot and
+    swaps it in at once, so a request never sees a half-applied change.
+    """
+    
+    def __init__(
+        self,
+        pool_manager: Optional[ConnectionPoolManager] = None,
+        sync_backend: Optional[SyncBackend] = None
+    ):
+        self.snapshot = RegistrySnapshot.empty()
+        self.config_path = Path(settings.SERVICES_CONFIG_PATH)
+        self.pool_manager = pool_manager or ConnectionPoolManager(
+            dns_cache=DnsCache(settings.DNS_CACHE_TTL, settings.DNS_CACHE_MAX_TTL)
+            if settings.DNS_CACHE_ENABLED else None
+        )
+        self.response_caches = ResponseCacheManager()
+        self.coalescer = RequestCoalescer()
+        self.compression = CompressionManager()
+        self.connections = ConnectionManager()
+        self.concurrency = ConcurrencyManager()
+        self.balancers = BalancerManager()
+        self.breakers = CircuitBreakerManager()
+        self.health_checker = HealthChecker(self)
+        self.warmup = WarmupManager(self)
+        self.retry_policy = RetryPolicy(
+            RetryBudget(settings.RETRY_BUDGET_RATIO, settings.RETRY_BUDGET_MIN_PER_SECOND)
+        )
+        self.watcher = ConfigWatcher(
+            self.config_path,
+            self.reload,
+            interval=settings.CONFIG_POLL_INTERVAL,
+            debounce=settings.CONFIG_RELOAD_DEBOUNCE
+        )
+        self._apply_lock = asyncio.Lock()
+        # Shares admin changes and reloads with the other workers, if set
+        self.sync = (
+            RegistrySync(self, sync_backend, interval=settings.REGISTRY_SYNC_INTERVAL)
+            if sync_backend is not None else None
+        )
+    
+    @property
+    def services(self) -> Mapping[str, Dict[str, Any]]:
+        """Read-only services of the current snapshot"""
+        return self.snapshot.services
     
-    def __init__(self):
-        self.services: Dict[str, Dict[str, Any]] = {}
-        self.http_client = httpx.AsyncClient(timeout=30.0)
+    @property
+    def route_table(self) -> RouteTable:
+        return self.snapshot.route_table
     
     async def initialize(self):
         """Initialize service registry from configuration"""
         try:
             # Load services from JSON config
-            config_path = Path("/app/config/services.json")
-            if config_path.exists():
-                with open(config_path, "r") as f:
-                    self.services = json.load(f)
-                logger.info("Loaded services from configuration", count=len(self.services))
+            if self.config_path.exists():
+                services = read_services_file(self.config_path)
+                self.watcher.mark_applied()
+                logger.info("Loaded services from configuration", count=len(services), path=str(self.config_path))
             else:
                 # Default services for development
-                self.services = {
+                services = {
                     "qshing-server": {
                         "url": "https://qshing-server.example.com",
                         "health_check": "/health",
@@ -44,34 +159,156 @@ class ServiceRegistry:
                         "rate_limit": 100
                     }
                 }
-                logger.info("Using default services configuration", count=len(self.services))
+                logger.info("Using default services configuration", count=len(services))
         except Exception as e:
             logger.error("Failed to initialize service registry", error=str(e))
-            self.services = {}
+            services = {}
+        
+        await self.apply(services)
+        if self.sync is not None:
+            # The shared registry wins over this worker's copy of the file
+            await self.sync.start()
+        if settings.CONFIG_WATCH:
+            await self.watcher.start()
+    
+    async def reload(self) -> RegistrySnapshot:
+        """Apply the services file again; raises InvalidServiceConfig if it is invalid"""
+        if not self.config_path.exists():
+            raise InvalidServiceConfig(f"No services file at {self.config_path}")
+        services = read_services_file(self.config_path)
+        if self.sync is not None and services == dict(self.snapshot.services):
+            # Another worker already published this file
+            return self.snapshot
+        snapshot = await self._change(lambda _: services)
+        logger.info("Services file reloaded", version=snapshot.version, path=str(self.config_path))
+        return snapshot
+    
+    async def _change(
+        self,
+        mutate: Callable[[Dict[str, Dict[str, Any]]], Dict[str, Dict[str, Any]]]
+    ) -> RegistrySnapshot:
+        """Apply a change here, or through the sync backend to every worker"""
+        if self.sync is not None:
+            return await self.sync.update(mutate)
+        return await self.apply(mutate(dict(self.snapshot.services)))
+    
+    async def apply(
+        self,
+        services: Dict[str, Dict[str, Any]],
+        version: Optional[int] = None
+    ) -> RegistrySnapshot:
+        """Make ``services`` the registered set as a new snapshot
+        
+        Only services whose config changed are rebuilt; the others keep their
+        pools, balancer and breaker state. Replaced pools are drained, not
+        closed, so requests in flight complete. ``version`` is the shared
+        version when the registry is synced, else the next local one.
+        """
+        route_table = self.validate(services)
+        async with self._apply_lock:
+            current = self.snapshot
+            changed, removed = current.changed(services)
+            for name in changed:
+                await self._setup_service(name, services[name])
+            if version is None:
+                version = current.version + 1
+            snapshot = RegistrySnapshot(version, services, route_table)
+            self.snapshot = snapshot
+            for name in removed:
+                await self._teardown_service(name)
+        if changed or removed:
+            logger.info(
+                "Service registry updated",
+                version=snapshot.version,
+                changed=sorted(changed),
+                removed=sorted(removed)
+            )
+        return snapshot
+    
+    def validate(self, services: Dict[str, Dict[str, Any]]) -> RouteTable:
+        """Check a services configuration and compile its route table
+        
+        Besides the routes, the per-service proxy state of every service is
+        built once and thrown away, so a config that ``_setup_service``
+        would fail on is rejected with InvalidServiceConfig before anything
+        is changed, instead of leaving the registry half-applied.
+        """
+        route_table = validate_services(services)
+        for name, config in services.items():
+            try:
+                self._check_service(name, config)
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                raise InvalidServiceConfig(f"Invalid service '{name}': {e}") from e
+        return route_table
+    
+    def _check_service(self, name: str, config: Dict[str, Any]) -> None:
+        """Build what ``_setup_service`` builds, without registering any of it"""
+        balancer = build_balancer(config)
+        self.breakers.build(name, config, [endpoint.url for endpoint in balancer.endpoints])
+        pool_settings(config)
+        self.response_caches.build(name, config)
+        self.compression.build(name, config)
+        connection_settings(config)
+        self.concurrency.build(name, config)
+        prewarm_settings(config)
+    
+    async def _setup_service(self, name: str, config: Dict[str, Any]) -> None:
+        """Create the per-service proxy state (balancer, breakers, pool, cache)"""
+        self.balancers.configure(name, config)
+        endpoints = [endpoint.url for endpoint in self.balancers.get(name).endpoints]
+        self.breakers.configure(name, config, endpoints)
+        await self.pool_manager.create_pool(name, config)
+        self.response_caches.configure(name, config)
+        self.compression.configure(name, config)
+        self.connections.configure(name, config)
+        self.concurrency.configure(name, config)
+        self.health_checker.table.remove(name)
+        self.health_checker.watch(name, config)
+        self.warmup.schedule(name, config)
+    
+    async def _teardown_service(self, name: str) -> None:
+        """Drop the per-service proxy state of a removed service"""
+        self.warmup.cancel(name)
+        await self.pool_manager.remove_pool(name, drain=True)
+        self.response_caches.remove(name)
+        self.compression.remove(name)
+        self.connections.remove(name)
+        self.concurrency.remove(name)
+        self.balancers.remove(name)
+        self.breakers.remove(name)
+        self.health_checker.unwatch(name)
+        self.health_checker.table.remove(name)
+        self.retry_policy.latencies.remove(name)
     
     async def cleanup(self):
         """Cleanup resources"""
-        await self.http_client.aclose()
+        await self.watcher.stop()
+        if self.sync is not None:
+            await self.sync.stop()
+        await self.health_checker.stop()
+        await self.warmup.stop()
+        await self.pool_manager.close()
     
     def get_service(self, service_name: str) -> Optional[Dict[str, Any]]:
         """Get service configuration by name"""
-        return self.services.get(service_name)
+        return self.snapshot.services.get(service_name)
+    
+    def list_services(self) -> Mapping[str, Dict[str, Any]]:
+        """List all registered services (read-only)"""
+        return self.snapshot.services
     
-    def list_services(self) -> Dict[str, Dict[str, Any]]:
-        """List all registered services"""
-        return self.services.copy()
+    def match_route(self, path: str, host: Optional[str], method: str) -> Optional[Route]:
+        """Route of a request path relative to the gateway's API prefix"""
+        return self.snapshot.route_table.match(path, host, method)
+    
+    def circuit_states(self) -> Dict[str, Dict[str, Any]]:
+        """Circuit breaker state of every service"""
+        return self.breakers.stats()
     
     async def add_service(self, name: str, config: Dict[str, Any]) -> bool:
         """Add a new service to the registry"""
         try:
-            # Validate service configuration
-            required_fields = ["url"]
-            for field in required_fields:
-                if field not in config:
-                    logger.error(f"Missing required field: {field}")
-                    return False
-            
-            self.services[name] = config
+            await self._change(lambda services: {**services, name: config})
             logger.info("Service added to registry", service_name=name)
             return True
         except Exception as e:
@@ -80,34 +317,402 @@ class ServiceRegistry:
     
     async def remove_service(self, name: str) -> bool:
         """Remove a service from the registry"""
-        if name in self.services:
-            del self.services[name]
-            logger.info("Service removed from registry", service_name=name)
-            return True
-        return False
+        if name not in self.snapshot.services:
+            return False
+        await self._change(
+            lambda services: {key: value for key, value in services.items() if key != name}
+        )
+        logger.info("Service removed from registry", service_name=name)
+        return True
     
     async def health_check(self, service_name: str) -> bool:
-        """Check health of a service"""
-        service = self.get_service(service_name)
-        if not service:
-            return False
+        """Check health of a service
         
-        try:
-            health_url = f"{service['url']}{service.get('health_check', '/health')}"
-            response = await self.http_client.get(health_url)
-            return response.status_code == 200
-        except Exception as e:
-            logger.error("Health check failed", service_name=service_name, error=str(e))
+        Answers from the background health table; a live probe is only made
+        when the service has not been probed yet.
+        """
+        if not self.get_service(service_name):
             return False
+        
+        health = self.health_checker.table.service_health(service_name)
+        if health is None:
+            health = await self.health_checker.probe_service(service_name)
+        return bool(health and health["healthy"])
+    
+    def service_health(self, service_name: str) -> Optional[Dict[str, Any]]:
+        """Cached health details of a service"""
+        return self.health_checker.table.service_health(service_name)
+    
+    def all_health(self) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Cached health details of every service"""
+        return {name: self.service_health(name) for name in self.services}
 
 
 class ServiceProxy:
     """Proxy for forwarding requests to backend services"""
     
-    def __init__(self, service_registry: ServiceRegistry):
+    def __init__(
+        self,
+        service_registry: ServiceRegistry,
+        client_ip: Optional[str] = None,
+        route: Optional[Route] = None,
+        timings: Optional[RequestTimings] = None
+    ):
         self.service_registry = service_registry
-        self.http_client = httpx.AsyncClient(timeout=30.0)
+        self.pool_manager = service_registry.pool_manager
+        self.client_ip = client_ip
+        # Matched route of the request, whose settings override the service's
+        self.route = route
+        # Time spent waiting on upstreams, reported by the metrics middleware
+        self.timings = timings or RequestTimings()
+        # Time budget of the request, shared by every attempt and hop
+        self.deadline: Optional[Deadline] = None
+    
+    def _get_service(self, service_name: str) -> Dict[str, Any]:
+        """Get service configuration or raise if it is not registered"""
+        service = self.service_registry.get_service(service_name)
+        if not service:
+            raise ValueError(f"Service '{service_name}' not found")
+        return service
+    
+    def _timeout(self, service: Dict[str, Any]) -> float:
+        if self.route is not None and self.route.timeout is not None:
+            return self.route.timeout
+        return service.get("timeout", 30)
+    
+    def start_deadline(self, service_name: str, headers: Mapping[str, str]) -> Deadline:
+        """Start the request's time budget: the route or service timeout,
+        or the client's ``x-request-timeout-ms`` when it asks for less"""
+        service = self.service_registry.get_service(service_name) or {}
+        self.deadline = Deadline.for_request(headers, self._timeout(service))
+        return self.deadline
+    
+    def _phase_timeouts(self, service: Dict[str, Any], long_lived: bool = False) -> httpx.Timeout:
+        return phase_timeouts(service, self._timeout(service), long_lived)
+    
+    def _start_attempt(
+        self,
+        service_name: str,
+        headers: Dict[str, str],
+        tried: Collection[str] = (),
+        permit: Optional[ConcurrencyPermit] = None
+    ) -> "UpstreamAttempt":
+        """Choose the upstream instance for a request, skipping open circuits
+        
+        Endpoints in ``tried`` are avoided while any other one is available.
+        When health checks mark every endpoint down, they are all used anyway:
+        a failing probe should not take the whole service offline.
+        """
+        balancer = self.service_registry.balancers.get(service_name)
+        breakers = self.service_registry.breakers.get(service_name)
+        now = time.monotonic()
+        open_circuits = breakers.unavailable(now) if breakers else set()
+        unhealthy = self.service_registry.health_checker.table.unhealthy(service_name)
+        if unhealthy.issuperset(endpoint.url for endpoint in balancer.endpoints):
+            unhealthy = set()
+        hash_key = balancer.hash_key(headers, self.client_ip)
+        
+        endpoint: Optional[Endpoint] = None
+        if tried:
+            try:
+                endpoint = balancer.select(hash_key, open_circuits | unhealthy | set(tried))
+            except NoEndpointAvailable:
+                # Every other endpoint has been tried; reuse one of them
+                pass
+        if endpoint is None:
+            try:
+                endpoint = balancer.select(hash_key, open_circuits | unhealthy)
+            except NoEndpointAvailable:
+                if breakers is not None and open_circuits:
+                    raise breakers.open_error(now)
+                raise
+        
+        breaker = breakers.breakers.get(endpoint.url) if breakers else None
+        if breaker is not None:
+            breaker.acquire(now)
+        return UpstreamAttempt(balancer, endpoint, breaker, permit)
+    
+    def is_streaming(self, service_name: str) -> bool:
+        """Whether requests to a service use the end-to-end streaming path"""
+        service = self._get_service(service_name)
+        return bool(service.get("streaming", settings.PROXY_STREAMING))
+    
+    async def _dispatch(
+        self,
+        service_name: str,
+        path: str,
+        headers: Dict[str, str],
+        request: Dict[str, Any],
+        stream: bool,
+        replayable: bool,
+        long_lived: bool = False
+    ) -> Tuple[httpx.Response, "UpstreamAttempt"]:
+        """Send a request upstream, retrying and hedging within the retry budget
+        
+        Only idempotent requests whose body can be sent again are retried
+        (on connection errors) or hedged (GET/HEAD, when enabled). A
+        ``long_lived`` request takes no concurrency slot, which it would
+        hold for as long as its stream stays open.
+        """
+        service = self._get_service(service_name)
+        if self.deadline is None:
+            self.start_deadline(service_name, headers)
+        policy = self.service_registry.retry_policy
+        policy.budget.deposit()
+        
+        method = request["method"]
+        replayable = replayable and method in IDEMPOTENT_METHODS
+        retries_left = retry_settings(service)["max_retries"] if replayable else 0
+        hedging = hedging_settings(service) if replayable and method in HEDGEABLE_METHODS else None
+        tried: Set[str] = set()
+        started = time.perf_counter()
+        
+        try:
+            while True:
+                try:
+                    if hedging is not None:
+                        return await self._hedged(
+                            service_name, path, headers, request, stream, hedging, tried, long_lived
+                        )
+                    return await self._attempt(
+                        service_name, path, headers, request, stream, tried, long_lived=long_lived
+                    )
+                except RETRYABLE_ERRORS as e:
+                    if retries_left <= 0 or not policy.budget.withdraw():
+                        raise
+                    retries_left -= 1
+                    policy.count(service_name, "retries")
+                    logger.warning(
+                        "Retrying upstream request",
+                        service_name=service_name,
+                        method=method,
+                        path=path,
+                        error=str(e)
+                    )
+        finally:
+            self.timings.upstream_seconds += time.perf_counter() - started
+    
+    async def _hedged(
+        self,
+        service_name: str,
+        path: str,
+        headers: Dict[str, str],
+        request: Dict[str, Any],
+        stream: bool,
+        hedging: Dict[str, Any],
+        tried: Set[str],
+        long_lived: bool = False
+    ) -> Tuple[httpx.Response, "UpstreamAttempt"]:
+        """Race a second attempt against one slower than usual; first wins"""
+        policy = self.service_registry.retry_policy
+        delay = policy.latencies.hedge_delay(service_name, hedging)
+        if delay is None:
+            return await self._attempt(
+                service_name, path, headers, request, stream, tried, long_lived=long_lived
+            )
+        
+        tasks = [asyncio.ensure_future(self._attempt(service_name, path, headers, request, stream, tried, True, long_lived))]
+        winner: Optional["asyncio.Future[Tuple[httpx.Response, UpstreamAttempt]]"] = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and policy.budget.withdraw():
+                policy.count(service_name, "hedges")
+                tasks.append(
+                    asyncio.ensure_future(self._attempt(service_name, path, headers, request, stream, tried, True, long_lived))
+                )
+            
+            pending = set(tasks)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in tasks if t in done and t.exception() is None), None)
+            
+            if winner is None:
+                # Every attempt failed; surface the original one's error
+                raise tasks[0].exception()
+            if winner is not tasks[0]:
+                policy.count(service_name, "hedge_wins")
+            # The attempts queued side by side; only the winner's wait counts
+            self.timings.upstream_seconds -= winner.result()[1].queued_seconds
+            return winner.result()
+        finally:
+            losers = [task for task in tasks if task is not winner and not task.done()]
+            for task in losers:
+                task.cancel()
+            # Let the cancelled attempts give back their endpoint and pool slot
+            await asyncio.gather(*losers, return_exceptions=True)
+            for task in tasks:
+                if task is winner or task.cancelled():
+                    continue
+                if task.exception() is None:
+                    # Both answered at once; drop the slower response
+                    response, attempt = task.result()
+                    await self._discard(service_name, response, attempt, stream)
+    
+    async def _attempt(
+        self,
+        service_name: str,
+        path: str,
+        headers: Dict[str, str],
+        request: Dict[str, Any],
+        stream: bool,
+        tried: Set[str],
+        hedged: bool = False,
+        long_lived: bool = False
+    ) -> Tuple[httpx.Response, "UpstreamAttempt"]:
+        """Send one attempt to an endpoint not tried yet, if there is one
+        
+        Time queued for a concurrency slot is gateway overhead, not upstream
+        time; a hedged attempt leaves it to the race to count the winner's.
+        Long-lived streams skip the slot, as WebSockets do: the connection
+        manager caps them instead.
+        """
+        queued = time.perf_counter()
+        try:
+            permit = None if long_lived else await self._admit(service_name)
+        finally:
+            queued = time.perf_counter() - queued
+            if not hedged:
+                self.timings.upstream_seconds -= queued
+        try:
+            attempt = self._start_attempt(service_name, headers, tried, permit)
+        except BaseException:
+            if permit is not None:
+                permit.release()
+            raise
+        attempt.queued_seconds = queued
+        tried.add(attempt.endpoint.url)
+        return await self._send(service_name, attempt, path, request, stream), attempt
+    
+    async def _admit(self, service_name: str) -> Optional[ConcurrencyPermit]:
+        """Wait for a concurrency slot of the service; raises when shed
+        
+        The wait never outlasts the request's deadline.
+        """
+        limiter = self.service_registry.concurrency.get(service_name)
+        if limiter is None:
+            return None
+        try:
+            with tracer.span("concurrency.queue", **{"bifrost.service": service_name}):
+                return await limiter.acquire(timeout=self.deadline.remaining())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("queue")
+    
+    async def _send(
+        self,
+        service_name: str,
+        attempt: "UpstreamAttempt",
+        path: str,
+        request: Dict[str, Any],
+        stream: bool
+    ) -> httpx.Response:
+        """Send a request over the service's pool and record its outcome
+        
+        A streamed response keeps its endpoint outstanding and its pool slot
+        taken until the caller releases them after relaying the body.
+        
+        Each phase timeout is cut down to what is left of the deadline, and
+        the upstream is told the remaining budget, except for long-lived
+        responses (no read timeout) whose length the deadline does not bound.
+        The attempt gets a client span, which the upstream continues from the
+        ``traceparent`` header.
+        """
+        deadline = self.deadline
+        timeout = request["timeout"]
+        headers = dict(request["headers"])
+        if timeout.read is not None:
+            headers[DEADLINE_HEADER] = deadline.header()
+        span = tracer.span(
+            "upstream",
+            "client",
+            **{
+                "bifrost.service": service_name,
+                "bifrost.endpoint": attempt.endpoint.url,
+                "http.method": request["method"],
+            }
+        )
+        span.inject(headers)
+        
+        # Forward request over the service's long-lived pool
+        client = self.pool_manager.get_client(service_name)
+        upstream_request = client.build_request(
+            url=f"{attempt.endpoint.url}{path}",
+            **{**request, "headers": headers, "timeout": deadline.clamp(timeout)}
+        )
+        
+        self.pool_manager.acquire(service_name, client)
+        attempt.client = client
+        try:
+            deadline.check("gateway")
+            response = await deadline.run(client.send(upstream_request, stream=stream), "read")
+        except BaseException as e:
+            cancelled = isinstance(e, asyncio.CancelledError)
+            # A cancelled request, or one that outlived the budget its client
+            # asked for, says nothing about the upstream
+            gave_up = cancelled or (deadline.requested and deadline.expired())
+            attempt.finish(None if gave_up else False)
+            self.pool_manager.release(service_name, client)
+            if cancelled:
+                # e.g. the loser of a hedge race
+                span.set("cancelled", True)
+                span.end()
+                raise
+            span.record_error(e)
+            span.end()
+            logger.error(
+                "Request forwarding failed",
+                service_name=service_name,
+                endpoint=attempt.endpoint.url,
+                method=request["method"],
+                path=path,
+                error=str(e)
+            )
+            raise
+        
+        UPSTREAM_LATENCY.labels(service=service_name).observe(time.perf_counter() - attempt.started)
+        success = response.status_code < 500
+        span.set("http.status_code", response.status_code)
+        if not success:
+            span.record_error()
+        span.end()
+        if stream:
+            # Latency is measured to the response headers; the endpoint stays
+            # outstanding until the body has been relayed
+            attempt.observe(success)
+        else:
+            attempt.finish(success)
+            self.pool_manager.release(service_name, client)
+        if success:
+            self.service_registry.retry_policy.latencies.record(
+                service_name, time.perf_counter() - attempt.started
+            )
+        
+        logger.debug(
+            "Request forwarded",
+            service_name=service_name,
+            endpoint=attempt.endpoint.url,
+            method=request["method"],
+            path=path,
+            status_code=response.status_code,
+            streaming=stream
+        )
+        return response
     
+    async def _discard(
+        self,
+        service_name: str,
+        response: httpx.Response,
+        attempt: "UpstreamAttempt",
+        stream: bool
+    ) -> None:
+        """Throw away the response of an attempt that lost a hedge race"""
+        if stream:
+            try:
+                await response.aclose()
+            finally:
+                attempt.release()
+                self.pool_manager.release(service_name, attempt.client)
+    
+    @traced("proxy.forward")
     async def forward_request(
         self,
         service_name: str,
@@ -118,47 +723,371 @@ class ServiceProxy:
         params: Optional[Dict[str, str]] = None
     ) -> httpx.Response:
         """Forward request to backend service"""
-        service = self.service_registry.get_service(service_name)
-        if not service:
-            raise ValueError(f"Service '{service_name}' not found")
+        service = self._get_service(service_name)
         
-        # Build target URL
-        target_url = f"{service['url']}{path}"
+        # The body is decoded by httpx here, so only let the upstream use
+        # encodings the client itself is able to decode
+        forward_headers = filter_request_headers(headers)
+        forward_headers.pop("accept-encoding", None)
         
-        # Prepare headers (remove host header to avoid conflicts)
-        forward_headers = {k: v for k, v in headers.items() if k.lower() != "host"}
+        request = {
+            "method": method,
+            "headers": forward_headers,
+            "content": body,
+            "params": params,
+            "timeout": self._phase_timeouts(service)
+        }
+        response, _ = await self._dispatch(
+            service_name, path, headers, request, stream=False, replayable=True
+        )
+        return response
+    
+    def is_cacheable(self, service_name: str) -> bool:
+        """Whether GET responses of a service go through the response cache"""
+        self._get_service(service_name)
+        if self.route is not None and self.route.cache is None:
+            return False
+        return self.service_registry.response_caches.get(service_name) is not None
+    
+    def _cache_config(self, cache: ResponseCache) -> Dict[str, Any]:
+        """Freshness settings of the matched route, else those of the cache"""
+        if self.route is not None and self.route.cache is not None:
+            return self.route.cache
+        return cache.config
+    
+    async def forward_cached_request(
+        self,
+        service_name: str,
+        path: str,
+        headers: Dict[str, str],
+        params: Optional[Dict[str, str]] = None
+    ) -> Tuple[CachedResponse, str]:
+        """Answer a GET from the service's response cache when possible
         
-        try:
-            # Forward request
-            response = await self.http_client.request(
-                method=method,
-                url=target_url,
-                headers=forward_headers,
-                content=body,
-                params=params,
-                timeout=service.get("timeout", 30)
+        Returns the response together with its cache outcome (HIT, MISS,
+        STALE, REVALIDATED or BYPASS).
+        """
+        cache = self.service_registry.response_caches.get(service_name)
+        if cache is None:
+            raise ValueError(f"Service '{service_name}' has no response cache")
+        
+        key = cache_key(path, params)
+        request_directives = parse_cache_control(headers.get("cache-control"))
+        if "no-store" in request_directives:
+            response = await self.forward_request(service_name, "GET", path, headers, params=params)
+            cache.record(BYPASS)
+            return _buffered(response), BYPASS
+        
+        entry = None if "no-cache" in request_directives else cache.lookup(key, headers)
+        now = time.monotonic()
+        if entry is not None and entry.is_fresh(now):
+            cache.record(HIT)
+            return entry, HIT
+        if entry is not None and entry.is_stale_usable(now):
+            cache.start_revalidation(
+                key, self._fetch_into_cache(cache, service_name, key, path, headers, params, entry)
             )
-            
-            logger.info(
-                "Request forwarded",
-                service_name=service_name,
-                method=method,
-                path=path,
-                status_code=response.status_code
+            cache.record(STALE)
+            return entry, STALE
+        
+        result, outcome = await self._shared(
+            service_name,
+            path,
+            headers,
+            params,
+            lambda: self._fetch_into_cache(cache, service_name, key, path, headers, params, entry)
+        )
+        cache.record(outcome)
+        return result, outcome
+    
+    def _coalescing_headers(self, service_name: str) -> Optional[Tuple[str, ...]]:
+        """Request headers keying coalesced GETs, or None when disabled"""
+        config = self._get_service(service_name).get("coalesce")
+        if config is True:
+            return DEFAULT_KEY_HEADERS
+        if isinstance(config, dict) and config.get("enabled", True):
+            extra = tuple(name.lower() for name in config.get("headers", []))
+            return DEFAULT_KEY_HEADERS + extra
+        return None
+    
+    def is_coalescing(self, service_name: str) -> bool:
+        """Whether concurrent identical GETs to a service share one upstream call"""
+        return self._coalescing_headers(service_name) is not None
+    
+    async def _shared(
+        self,
+        service_name: str,
+        path: str,
+        headers: Dict[str, str],
+        params: Optional[Dict[str, str]],
+        fetch: Callable[[], Awaitable[Tuple[CachedResponse, str]]]
+    ) -> Tuple[CachedResponse, str]:
+        """Run a GET fetch through the single-flight layer when enabled"""
+        key_headers = self._coalescing_headers(service_name)
+        if key_headers is None or not is_shareable(headers):
+            # A conditional or ranged response only answers its own request
+            return await fetch()
+        
+        key = coalescing_key(service_name, "GET", path, headers, params, key_headers)
+        (result, outcome), collapsed = await self.service_registry.coalescer.run(key, fetch)
+        return (result.copy(), outcome) if collapsed else (result, outcome)
+    
+    async def forward_coalesced_request(
+        self,
+        service_name: str,
+        path: str,
+        headers: Dict[str, str],
+        params: Optional[Dict[str, str]] = None
+    ) -> CachedResponse:
+        """Forward a GET, sharing the upstream call with identical concurrent GETs"""
+        
+        async def fetch() -> Tuple[CachedResponse, str]:
+            response = await self.forward_request(service_name, "GET", path, headers, params=params)
+            return _buffered(response), MISS
+        
+        result, _ = await self._shared(service_name, path, headers, params, fetch)
+        return result
+    
+    async def _fetch_into_cache(
+        self,
+        cache: ResponseCache,
+        service_name: str,
+        key: str,
+        path: str,
+        headers: Dict[str, str],
+        params: Optional[Dict[str, str]],
+        entry: Optional[CachedResponse]
+    ) -> Tuple[CachedResponse, str]:
+        """Fetch from upstream, revalidating entry when it has validators"""
+        forward_headers = dict(headers)
+        if entry is not None and entry.etag:
+            forward_headers["if-none-match"] = entry.etag
+        if entry is not None and entry.last_modified:
+            forward_headers["if-modified-since"] = entry.last_modified
+        
+        response = await self.forward_request(
+            service_name, "GET", path, forward_headers, params=params
+        )
+        
+        if response.status_code == 304 and entry is not None:
+            refreshed = entry.refreshed(response, self._cache_config(cache))
+            cache.store(key, headers, vary_names(response.headers), refreshed)
+            return refreshed, REVALIDATED
+        
+        config = self._cache_config(cache)
+        result = _buffered(response, config)
+        if is_storable(headers, response, config):
+            cache.store(key, headers, vary_names(response.headers), result)
+        return result, MISS
+    
+    @traced("proxy.stream")
+    async def stream_request(
+        self,
+        service_name: str,
+        method: str,
+        path: str,
+        headers: Dict[str, str],
+        body: Optional[AsyncIterator[bytes]] = None,
+        params: Optional[Dict[str, str]] = None,
+        chunk_size: Optional[int] = 64 * 1024,
+        long_lived: bool = False
+    ) -> "StreamedBody":
+        """Forward request to backend service without buffering either body
+        
+        Only the upstream response headers have been read when this returns;
+        the body is relayed by iterating the returned ``StreamedBody``. With
+        no ``chunk_size`` each chunk is relayed as soon as it is read; a
+        ``long_lived`` body has no read timeout, its caller ends it when idle.
+        """
+        service = self._get_service(service_name)
+        request = {
+            "method": method,
+            "headers": filter_request_headers(headers),
+            "content": body,
+            "params": params,
+            "timeout": self._phase_timeouts(service, long_lived)
+        }
+        # A streamed request body cannot be sent a second time
+        response, attempt = await self._dispatch(
+            service_name,
+            path,
+            headers,
+            request,
+            stream=True,
+            replayable=body is None,
+            long_lived=long_lived
+        )
+        
+        def release() -> None:
+            attempt.release()
+            self.pool_manager.release(service_name, attempt.client)
+        
+        return StreamedBody(response, chunk_size, release)
+    
+    async def open_websocket(
+        self,
+        service_name: str,
+        path: str,
+        headers: Dict[str, str],
+        params: Dict[str, str],
+        subprotocols: List[str]
+    ) -> Tuple[Any, "UpstreamAttempt"]:
+        """Open the upstream WebSocket of a proxied connection
+        
+        The endpoint stays outstanding until the caller releases the
+        returned attempt when the connection closes.
+        """
+        self._get_service(service_name)
+        connection_config = self.service_registry.connections.get(service_name)
+        attempt = self._start_attempt(service_name, headers)
+        url = websocket_url(attempt.endpoint.url) + path
+        if params:
+            url += "?" + str(httpx.QueryParams(params))
+        deadline = self.deadline or self.start_deadline(service_name, headers)
+        started = time.perf_counter()
+        try:
+            deadline.check("gateway")
+            upstream = await connect_upstream(
+                url, headers, subprotocols, connection_config, deadline.remaining()
             )
-            
-            return response
-            
-        except Exception as e:
+        except UPSTREAM_HANDSHAKE_ERRORS as e:
+            attempt.finish(False)
             logger.error(
-                "Request forwarding failed",
+                "WebSocket upstream connection failed",
                 service_name=service_name,
-                method=method,
+                endpoint=attempt.endpoint.url,
                 path=path,
                 error=str(e)
             )
             raise
+        except BaseException:
+            attempt.finish(None)
+            raise
+        finally:
+            self.timings.upstream_seconds += time.perf_counter() - started
+        UPSTREAM_LATENCY.labels(service=service_name).observe(time.perf_counter() - started)
+        attempt.observe(True)
+        return upstream, attempt
+
+
+class UpstreamAttempt:
+    """Bookkeeping of one request sent to an upstream endpoint"""
     
-    async def cleanup(self):
-        """Cleanup resources"""
-        await self.http_client.aclose()
+    def __init__(
+        self,
+        balancer: LoadBalancer,
+        endpoint: Endpoint,
+        breaker: Optional[CircuitBreaker] = None,
+        permit: Optional[ConcurrencyPermit] = None
+    ):
+        self.balancer = balancer
+        self.endpoint = endpoint
+        self.breaker = breaker
+        # Concurrency slot of the service, held until the request is released
+        self.permit = permit
+        # Seconds spent waiting for the permit
+        self.queued_seconds = 0.0
+        # Pool client the request was sent over, counted until it is released
+        self.client: Optional[httpx.AsyncClient] = None
+        self.started = time.perf_counter()
+        endpoint.start()
+    
+    def observe(self, success: Optional[bool]) -> None:
+        """Report the response outcome; None when the caller gave up first"""
+        latency = time.perf_counter() - self.started
+        if success is not None:
+            self.balancer.observe(self.endpoint, latency, success)
+            if self.permit is not None:
+                self.permit.observe(latency, dropped=not success)
+        if self.breaker is not None:
+            self.breaker.record(latency, success)
+    
+    def release(self) -> None:
+        """Stop counting the request as outstanding on its endpoint"""
+        self.endpoint.release()
+        if self.permit is not None:
+            self.permit.release()
+    
+    def finish(self, success: Optional[bool]) -> None:
+        self.observe(success)
+        self.release()
+
+
+class StreamedBody:
+    """Relays a streamed upstream body and releases it exactly once"""
+    
+    def __init__(
+        self,
+        response: httpx.Response,
+        chunk_size: Optional[int],
+        on_close: Callable[[], None]
+    ):
+        self.response = response
+        self.chunk_size = chunk_size
+        self.on_close = on_close
+        self._closed = False
+    
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self._relay()
+    
+    async def _relay(self) -> AsyncIterator[bytes]:
+        try:
+            # Raw bytes keep the upstream content-encoding valid end to end
+            async for chunk in self.response.aiter_raw(self.chunk_size):
+                yield chunk
+        finally:
+            await self.aclose()
+    
+    async def aclose(self) -> None:
+        """Close the upstream response and return its connection to the pool"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            await self.response.aclose()
+        finally:
+            self.on_close()
+
+
+def _buffered(response: httpx.Response, config: Optional[Dict[str, Any]] = None) -> CachedResponse:
+    """Convert a buffered upstream response into a cache entry"""
+    fresh_for, stale_for = freshness(response.headers, config) if config else (0, 0)
+    return CachedResponse(
+        response.status_code,
+        filter_response_headers(response.headers, decoded=True),
+        response.content,
+        fresh_for,
+        stale_for,
+    )
+
+
+def filter_request_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    """Drop the host and hop-by-hop headers from a request to forward"""
+    return {
+        k.lower(): v
+        for k, v in headers.items()
+        if k.lower() != "host" and k.lower() not in HOP_BY_HOP_HEADERS
+    }
+
+
+def filter_response_headers(
+    headers: httpx.Headers, decoded: bool = False
+) -> List[Tuple[bytes, bytes]]:
+    """Drop hop-by-hop headers from an upstream response
+    
+    When the body was decoded by httpx, the original content-encoding and
+    content-length no longer describe it and are dropped as well.
+    """
+    excluded = HOP_BY_HOP_HEADERS | DECODED_BODY_HEADERS if decoded else HOP_BY_HOP_HEADERS
+    return [
+        (key.lower(), value)
+        for key, value in headers.raw
+        if key.lower().decode("latin-1") not in excluded
+    ]
+
+
+async def iter_request_body(request_stream: AsyncIterator[bytes], buffer_size: int) -> AsyncIterator[bytes]:
+    """Re-chunk an incoming ASGI body so no single chunk exceeds buffer_size"""
+    async for chunk in request_stream:
+        for offset in range(0, len(chunk), buffer_size):
+            yield chunk[offset:offset + buffer_size]
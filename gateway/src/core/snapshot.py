@@ -0,0 +1,179 @@
+# --------------------------------------------------------------------------
+# Immutable, versioned snapshots of the service registry and config reloads
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, Tuple
+
+import structlog
+
+from .routes import RouteTable
+
+logger = structlog.get_logger()
+
+
+class InvalidServiceConfig(ValueError):
+    """Raised when a services configuration cannot be applied"""
+
+
+def validate_services(services: Any) -> RouteTable:
+    """Check a services configuration and compile its route table"""
+    if not isinstance(services, dict):
+        raise InvalidServiceConfig("Services configuration must be an object")
+    for name, config in services.items():
+        if not isinstance(config, dict):
+            raise InvalidServiceConfig(f"Service '{name}' must be an object")
+        if "url" not in config and not config.get("endpoints"):
+            raise InvalidServiceConfig(f"Service '{name}' has no url or endpoints")
+    try:
+        return RouteTable.compile(services)
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        raise InvalidServiceConfig(f"Invalid routes: {e}") from e
+
+
+class RegistrySnapshot:
+    """Immutable, versioned view of the registered services
+
+    A snapshot is never modified: a change builds a new one, which replaces
+    the current snapshot in a single assignment. Requests that already hold
+    a route or config keep using it. The ``GET /services`` body is
+    serialized once per snapshot and tagged with its version.
+    """
+
+    __slots__ = ("version", "services", "route_table", "services_body", "etag")
+
+    def __init__(
+        self,
+        version: int,
+        services: Dict[str, Dict[str, Any]],
+        route_table: Optional[RouteTable] = None,
+    ):
+        services = copy.deepcopy(services)
+        self.version = version
+        # Configs are shared by every request and treated as read-only
+        self.services: Mapping[str, Dict[str, Any]] = MappingProxyType(services)
+        self.route_table = route_table or RouteTable.compile(services)
+        self.services_body = json.dumps(
+            {"services": services, "count": len(services), "version": version},
+            separators=(",", ":"),
+        ).encode()
+        digest = hashlib.sha256(self.services_body).hexdigest()[:12]
+        self.etag = f'"{version}-{digest}"'
+
+    @classmethod
+    def empty(cls) -> "RegistrySnapshot":
+        return cls(0, {}, RouteTable())
+
+    def changed(self, services: Mapping[str, Dict[str, Any]]) -> Tuple[set, set]:
+        """Names whose config differs in ``services``, and names removed"""
+        changed = {
+            name
+            for name, config in services.items()
+            if self.services.get(name) != config
+        }
+        return changed, set(self.services) - set(services)
+
+
+def read_services_file(path: Path) -> Dict[str, Dict[str, Any]]:
+    """Read and validate a services file"""
+    try:
+        with open(path, "r") as f:
+            services = json.load(f)
+    except json.JSONDecodeError as e:
+        raise InvalidServiceConfig(f"Malformed JSON in {path}: {e}") from e
+    validate_services(services)
+    return services
+
+
+def _file_state(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ConfigWatcher:
+    """Reloads the services file when it changes
+
+    The file is polled every ``interval`` seconds. A change is applied once
+    the file has stayed the same for ``debounce`` seconds, so editors and
+    deploy tools that write in several steps cause a single reload. An
+    invalid file is logged and skipped until it changes again.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        reload: Callable[[], Awaitable[Any]],
+        interval: float = 2.0,
+        debounce: float = 1.0,
+    ):
+        self.path = path
+        self.reload = reload
+        self.interval = interval
+        self.debounce = debounce
+        self._applied = _file_state(path)
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def mark_applied(self) -> None:
+        """Record the current file as loaded"""
+        self._applied = _file_state(self.path)
+
+    async def check(self) -> bool:
+        """Reload if the file changed and then settled; True when reloaded"""
+        state = _file_state(self.path)
+        if state is None or state == self._applied:
+            return False
+
+        # Wait until the file stops changing
+        settled_since = time.monotonic()
+        while time.monotonic() - settled_since < self.debounce:
+            await asyncio.sleep(min(self.debounce, self.interval) / 4)
+            current = _file_state(self.path)
+            if current != state:
+                state = current
+                settled_since = time.monotonic()
+        if state is None:
+            return False
+
+        self._applied = state
+        try:
+            await self.reload()
+        except InvalidServiceConfig as e:
+            logger.error(
+                "Services file rejected, keeping the current registry",
+                path=str(self.path),
+                error=str(e),
+            )
+            return False
+        return True
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error("Services file reload failed", error=str(e))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,375 @@
+# --------------------------------------------------------------------------
+# Service registry synchronization across gateway workers and replicas
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+import fcntl
+import json
+import os
+import socket
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
+
+import structlog
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, WatchError
+
+from ..config import settings
+from .snapshot import RegistrySnapshot
+
+if TYPE_CHECKING:
+    from .services import ServiceRegistry
+
+logger = structlog.get_logger()
+
+Services = Dict[str, Dict[str, Any]]
+Mutation = Callable[[Services], Services]
+
+
+def worker_id() -> str:
+    """Identity of this worker process"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SyncBackend:
+    """Shared, versioned copy of the registry
+
+    The backend stores the whole services configuration with a version
+    that grows by one on every change. Workers apply the latest state, so
+    a missed notification only delays a change until the next poll.
+    """
+
+    name = "base"
+
+    async def load(self) -> Optional[Tuple[int, Services]]:
+        raise NotImplementedError
+
+    async def update(self, mutate: Mutation) -> Tuple[int, Services]:
+        """Atomically replace the state with ``mutate(current services)``"""
+        raise NotImplementedError
+
+    async def wait(self, timeout: float) -> None:
+        """Return when the state may have changed, or after ``timeout``"""
+        raise NotImplementedError
+
+    async def report(self, worker: str, version: int) -> None:
+        raise NotImplementedError
+
+    async def workers(self) -> Dict[str, Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class InProcessSyncBackend(SyncBackend):
+    """Backend shared by registries of one event loop, for tests"""
+
+    name = "in_process"
+
+    def __init__(self) -> None:
+        self.version = 0
+        self.services: Optional[Services] = None
+        self.reports: Dict[str, Dict[str, Any]] = {}
+        self._changed = asyncio.Condition()
+
+    async def load(self) -> Optional[Tuple[int, Services]]:
+        if self.services is None:
+            return None
+        return self.version, json.loads(json.dumps(self.services))
+
+    async def update(self, mutate: Mutation) -> Tuple[int, Services]:
+        services = mutate(json.loads(json.dumps(self.services or {})))
+        self.version += 1
+        self.services = services
+        async with self._changed:
+            self._changed.notify_all()
+        return self.version, services
+
+    async def wait(self, timeout: float) -> None:
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def report(self, worker: str, version: int) -> None:
+        self.reports[worker] = {"version": version, "reported_at": time.time()}
+
+    async def workers(self) -> Dict[str, Dict[str, Any]]:
+        return dict(self.reports)
+
+
+class FileSyncBackend(SyncBackend):
+    """Backend in a file shared by the workers of one host
+
+    Changes are serialized with an exclusive lock on ``<path>.lock`` and
+    written by atomic rename; workers notice them by polling the mtime.
+    Worker reports go to separate files in ``<path>.workers/`` so they do
+    not wake the other workers.
+    """
+
+    name = "file"
+
+    def __init__(self, path: Path, poll_interval: float = 0.2):
+        self.path = path
+        self.lock_path = path.with_name(path.name + ".lock")
+        self.workers_dir = path.with_name(path.name + ".workers")
+        self.poll_interval = poll_interval
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"version": 0, "services": None}
+
+    @staticmethod
+    def _write(path: Path, state: Dict[str, Any]) -> None:
+        temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(temporary, "w") as f:
+            json.dump(state, f)
+        os.replace(temporary, path)
+
+    def _locked(self, change: Callable[[Dict[str, Any]], Any]) -> Any:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                state = self._read()
+                result = change(state)
+                self._write(self.path, state)
+                return result
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    async def load(self) -> Optional[Tuple[int, Services]]:
+        state = self._read()
+        if state["services"] is None:
+            return None
+        return state["version"], state["services"]
+
+    async def update(self, mutate: Mutation) -> Tuple[int, Services]:
+        def change(state: Dict[str, Any]) -> Tuple[int, Services]:
+            state["services"] = mutate(state["services"] or {})
+            state["version"] += 1
+            return state["version"], state["services"]
+
+        return self._locked(change)
+
+    def _mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    async def wait(self, timeout: float) -> None:
+        seen = self._mtime()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(self.poll_interval, timeout))
+            if self._mtime() != seen:
+                return
+
+    async def report(self, worker: str, version: int) -> None:
+        self.workers_dir.mkdir(parents=True, exist_ok=True)
+        report = {"version": version, "reported_at": time.time()}
+        self._write(self.workers_dir / f"{worker.replace('/', '_')}.json", report)
+
+    async def workers(self) -> Dict[str, Dict[str, Any]]:
+        reports: Dict[str, Dict[str, Any]] = {}
+        for path in sorted(self.workers_dir.glob("*.json")):
+            try:
+                reports[path.stem] = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+        return reports
+
+
+class RedisSyncBackend(SyncBackend):
+    """Backend in Redis, for every worker of every replica
+
+    The state is one JSON value updated with WATCH/MULTI; each change is
+    announced on a pub/sub channel so workers apply it right away.
+    """
+
+    name = "redis"
+
+    def __init__(self, redis: Any, prefix: str = "bifrost:registry:"):
+        self.redis = redis
+        self.state_key = f"{prefix}state"
+        self.workers_key = f"{prefix}workers"
+        self.channel = f"{prefix}changes"
+        self._pubsub: Any = None
+
+    @staticmethod
+    def _decode(raw: Optional[bytes]) -> Tuple[int, Optional[Services]]:
+        if raw is None:
+            return 0, None
+        state = json.loads(raw)
+        return state["version"], state["services"]
+
+    async def load(self) -> Optional[Tuple[int, Services]]:
+        version, services = self._decode(await self.redis.get(self.state_key))
+        return None if services is None else (version, services)
+
+    async def update(self, mutate: Mutation) -> Tuple[int, Services]:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(self.state_key)
+                    version, services = self._decode(await pipe.get(self.state_key))
+                    services = mutate(services or {})
+                    version += 1
+                    pipe.multi()
+                    pipe.set(
+                        self.state_key,
+                        json.dumps({"version": version, "services": services}),
+                    )
+                    await pipe.execute()
+                    break
+                except WatchError:
+                    # Another worker changed the state first; mutate its result
+                    continue
+        await self.redis.publish(self.channel, version)
+        return version, services
+
+    async def wait(self, timeout: float) -> None:
+        try:
+            if self._pubsub is None:
+                self._pubsub = self.redis.pubsub()
+                await self._pubsub.subscribe(self.channel)
+            await self._pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=timeout
+            )
+        except (RedisError, OSError) as e:
+            logger.warning("Registry change channel unavailable", error=str(e))
+            self._pubsub = None
+            await asyncio.sleep(timeout)
+
+    async def report(self, worker: str, version: int) -> None:
+        await self.redis.hset(
+            self.workers_key,
+            worker,
+            json.dumps({"version": version, "reported_at": time.time()}),
+        )
+
+    async def workers(self) -> Dict[str, Dict[str, Any]]:
+        reports = await self.redis.hgetall(self.workers_key)
+        return {
+            (key.decode() if isinstance(key, bytes) else key): json.loads(value)
+            for key, value in reports.items()
+        }
+
+    async def close(self) -> None:
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        await self.redis.aclose()
+
+
+class RegistrySync:
+    """Keeps one worker's registry on the shared version of the backend
+
+    Admin changes are committed to the backend first and then applied
+    locally; every other worker applies them when notified, or at the
+    latest after ``interval`` seconds. Each worker reports the version it
+    has applied.
+    """
+
+    def __init__(
+        self,
+        registry: "ServiceRegistry",
+        backend: SyncBackend,
+        interval: float = 1.0,
+        worker: Optional[str] = None,
+    ):
+        self.registry = registry
+        self.backend = backend
+        self.interval = interval
+        self.worker = worker or worker_id()
+        self.applied_version = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def start(self) -> None:
+        """Join the shared registry, seeding it with ours if it is empty"""
+        state = await self.backend.load()
+        if state is None:
+            local = dict(self.registry.services)
+            state = await self.backend.update(lambda services: services or local)
+        await self._apply(*state, force=True)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def update(self, mutate: Mutation) -> RegistrySnapshot:
+        """Commit a change for every worker and apply it here"""
+
+        def checked(services: Services) -> Services:
+            changed = mutate(services)
+            # Never publish a state the workers would reject
+            self.registry.validate(changed)
+            return changed
+
+        version, services = await self.backend.update(checked)
+        await self._apply(version, services)
+        return self.registry.snapshot
+
+    async def sync(self) -> bool:
+        """Apply the backend state if it is newer; True when applied"""
+        state = await self.backend.load()
+        if state is None:
+            return False
+        return await self._apply(*state)
+
+    async def _apply(
+        self, version: int, services: Services, force: bool = False
+    ) -> bool:
+        async with self._lock:
+            if version <= self.applied_version and not force:
+                return False
+            await self.registry.apply(services, version=version)
+            self.applied_version = version
+        await self.backend.report(self.worker, version)
+        logger.info("Registry version applied", version=version, worker=self.worker)
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            await self.backend.wait(self.interval)
+            try:
+                if not await self.sync():
+                    await self.backend.report(self.worker, self.applied_version)
+            except Exception as e:
+                logger.error("Registry sync failed", error=str(e))
+                await asyncio.sleep(self.interval)
+
+    async def stats(self) -> Dict[str, Any]:
+        state = await self.backend.load()
+        return {
+            "backend": self.backend.name,
+            "worker": self.worker,
+            "applied_version": self.applied_version,
+            "latest_version": state[0] if state else 0,
+            "workers": await self.backend.workers(),
+        }
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.backend.close()
+
+
+def create_sync_backend() -> Optional[SyncBackend]:
+    """Build the configured registry sync backend, if any"""
+    if settings.REGISTRY_SYNC_BACKEND == "redis":
+        return RedisSyncBackend(Redis.from_url(settings.REDIS_URL))
+    if settings.REGISTRY_SYNC_BACKEND == "file":
+        return FileSyncBackend(Path(settings.REGISTRY_SYNC_PATH))
+    return None
@@ -0,0 +1,177 @@
+# --------------------------------------------------------------------------
+# Upstream connection pre-warming for the API Gateway service
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import httpx
+import structlog
+
+from ..config import settings
+from .health import health_config
+from .metrics import PREWARMED_CONNECTIONS
+
+if TYPE_CHECKING:
+    from .services import ServiceRegistry
+
+logger = structlog.get_logger()
+
+
+def prewarm_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Resolve the warm-up settings of a service
+
+    ``prewarm`` is a number of connections per endpoint, ``false``, or an
+    object with ``connections``, ``path`` (the health check path) and
+    ``timeout``; the defaults come from the gateway settings.
+    """
+    prewarm = config.get("prewarm", {})
+    if prewarm is False:
+        prewarm = {"connections": 0}
+    elif prewarm is True:
+        prewarm = {}
+    elif isinstance(prewarm, int):
+        prewarm = {"connections": prewarm}
+    return {
+        "connections": settings.PREWARM_CONNECTIONS,
+        "path": health_config(config)["path"],
+        "timeout": settings.PREWARM_TIMEOUT,
+        **prewarm,
+    }
+
+
+class WarmupManager:
+    """Resolves upstream hosts and opens keep-alive connections ahead of traffic
+
+    Every service is warmed when the manager starts and again whenever its
+    configuration changes. The gateway counts as ready once the services
+    present at startup have been warmed, whether or not that succeeded.
+    """
+
+    def __init__(self, registry: "ServiceRegistry"):
+        self.registry = registry
+        self.running = False
+        self.ready = False
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self._tasks: Dict[str, "asyncio.Task[None]"] = {}
+        self._startup: Optional["asyncio.Future[None]"] = None
+
+    async def start(self) -> None:
+        """Start DNS refreshes and warm every registered service"""
+        self.running = True
+        dns_cache = self.registry.pool_manager.dns_cache
+        if dns_cache is not None:
+            await dns_cache.start()
+        for name, config in self.registry.services.items():
+            self.schedule(name, config)
+        self._startup = asyncio.ensure_future(
+            self._mark_ready(list(self._tasks.values()))
+        )
+
+    async def _mark_ready(self, tasks: List["asyncio.Task[None]"]) -> None:
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.ready = True
+        logger.info("Upstream warm-up complete", services=len(tasks))
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds for the startup warm-up"""
+        if self._startup is None:
+            return self.ready
+        try:
+            await asyncio.wait_for(asyncio.shield(self._startup), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Upstream warm-up still running", timeout=timeout)
+        return self.ready
+
+    async def stop(self) -> None:
+        self.running = False
+        tasks = list(self._tasks.values())
+        if self._startup is not None:
+            tasks.append(self._startup)
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        dns_cache = self.registry.pool_manager.dns_cache
+        if dns_cache is not None:
+            await dns_cache.stop()
+
+    def schedule(self, name: str, config: Dict[str, Any]) -> None:
+        """(Re)start the warm-up of a service once the manager runs"""
+        self.cancel(name)
+        if not self.running:
+            return
+        self.results[name] = {"state": "warming"}
+        task = asyncio.create_task(self._warm(name, config))
+        self._tasks[name] = task
+        task.add_done_callback(lambda _: self._forget(name, task))
+
+    def _forget(self, name: str, task: "asyncio.Task[None]") -> None:
+        if self._tasks.get(name) is task:
+            del self._tasks[name]
+
+    def cancel(self, name: str) -> None:
+        task = self._tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+        self.results.pop(name, None)
+
+    async def _warm(self, name: str, config: Dict[str, Any]) -> None:
+        prewarm = prewarm_settings(config)
+        pool_manager = self.registry.pool_manager
+        endpoints = [
+            endpoint.url for endpoint in self.registry.balancers.get(name).endpoints
+        ]
+        started = time.perf_counter()
+        errors: List[str] = []
+
+        dns_cache = pool_manager.dns_cache
+        if dns_cache is not None:
+            for url in endpoints:
+                try:
+                    await dns_cache.resolve(httpx.URL(url).host)
+                except OSError as e:
+                    errors.append(f"{url}: {e}")
+
+        # More than the pool keeps alive would be closed right away
+        connections = min(
+            prewarm["connections"],
+            pool_manager.pool_configs[name]["max_keepalive_connections"],
+        )
+        opened = 0
+        if connections > 0:
+            client = pool_manager.get_client(name)
+            # Concurrent requests each take a connection of their own
+            outcomes = await asyncio.gather(
+                *[
+                    client.get(f"{url}{prewarm['path']}", timeout=prewarm["timeout"])
+                    for url in endpoints
+                    for _ in range(connections)
+                ],
+                return_exceptions=True,
+            )
+            for outcome in outcomes:
+                if isinstance(outcome, Exception):
+                    errors.append(str(outcome) or type(outcome).__name__)
+                else:
+                    opened += 1
+            PREWARMED_CONNECTIONS.labels(service=name).inc(opened)
+
+        self.results[name] = {
+            "state": "failed" if errors else "warm",
+            "connections": opened,
+            "seconds": round(time.perf_counter() - started, 3),
+            "errors": sorted(set(errors)),
+        }
+        log = logger.warning if errors else logger.info
+        log("Service warmed", service_name=name, connections=opened, errors=len(errors))
+
+    def stats(self) -> Dict[str, Any]:
+        dns_cache = self.registry.pool_manager.dns_cache
+        return {
+            "ready": self.ready,
+            "services": dict(self.results),
+            "dns": dns_cache.stats() if dns_cache is not None else None,
+        }
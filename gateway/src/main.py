@@ -6,56 +6,61 @@
 # --------------------------------------------------------------------------
 import asyncio
 import logging
+import os
 from contextlib import asynccontextmanager
 
 import structlog
 import uvicorn
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from prometheus_client import Counter, Histogram
-from prometheus_client.openmetrics.exposition import generate_latest
 
 from .config import settings
-from .core.middleware import LoggingMiddleware, RateLimitMiddleware
+from .core.auth import create_authenticator
+from .core.logs import configure_logging
+from .core.metrics import mark_process_dead, render_metrics
+from .core.middleware import (
+    LoggingMiddleware,
+    MetricsMiddleware,
+    ProfilingMiddleware,
+    RateLimitMiddleware,
+    TracingMiddleware,
+)
+from .core.ratelimit import create_rate_limiter
 from .core.router import router as api_router
 from .core.services import ServiceRegistry
+from .core.sync import create_sync_backend
+from .core.tracing import configure_tracing, tracer
 
-# Configure structured logging
-structlog.configure(
-    processors=[
-        structlog.stdlib.filter_by_level,
-        structlog.stdlib.add_logger_name,
-        structlog.stdlib.add_log_level,
-        structlog.stdlib.PositionalArgumentsFormatter(),
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.StackInfoRenderer(),
-        structlog.processors.format_exc_info,
-        structlog.processors.UnicodeDecoder(),
-        structlog.processors.JSONRenderer()
-    ],
-    context_class=dict,
-    logger_factory=structlog.stdlib.LoggerFactory(),
-    wrapper_class=structlog.stdlib.BoundLogger,
-    cache_logger_on_first_use=True,
-)
+# Configure structured logging, written by a background thread
+configure_logging()
 
 logger = structlog.get_logger()
 
-# Prometheus metrics
-REQUEST_COUNT = Counter('http_requests_total', 'Total HTTP requests', ['method', 'endpoint', 'status'])
-REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency')
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager"""
     # Startup
     logger.info("Starting Bifrost API Gateway")
     
+    # Export spans of sampled, failed and slow requests in the background
+    configure_tracing()
+    
     # Initialize service registry
-    app.state.service_registry = ServiceRegistry()
+    app.state.service_registry = ServiceRegistry(sync_backend=create_sync_backend())
     await app.state.service_registry.initialize()
     
+    # Start background health checks of the upstream services
+    await app.state.service_registry.health_checker.start()
+    
+    # Resolve upstream hosts and open keep-alive connections before traffic
+    await app.state.service_registry.warmup.start()
+    await app.state.service_registry.warmup.wait(settings.PREWARM_TIMEOUT)
+    
+    # Load the signing keys used to verify bearer tokens
+    await app.state.authenticator.start()
+    
     logger.info("Bifrost API Gateway started successfully")
     
     yield
@@ -64,6 +69,10 @@ async def lifespan(app: FastAPI):
     logger.info("Shutting down Bifrost API Gateway")
     if hasattr(app.state, 'service_registry'):
         await app.state.service_registry.cleanup()
+    await app.state.rate_limiter.close()
+    await app.state.authenticator.stop()
+    tracer.shutdown()
+    mark_process_dead(os.getpid())
 
 def create_app() -> FastAPI:
     """Create and configure FastAPI application"""
@@ -87,7 +96,18 @@ def create_app() -> FastAPI:
     
     app.add_middleware(TrustedHostMiddleware, allowed_hosts=settings.ALLOWED_HOSTS)
     app.add_middleware(LoggingMiddleware)
-    app.add_middleware(RateLimitMiddleware)
+    app.state.rate_limiter = create_rate_limiter()
+    app.add_middleware(
+        RateLimitMiddleware,
+        limit=settings.RATE_LIMIT_PER_MINUTE,
+        backend=app.state.rate_limiter,
+    )
+    app.add_middleware(MetricsMiddleware)
+    # Outermost, so the root span covers every other middleware
+    app.add_middleware(TracingMiddleware)
+    # Marks X-Profile requests for the profiler; outermost to cover them all
+    app.add_middleware(ProfilingMiddleware)
+    app.state.authenticator = create_authenticator()
     
     # Add routes
     app.include_router(api_router, prefix="/api/v1")
@@ -97,10 +117,21 @@ def create_app() -> FastAPI:
     async def health_check():
         return {"status": "healthy", "service": "bifrost"}
     
+    # Readiness endpoint: ready once the startup warm-up has finished
+    @app.get("/ready")
+    async def readiness_check(request: Request):
+        registry = getattr(request.app.state, "service_registry", None)
+        ready = registry is not None and registry.warmup.ready
+        return JSONResponse(
+            {"status": "ready" if ready else "warming", "service": "bifrost"},
+            status_code=200 if ready else 503
+        )
+    
     # Metrics endpoint
     @app.get("/metrics")
-    async def metrics():
-        return Response(generate_latest(), media_type="text/plain")
+    async def metrics(request: Request):
+        content, content_type = render_metrics(request.headers.get("accept"))
+        return Response(content, headers={"Content-Type": content_type})
     
     # Root endpoint
     @app.get("/")
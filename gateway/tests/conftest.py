@@ -3,3 +3,66 @@
 #
 # @author bnbong bbbong9@gmail.com
 # --------------------------------------------------------------------------
+import asyncio
+import time
+from typing import Any, AsyncIterator, Callable, Dict
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from jose import jwt
+
+from src.core.auth import Authenticator, KeySet
+from src.core.pools import ConnectionPoolManager
+from src.core.router import router
+from src.core.services import ServiceRegistry
+
+Handler = Callable[[httpx.Request], httpx.Response]
+
+# Shared secret of the tokens the test gateway accepts
+TOKEN_SECRET = "test-secret"
+
+
+def admin_headers() -> Dict[str, str]:
+    """Authorization header of a token granting the admin scope"""
+    claims = {"sub": "ops", "scope": "admin", "exp": int(time.time()) + 300}
+    return {"Authorization": f"Bearer {jwt.encode(claims, TOKEN_SECRET)}"}
+
+
+class ChunkedStream(httpx.AsyncByteStream):
+    """Upstream body delivered in fixed-size chunks, as a socket would"""
+
+    def __init__(self, body: bytes, chunk_size: int = 1024):
+        self.body = body
+        self.chunk_size = chunk_size
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for offset in range(0, len(self.body), self.chunk_size):
+            yield self.body[offset : offset + self.chunk_size]
+
+
+@pytest.fixture
+def gateway() -> Callable[[Dict[str, Dict[str, Any]], Handler], TestClient]:
+    """Build a gateway test client whose upstreams are served by a handler"""
+
+    def build(services: Dict[str, Dict[str, Any]], handler: Handler) -> TestClient:
+        registry = ServiceRegistry(
+            ConnectionPoolManager(lambda name, config: httpx.MockTransport(handler))
+        )
+
+        async def register() -> None:
+            for name, config in services.items():
+                await registry.add_service(name, config)
+
+        asyncio.run(register())
+
+        app = FastAPI()
+        app.include_router(router, prefix="/api/v1")
+        app.state.service_registry = registry
+        app.state.authenticator = Authenticator(
+            KeySet(None, secret=TOKEN_SECRET), algorithms=("HS256",)
+        )
+        return TestClient(app)
+
+    return build
@@ -0,0 +1,128 @@
+# --------------------------------------------------------------------------
+# Tests for offline bearer token verification.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+import time
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+from src.core.auth import Authenticator, AuthError, KeySet
+from tests.conftest import ChunkedStream, admin_headers
+
+
+def _signing_key(kid: str) -> Dict[str, Any]:
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    public = jwk.construct(pem, "RS256").public_key().to_dict()
+    return {"pem": pem, "jwk": {**public, "kid": kid}}
+
+
+def _token(key: Dict[str, Any], **claims: Any) -> str:
+    claims = {"sub": "bnbong", "exp": int(time.time()) + 300, **claims}
+    return jwt.encode(claims, key["pem"], "RS256", headers={"kid": key["jwk"]["kid"]})
+
+
+def _authenticator(
+    published: List[Dict[str, Any]], fetches: List[int]
+) -> Authenticator:
+    def handler(request: httpx.Request) -> httpx.Response:
+        fetches.append(1)
+        return httpx.Response(200, json={"keys": [key["jwk"] for key in published]})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    keys = KeySet("http://auth/.well-known/jwks.json", client=client)
+    return Authenticator(keys, algorithms=("RS256",))
+
+
+def test_verified_tokens_are_cached_and_rotated_keys_fetched() -> None:
+    """Test that claims are cached by token and unknown key ids refresh the JWKS."""
+
+    async def scenario() -> None:
+        old, new = _signing_key("old"), _signing_key("new")
+        published = [old]
+        fetches: List[int] = []
+        authenticator = _authenticator(published, fetches)
+        await authenticator.keys.refresh()
+
+        token = _token(old, scope="read write")
+        for _ in range(3):
+            assert (await authenticator.verify(token))["sub"] == "bnbong"
+        assert len(fetches) == 1
+
+        # A key rotated after the last refresh is fetched on first use
+        published.append(new)
+        authenticator.keys.min_refresh_interval = 0
+        assert (await authenticator.verify(_token(new)))["sub"] == "bnbong"
+        assert len(fetches) == 2
+
+        with pytest.raises(AuthError):
+            await authenticator.verify(_token(old, type="refresh"))
+        with pytest.raises(AuthError):
+            await authenticator.verify(_token(old, exp=int(time.time()) - 10))
+        assert authenticator.stats() == {"cached_tokens": 2, "keys": 2}
+
+    asyncio.run(scenario())
+
+
+def test_gateway_forwards_identity_and_drops_spoofed_headers(gateway) -> None:
+    """Test that protected routes need a token and upstreams get trusted headers."""
+    key = _signing_key("k1")
+    seen: List[httpx.Headers] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.headers)
+        return httpx.Response(200, stream=ChunkedStream(b"ok"))
+
+    services = {
+        "games": {
+            "url": "http://games.internal",
+            "auth": True,
+            "routes": [{"prefix": "/games/public", "auth": False}],
+        }
+    }
+    client = gateway(services, handler)
+    authenticator = _authenticator([key], [])
+    asyncio.run(authenticator.keys.refresh())
+    client.app.state.authenticator = authenticator
+
+    assert client.get("/api/v1/games/scores").status_code == 401
+    bad = client.get("/api/v1/games/scores", headers={"Authorization": "Bearer x.y.z"})
+    assert bad.status_code == 401
+    assert bad.headers["www-authenticate"].startswith("Bearer")
+
+    response = client.get(
+        "/api/v1/games/scores",
+        headers={"Authorization": f"Bearer {_token(key)}", "X-User-Id": "admin"},
+    )
+    assert response.status_code == 200
+    assert seen[-1]["x-user-id"] == "bnbong"
+
+    public = client.get("/api/v1/games/public", headers={"X-User-Id": "admin"})
+    assert public.status_code == 200
+    assert "x-user-id" not in seen[-1]
+
+
+def test_admin_endpoints_need_an_admin_token(gateway) -> None:
+    """Test that admin endpoints verify the caller's token and admin scope."""
+    client = gateway({"games": {"url": "http://games"}}, lambda request: None)
+
+    anonymous = client.get("/api/v1/admin/auth")
+    assert anonymous.status_code == 401
+    assert anonymous.headers["www-authenticate"] == "Bearer"
+    forged = {"Authorization": "Bearer x.y.z"}
+    assert client.get("/api/v1/admin/auth", headers=forged).status_code == 401
+
+    response = client.get("/api/v1/admin/auth", headers=admin_headers())
+    assert response.status_code == 200
+    assert response.json()["auth"] == {"cached_tokens": 1, "keys": 1}
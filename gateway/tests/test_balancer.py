@@ -0,0 +1,79 @@
+# --------------------------------------------------------------------------
+# Tests for upstream load balancing.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+from collections import Counter
+from typing import List
+
+import httpx
+import pytest
+
+from src.core.balancer import NoEndpointAvailable, build_balancer
+from tests.conftest import admin_headers
+
+
+def _endpoints(*weights: int) -> List[dict]:
+    return [{"url": f"http://game-{i}", "weight": w} for i, w in enumerate(weights)]
+
+
+def test_weighted_round_robin_follows_weights() -> None:
+    """Test that round-robin spreads requests in proportion to weights."""
+    balancer = build_balancer({"endpoints": _endpoints(3, 1)})
+    picks = Counter(balancer.select().url for _ in range(8))
+
+    assert picks == {"http://game-0": 6, "http://game-1": 2}
+
+
+def test_peak_ewma_avoids_slow_endpoint() -> None:
+    """Test that peak-EWMA prefers the endpoint with lower observed latency."""
+    balancer = build_balancer(
+        {"endpoints": _endpoints(1, 1), "load_balancer": {"policy": "peak_ewma"}}
+    )
+    slow, fast = balancer.endpoints
+    for endpoint, latency in ((slow, 0.5), (fast, 0.01)):
+        endpoint.start()
+        balancer.record(endpoint, latency, True)
+
+    assert all(balancer.select() is fast for _ in range(5))
+
+
+def test_consistent_hash_is_sticky_and_skips_excluded() -> None:
+    """Test that a hash key maps to one endpoint until it is excluded."""
+    balancer = build_balancer(
+        {
+            "endpoints": _endpoints(1, 1, 1),
+            "load_balancer": {"policy": "consistent_hash", "hash_header": "x-user"},
+        }
+    )
+    key = balancer.hash_key({"x-user": "bnbong"}, "10.0.0.1")
+    chosen = balancer.select(key)
+
+    assert all(balancer.select(key) is chosen for _ in range(10))
+    assert balancer.select(key, exclude={chosen.url}) is not chosen
+    with pytest.raises(NoEndpointAvailable):
+        balancer.select(key, exclude={e.url for e in balancer.endpoints})
+
+
+def test_least_outstanding_spreads_proxied_requests(gateway) -> None:
+    """Test that proxied requests reach every endpoint of a service."""
+    hosts: List[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        hosts.append(request.url.host)
+        return httpx.Response(200)
+
+    config = {
+        "endpoints": _endpoints(1, 1),
+        "load_balancer": {"policy": "least_outstanding"},
+        "streaming": False,
+    }
+    client = gateway({"games": config}, handler)
+    for _ in range(20):
+        client.get("/api/v1/games/ping")
+
+    assert set(hosts) == {"game-0", "game-1"}
+    stats_response = client.get("/api/v1/admin/endpoints", headers=admin_headers())
+    state = stats_response.json()["services"]["games"]
+    assert sum(e["requests"] for e in state["endpoints"]) == 20
+    assert all(e["outstanding"] == 0 for e in state["endpoints"])
@@ -0,0 +1,96 @@
+# --------------------------------------------------------------------------
+# Tests for the gateway response cache.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+from typing import List
+
+import httpx
+
+from src.core.cache import CachedResponse, ResponseCache
+from tests.conftest import admin_headers
+
+
+def test_repeated_get_is_served_from_cache(gateway) -> None:
+    """Test that a cacheable response is fetched from upstream only once."""
+    calls: List[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        return httpx.Response(200, json={"games": 3})
+
+    client = gateway({"games": {"url": "http://games", "cache": {"ttl": 60}}}, handler)
+    first = client.get("/api/v1/games/list")
+    second = client.get("/api/v1/games/list")
+
+    assert first.headers["x-cache"] == "MISS"
+    assert second.headers["x-cache"] == "HIT"
+    assert second.json() == {"games": 3}
+    assert calls == ["/list"]
+
+    response = client.get("/api/v1/admin/cache", headers=admin_headers())
+    stats = response.json()["caches"]["games"]
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_no_store_and_vary_are_respected(gateway) -> None:
+    """Test that no-store is not cached and Vary selects separate variants."""
+    calls: List[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        if request.url.path == "/private":
+            return httpx.Response(200, headers={"cache-control": "no-store"})
+        language = request.headers.get("accept-language", "")
+        return httpx.Response(200, headers={"vary": "Accept-Language"}, text=language)
+
+    client = gateway({"games": {"url": "http://games", "cache": {}}}, handler)
+    client.get("/api/v1/games/private")
+    client.get("/api/v1/games/private")
+    english = client.get("/api/v1/games/intro", headers={"accept-language": "en"})
+    korean = client.get("/api/v1/games/intro", headers={"accept-language": "ko"})
+    again = client.get("/api/v1/games/intro", headers={"accept-language": "ko"})
+
+    assert calls == ["/private", "/private", "/intro", "/intro"]
+    assert (english.text, korean.text, again.text) == ("en", "ko", "ko")
+    assert again.headers["x-cache"] == "HIT"
+
+
+def test_stale_entry_is_revalidated_with_etag(gateway) -> None:
+    """Test that an expired entry is refreshed by a conditional request."""
+    conditional: List[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.headers.get("if-none-match") == '"v1"':
+            conditional.append(request.url.path)
+            return httpx.Response(304, headers={"etag": '"v1"'})
+        return httpx.Response(
+            200, headers={"etag": '"v1"', "cache-control": "max-age=0"}, text="board"
+        )
+
+    client = gateway({"games": {"url": "http://games", "cache": {}}}, handler)
+    client.get("/api/v1/games/board")
+    response = client.get("/api/v1/games/board")
+
+    assert response.headers["x-cache"] == "REVALIDATED"
+    assert response.text == "board"
+    assert conditional == ["/board"]
+
+    # Purging needs an admin token
+    assert client.delete("/api/v1/admin/cache/games").status_code == 401
+    assert client.delete("/api/v1/admin/cache").status_code == 401
+    purged = client.delete("/api/v1/admin/cache/games", headers=admin_headers()).json()
+    assert purged["purged"] == 1
+
+
+def test_lru_eviction_keeps_byte_budget() -> None:
+    """Test that least recently used keys are evicted past max_bytes."""
+    cache = ResponseCache("games", {"max_bytes": 250})
+    for key in ("/a", "/b", "/c"):
+        cache.store(key, {}, (), CachedResponse(200, [], b"x" * 100, fresh_for=60))
+        cache.lookup("/a", {})
+
+    assert cache.lookup("/a", {}) is not None
+    assert cache.lookup("/b", {}) is None
+    assert cache.current_bytes <= 250
+    assert cache.counters["evictions"] == 1
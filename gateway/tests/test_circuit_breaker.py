@@ -0,0 +1,74 @@
+# --------------------------------------------------------------------------
+# Tests for upstream circuit breakers.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import time
+from typing import List
+
+import httpx
+
+from src.core.circuit_breaker import (
+    CLOSED,
+    DEFAULT_BREAKER_CONFIG,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+)
+
+
+def test_breaker_opens_and_recovers_through_half_open() -> None:
+    """Test the closed -> open -> half-open -> closed cycle."""
+    config = {**DEFAULT_BREAKER_CONFIG, "consecutive_failures": 2, "open_duration": 0}
+    breaker = CircuitBreaker("games", "http://games", config)
+
+    breaker.record(0.1, False)
+    assert breaker.state == CLOSED
+    breaker.record(0.1, False)
+    assert breaker.state == OPEN
+
+    breaker.acquire(time.monotonic())
+    assert breaker.state == HALF_OPEN
+    assert not breaker.available(time.monotonic())
+    breaker.record(0.1, True)
+    assert breaker.state == CLOSED
+
+
+def test_breaker_trips_on_slow_call_rate() -> None:
+    """Test that a latency threshold opens the circuit."""
+    config = {
+        **DEFAULT_BREAKER_CONFIG,
+        "min_requests": 4,
+        "slow_call_threshold": 1.0,
+    }
+    breaker = CircuitBreaker("games", "http://games", config)
+    for latency in (0.1, 2.0, 0.1, 2.0):
+        breaker.record(latency, True)
+
+    assert breaker.state == OPEN
+
+
+def test_open_circuit_fails_fast_with_retry_after(gateway) -> None:
+    """Test that an open circuit answers 503 without calling the upstream."""
+    calls: List[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        return httpx.Response(502)
+
+    config = {
+        "url": "http://games",
+        "streaming": False,
+        "circuit_breaker": {"consecutive_failures": 3, "open_duration": 30},
+    }
+    client = gateway({"games": config}, handler)
+    for _ in range(3):
+        assert client.get("/api/v1/games/score").status_code == 502
+
+    response = client.get("/api/v1/games/score")
+    assert response.status_code == 503
+    assert 0 < int(response.headers["retry-after"]) <= 30
+    assert len(calls) == 3
+
+    circuits = client.get("/api/v1/services/circuits").json()
+    assert circuits["circuit_breakers"]["games"]["state"] == OPEN
@@ -0,0 +1,103 @@
+# --------------------------------------------------------------------------
+# Tests for request coalescing.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+from typing import List
+
+import httpx
+
+from src.core.pools import ConnectionPoolManager
+from src.core.services import ServiceProxy, ServiceRegistry
+
+
+def _registry(calls: List[str]) -> ServiceRegistry:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.headers.get("authorization", ""))
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"leaderboard": [1, 2, 3]})
+
+    return ServiceRegistry(
+        ConnectionPoolManager(lambda name, config: httpx.MockTransport(handler))
+    )
+
+
+def test_identical_gets_share_one_upstream_call() -> None:
+    """Test that a burst of identical GETs becomes a single upstream call."""
+    calls: List[str] = []
+
+    async def scenario() -> None:
+        registry = _registry(calls)
+        await registry.add_service("games", {"url": "http://games", "coalesce": True})
+        proxy = ServiceProxy(registry)
+
+        results = await asyncio.gather(
+            *[
+                proxy.forward_coalesced_request("games", "/top", {}, {"page": "1"})
+                for _ in range(5)
+            ]
+        )
+
+        assert len(calls) == 1
+        assert all(result.body == results[0].body for result in results)
+        assert len({id(result.headers) for result in results}) == 5
+        assert registry.coalescer.stats()["games"] == {
+            "leaders": 1,
+            "collapsed": 4,
+            "in_flight": 0,
+        }
+
+    asyncio.run(scenario())
+
+
+def test_different_credentials_are_not_coalesced() -> None:
+    """Test that requests with different Authorization headers stay apart."""
+    calls: List[str] = []
+
+    async def scenario() -> None:
+        registry = _registry(calls)
+        await registry.add_service("games", {"url": "http://games", "coalesce": True})
+        proxy = ServiceProxy(registry)
+
+        await asyncio.gather(
+            proxy.forward_coalesced_request("games", "/me", {"authorization": "a"}),
+            proxy.forward_coalesced_request("games", "/me", {"authorization": "b"}),
+        )
+
+        assert sorted(calls) == ["a", "b"]
+
+    asyncio.run(scenario())
+
+
+def test_conditional_and_ranged_gets_are_not_coalesced() -> None:
+    """Test that plain GETs never receive a 304 or 206 meant for another request."""
+    calls: List[str] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        await asyncio.sleep(0.05)
+        if "if-none-match" in request.headers:
+            return httpx.Response(304)
+        if "range" in request.headers:
+            return httpx.Response(206, content=b"ab")
+        return httpx.Response(200, content=b"abcdef")
+
+    async def scenario() -> None:
+        registry = ServiceRegistry(
+            ConnectionPoolManager(lambda name, config: httpx.MockTransport(handler))
+        )
+        await registry.add_service("files", {"url": "http://files", "coalesce": True})
+        proxy = ServiceProxy(registry)
+
+        for special in ({"if-none-match": '"v1"'}, {"range": "bytes=0-1"}):
+            leader, follower = await asyncio.gather(
+                proxy.forward_coalesced_request("files", "/report", special),
+                proxy.forward_coalesced_request("files", "/report", {}),
+            )
+            assert leader.status_code in (304, 206)
+            assert (follower.status_code, follower.body) == (200, b"abcdef")
+
+        assert len(calls) == 4
+
+    asyncio.run(scenario())
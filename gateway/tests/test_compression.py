@@ -0,0 +1,101 @@
+# --------------------------------------------------------------------------
+# Tests for negotiated response compression.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import json
+
+import httpx
+
+from src.core.compression import BROTLI, GZIP, ZSTD, negotiate
+from tests.conftest import ChunkedStream, admin_headers
+
+PAYLOAD = json.dumps([{"id": i, "name": f"player-{i}"} for i in range(200)]).encode()
+
+
+def test_negotiate_honors_quality_values() -> None:
+    """Test Accept-Encoding negotiation against the server preference."""
+    preference = [BROTLI, ZSTD, GZIP]
+
+    assert negotiate("gzip, deflate, br", preference) == BROTLI
+    assert negotiate("br;q=0, gzip;q=0.5", preference) == GZIP
+    assert negotiate("*", [GZIP]) == GZIP
+    assert negotiate("identity", preference) is None
+    assert negotiate(None, preference) is None
+
+
+def test_cached_responses_are_compressed_once(gateway) -> None:
+    """Test that cache hits reuse the compressed body of their entry."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200,
+            headers={"content-type": "application/json", "cache-control": "max-age=60"},
+            content=PAYLOAD,
+        )
+
+    client = gateway({"games": {"url": "http://games", "cache": True}}, handler)
+
+    for outcome in ("MISS", "HIT"):
+        response = client.get(
+            "/api/v1/games/scores", headers={"accept-encoding": "gzip"}
+        )
+        assert response.headers["x-cache"] == outcome
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.content == PAYLOAD
+
+    identity = client.get(
+        "/api/v1/games/scores", headers={"accept-encoding": "identity"}
+    )
+    assert "content-encoding" not in identity.headers
+    assert identity.content == PAYLOAD
+
+    stats_response = client.get("/api/v1/admin/compression", headers=admin_headers())
+
+    stats = stats_response.json()["compression"]["games"]
+    assert stats["by_encoding"]["gzip"]["responses"] == 1
+    assert stats["by_encoding"]["gzip"]["ratio"] < 0.5
+    assert stats["cache_hits"] == 1
+
+
+def test_private_responses_are_not_kept_compressed(gateway) -> None:
+    """Test that responses the cache refused to store are compressed per request."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200,
+            headers={"content-type": "application/json", "cache-control": "private"},
+            content=PAYLOAD,
+        )
+
+    client = gateway({"games": {"url": "http://games", "cache": True}}, handler)
+
+    response = client.get("/api/v1/games/me", headers={"accept-encoding": "gzip"})
+    assert response.headers["x-cache"] == "MISS"
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == PAYLOAD
+
+    stats_response = client.get("/api/v1/admin/compression", headers=admin_headers())
+
+    stats = stats_response.json()["compression"]["games"]
+    assert stats["cache_entries"] == 0
+    assert stats["by_encoding"]["gzip"]["responses"] == 1
+
+
+def test_streamed_bodies_are_compressed_incrementally(gateway) -> None:
+    """Test that an unencoded streamed body is gzipped on the fly."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200,
+            headers={"content-type": "text/plain", "etag": '"v1"'},
+            stream=ChunkedStream(b"bifrost " * 20_000),
+        )
+
+    client = gateway({"files": {"url": "http://files"}}, handler)
+    response = client.get("/api/v1/files/log", headers={"accept-encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == 'W/"v1"'
+    assert response.content == b"bifrost " * 20_000
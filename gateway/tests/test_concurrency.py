@@ -0,0 +1,136 @@
+# --------------------------------------------------------------------------
+# Tests for adaptive concurrency limits and load shedding.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+
+import httpx
+import pytest
+
+from src.core.concurrency import (
+    DEFAULT_CONCURRENCY_CONFIG,
+    AIMDLimit,
+    ConcurrencyLimiter,
+    ConcurrencyLimitExceeded,
+    GradientLimit,
+)
+from tests.conftest import ChunkedStream, admin_headers
+
+
+def test_gradient_limit_follows_latency() -> None:
+    """Test that the limit grows at steady latency and shrinks when it rises."""
+    limit = GradientLimit(initial_limit=10, min_limit=1, max_limit=100)
+    for _ in range(50):
+        limit.update(0.01, in_flight=int(limit.limit), dropped=False)
+    grown = limit.limit
+    assert grown > 20
+
+    for _ in range(20):
+        limit.update(0.1, in_flight=int(limit.limit), dropped=False)
+    assert limit.limit < grown / 2
+
+    # An idle service keeps its limit
+    before = limit.limit
+    limit.update(0.01, in_flight=0, dropped=False)
+    assert limit.limit == before
+
+
+def test_aimd_limit_backs_off_on_drops() -> None:
+    """Test that AIMD grows by one when busy and backs off on drops and slow calls."""
+    limit = AIMDLimit(
+        initial_limit=10, min_limit=2, max_limit=12, backoff=0.5, latency_threshold=1
+    )
+    assert limit.update(0.1, in_flight=10, dropped=False) == 11
+    assert limit.update(0.1, in_flight=1, dropped=False) == 11
+    assert limit.update(0.1, in_flight=10, dropped=True) == 5.5
+    assert limit.update(2.0, in_flight=5, dropped=False) == 2.75
+    assert limit.update(0.1, in_flight=1, dropped=True) == 2
+
+
+def test_limiter_queues_then_sheds() -> None:
+    """Test that excess requests wait in order and are shed when the queue is full or late."""
+    config = {
+        **DEFAULT_CONCURRENCY_CONFIG,
+        "initial_limit": 1,
+        "max_limit": 1,
+        "queue_size": 1,
+        "queue_timeout": 0.2,
+    }
+
+    async def scenario() -> None:
+        limiter = ConcurrencyLimiter("games", config)
+        held = await limiter.acquire()
+
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(ConcurrencyLimitExceeded) as full:
+            await limiter.acquire()
+        assert full.value.reason == "queue_full"
+
+        # A released slot goes straight to the waiting request
+        held.release()
+        handed = await waiting
+        assert limiter.in_flight == 1
+
+        with pytest.raises(ConcurrencyLimitExceeded) as late:
+            await limiter.acquire()
+        assert late.value.reason == "timeout"
+        handed.release()
+        assert limiter.stats() == {
+            "algorithm": "gradient",
+            "limit": 1,
+            "in_flight": 0,
+            "queued": 0,
+            "shed": {"queue_full": 1, "timeout": 1},
+        }
+
+    asyncio.run(scenario())
+
+
+def test_overloaded_service_is_shed_without_affecting_others(gateway) -> None:
+    """Test that requests over a service's limit get 503 while other services answer."""
+    release = asyncio.Event()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "slow":
+            await release.wait()
+        return httpx.Response(200, stream=ChunkedStream(b"ok"))
+
+    client = gateway(
+        {
+            "slow": {
+                "url": "http://slow",
+                "concurrency": {"initial_limit": 2, "max_limit": 2, "queue_size": 1},
+            },
+            "fast": {"url": "http://fast"},
+        },
+        handler,
+    )
+
+    async def scenario() -> None:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=client.app), base_url="http://gateway"
+        ) as http:
+            slow = [
+                asyncio.ensure_future(http.get("/api/v1/slow/items")) for _ in range(4)
+            ]
+            for _ in range(100):
+                if any(task.done() for task in slow):
+                    break
+                await asyncio.sleep(0.01)
+
+            shed = await next(task for task in slow if task.done())
+            assert shed.status_code == 503
+            assert shed.headers["retry-after"] == "1"
+            assert (await http.get("/api/v1/fast/items")).status_code == 200
+
+            release.set()
+            statuses = sorted([(await task).status_code for task in slow])
+            assert statuses == [200, 200, 200, 503]
+
+    asyncio.run(scenario())
+    stats_response = client.get("/api/v1/admin/concurrency", headers=admin_headers())
+    stats = stats_response.json()["concurrency"]
+    assert stats["slow"]["shed"] == {"queue_full": 1, "timeout": 0}
+    assert stats["slow"]["in_flight"] == 0
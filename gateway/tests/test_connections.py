@@ -0,0 +1,298 @@
+# --------------------------------------------------------------------------
+# Tests for WebSocket and server-sent event proxying.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List
+
+import httpx
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from src.core.connections import CLOSE_GOING_AWAY, CLOSE_TRY_AGAIN_LATER
+from tests.conftest import ChunkedStream
+
+websockets = pytest.importorskip("websockets")
+
+
+@pytest.fixture
+def echo_server() -> Iterator[str]:
+    """Upstream WebSocket server on loopback echoing each message with its path"""
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    state: Dict[str, Any] = {}
+
+    async def echo(connection: Any, path: str) -> None:
+        async for message in connection:
+            if isinstance(message, str):
+                await connection.send(f"{path} {message}")
+            else:
+                await connection.send(message)
+
+    async def serve() -> None:
+        state["server"] = await websockets.serve(echo, "127.0.0.1", 0)
+        state["port"] = state["server"].sockets[0].getsockname()[1]
+        started.set()
+
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(serve(), loop)
+    started.wait(5)
+    yield f"http://127.0.0.1:{state['port']}"
+
+    async def stop() -> None:
+        state["server"].close()
+        await state["server"].wait_closed()
+
+    asyncio.run_coroutine_threadsafe(stop(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+
+
+def test_websocket_messages_are_relayed_both_ways(gateway, echo_server) -> None:
+    """Test that text and binary messages reach the upstream route and come back."""
+    client = gateway(
+        {
+            "games": {
+                "url": echo_server,
+                "routes": [{"prefix": "/play", "rewrite": "/ws"}],
+            }
+        },
+        lambda request: httpx.Response(404),
+    )
+    registry = client.app.state.service_registry
+
+    with client.websocket_connect("/api/v1/play/room-1") as websocket:
+        websocket.send_text("hello")
+        assert websocket.receive_text() == "/ws/room-1 hello"
+        websocket.send_bytes(b"\x00\x01")
+        assert websocket.receive_bytes() == b"\x00\x01"
+        assert registry.connections.stats()["games"]["open"] == {"websocket": 1}
+
+    for _ in range(50):
+        if not registry.connections.count("games"):
+            break
+        time.sleep(0.01)
+    assert registry.connections.count("games") == 0
+
+
+def test_websocket_connections_are_capped_per_service(gateway, echo_server) -> None:
+    """Test that connections beyond max_connections are refused."""
+    client = gateway(
+        {"games": {"url": echo_server, "connections": {"max_connections": 1}}},
+        lambda request: httpx.Response(404),
+    )
+
+    with client.websocket_connect("/api/v1/games/a") as first:
+        first.send_text("ping")
+        first.receive_text()
+        with pytest.raises(WebSocketDisconnect) as refused:
+            with client.websocket_connect("/api/v1/games/b"):
+                pass
+        assert refused.value.code == CLOSE_TRY_AGAIN_LATER
+
+    stats = client.app.state.service_registry.connections.stats()
+    assert stats["games"]["rejected"] == 1
+
+
+def test_idle_websocket_is_closed(gateway, echo_server) -> None:
+    """Test that a connection without messages is closed after idle_timeout."""
+    client = gateway(
+        {"games": {"url": echo_server, "connections": {"idle_timeout": 0.2}}},
+        lambda request: httpx.Response(404),
+    )
+
+    with client.websocket_connect("/api/v1/games/idle") as websocket:
+        message = websocket.receive()
+    assert message["type"] == "websocket.close"
+    assert message["code"] == CLOSE_GOING_AWAY
+
+
+class EventSource(httpx.AsyncByteStream):
+    """Upstream event stream that waits for a signal before each event"""
+
+    def __init__(self, events: List[bytes], gates: List[asyncio.Event]):
+        self.events = events
+        self.gates = gates
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for event, gate in zip(self.events, self.gates):
+            await gate.wait()
+            yield event
+
+
+async def _call(app: Any, path: str, sent: List[Dict[str, Any]]) -> None:
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "scheme": "http",
+        "query_string": b"",
+        "headers": [(b"host", b"testserver"), (b"accept", b"text/event-stream")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("testserver", 80),
+    }
+    disconnected = asyncio.Event()
+
+    async def receive() -> Dict[str, Any]:
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Dict[str, Any]) -> None:
+        sent.append(message)
+
+    await app(scope, receive, send)
+
+
+def test_event_stream_is_forwarded_as_events_arrive(gateway) -> None:
+    """Test that each event reaches the client before the next one is produced."""
+    events = [b"data: one\n\n", b"data: two\n\n"]
+    gates: List[asyncio.Event] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200,
+            headers={"content-type": "text/event-stream"},
+            stream=EventSource(events, gates),
+        )
+
+    client = gateway({"live": {"url": "http://live", "cache": True}}, handler)
+    registry = client.app.state.service_registry
+
+    async def scenario() -> None:
+        gates.extend([asyncio.Event(), asyncio.Event()])
+        sent: List[Dict[str, Any]] = []
+        call = asyncio.ensure_future(_call(client.app, "/api/v1/live/feed", sent))
+
+        gates[0].set()
+        for _ in range(100):
+            if any(message.get("body") == events[0] for message in sent):
+                break
+            await asyncio.sleep(0.01)
+        # The first event was sent while the upstream still holds the second
+        assert [message.get("body") for message in sent[1:]] == [events[0]]
+        assert registry.connections.stats()["live"]["open"] == {"sse": 1}
+
+        gates[1].set()
+        await asyncio.wait_for(call, 5)
+        bodies = [message.get("body") for message in sent[1:] if message.get("body")]
+        assert bodies == events
+        assert sent[0]["status"] == 200
+        assert (b"content-type", b"text/event-stream") in sent[0]["headers"]
+        assert (b"x-accel-buffering", b"no") in sent[0]["headers"]
+        assert registry.connections.count("live") == 0
+
+    asyncio.run(scenario())
+
+
+def test_event_stream_cap_and_idle_timeout(gateway) -> None:
+    """Test that streams beyond the cap get 503 and silent streams are ended."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200,
+            headers={"content-type": "text/event-stream"},
+            stream=EventSource([b"data: never\n\n"], [asyncio.Event()]),
+        )
+
+    client = gateway(
+        {
+            "live": {
+                "url": "http://live",
+                "connections": {"max_connections": 1, "idle_timeout": 0.3},
+            }
+        },
+        handler,
+    )
+
+    async def scenario() -> None:
+        first: List[Dict[str, Any]] = []
+        call = asyncio.ensure_future(_call(client.app, "/api/v1/live/feed", first))
+        await asyncio.sleep(0.1)
+
+        second: List[Dict[str, Any]] = []
+        await _call(client.app, "/api/v1/live/feed", second)
+        assert second[0]["status"] == 503
+
+        # The first stream ends once it has been idle for idle_timeout
+        await asyncio.wait_for(call, 5)
+        assert first[0]["status"] == 200
+        assert first[-1] == {
+            "type": "http.response.body",
+            "body": b"",
+            "more_body": False,
+        }
+
+    asyncio.run(scenario())
+
+
+def test_open_event_stream_takes_no_concurrency_slot(gateway) -> None:
+    """Test that a subscriber left open does not block other requests."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/feed":
+            return httpx.Response(
+                200,
+                headers={"content-type": "text/event-stream"},
+                stream=EventSource([b"data: never\n\n"], [asyncio.Event()]),
+            )
+        return httpx.Response(200, stream=ChunkedStream(b"ok"))
+
+    client = gateway(
+        {
+            "live": {
+                "url": "http://live",
+                "concurrency": {"initial_limit": 1, "max_limit": 1, "queue_size": 0},
+            }
+        },
+        handler,
+    )
+    limiter = client.app.state.service_registry.concurrency.get("live")
+
+    async def scenario() -> None:
+        sent: List[Dict[str, Any]] = []
+        call = asyncio.ensure_future(_call(client.app, "/api/v1/live/feed", sent))
+        for _ in range(100):
+            if sent:
+                break
+            await asyncio.sleep(0.01)
+        assert sent[0]["status"] == 200
+        assert limiter.in_flight == 0
+
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=client.app), base_url="http://gateway"
+        ) as http:
+            assert (await http.get("/api/v1/live/scores")).status_code == 200
+        call.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_event_stream_opened_by_a_post_sends_its_body(gateway) -> None:
+    """Test that a POST subscribing to events still sends its body upstream."""
+    received: List[bytes] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        received.append(request.read())
+        return httpx.Response(
+            200,
+            headers={"content-type": "text/event-stream"},
+            stream=ChunkedStream(b"data: subscribed\n\n"),
+        )
+
+    client = gateway({"live": {"url": "http://live"}}, handler)
+    response = client.post(
+        "/api/v1/live/subscribe",
+        content=b'{"topics": ["scores"]}',
+        headers={"accept": "text/event-stream"},
+    )
+
+    assert response.status_code == 200
+    assert response.content == b"data: subscribed\n\n"
+    assert received == [b'{"topics": ["scores"]}']
@@ -0,0 +1,129 @@
+# --------------------------------------------------------------------------
+# Tests for request deadlines and per-phase timeouts.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+from typing import List
+
+import httpx
+from prometheus_client import REGISTRY
+
+from src.core.deadlines import Deadline, phase_timeouts
+from tests.conftest import ChunkedStream, admin_headers
+
+
+def _exceeded(service: str, phase: str) -> float:
+    labels = {"service": service, "phase": phase}
+    return REGISTRY.get_sample_value("bifrost_deadline_exceeded_total", labels) or 0
+
+
+def test_client_budget_can_only_shorten_the_deadline() -> None:
+    """Test that the client header lowers the configured budget but never raises it."""
+    assert Deadline.for_request({"x-request-timeout-ms": "250"}, 30).budget == 0.25
+    assert not Deadline.for_request({"x-request-timeout-ms": "250"}, 30).expired()
+    assert Deadline.for_request({"x-request-timeout-ms": "90000"}, 30).budget == 30
+    assert Deadline.for_request({"x-request-timeout-ms": "soon"}, 30).budget == 30
+    assert Deadline.for_request({}, 30).requested is False
+    assert Deadline.for_request({"x-request-timeout-ms": "0"}, 30).expired()
+
+    timeout = phase_timeouts({"timeouts": {"connect": 1, "read": 60}}, budget=10)
+    assert (timeout.pool, timeout.connect, timeout.write, timeout.read) == (
+        5,
+        1,
+        10,
+        10,
+    )
+    assert phase_timeouts({}, budget=10, long_lived=True).read is None
+
+    clamped = Deadline(2).clamp(timeout)
+    assert clamped.connect == 1
+    assert 1.9 < clamped.read <= 2
+
+
+def test_remaining_budget_is_forwarded_upstream(gateway) -> None:
+    """Test that upstreams are told the budget left, from the route or the client."""
+    budgets: List[int] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        budgets.append(int(request.headers["x-request-timeout-ms"]))
+        return httpx.Response(200, stream=ChunkedStream(b"ok"))
+
+    client = gateway({"games": {"url": "http://games", "timeout": 5}}, handler)
+
+    assert client.get("/api/v1/games/scores").status_code == 200
+    response = client.get(
+        "/api/v1/games/scores", headers={"x-request-timeout-ms": "800"}
+    )
+    assert response.status_code == 200
+    assert 4000 < budgets[0] <= 5000
+    assert 0 < budgets[1] <= 800
+
+
+def test_requests_out_of_budget_get_504_by_phase(gateway) -> None:
+    """Test that spent budgets fail fast and slow upstreams are cut off at the deadline."""
+    calls: List[str] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        if request.url.path == "/slow":
+            await asyncio.sleep(1)
+        return httpx.Response(200, stream=ChunkedStream(b"ok"))
+
+    client = gateway({"games": {"url": "http://games"}}, handler)
+    spent, read = _exceeded("games", "gateway"), _exceeded("games", "read")
+
+    response = client.get("/api/v1/games/fast", headers={"x-request-timeout-ms": "0"})
+    assert response.status_code == 504
+    assert calls == []
+
+    response = client.get("/api/v1/games/slow", headers={"x-request-timeout-ms": "100"})
+    assert response.status_code == 504
+    assert calls == ["/slow"]
+    assert _exceeded("games", "gateway") == spent + 1
+    assert _exceeded("games", "read") == read + 1
+
+    # The client's own short budget does not count against the upstream
+    breaker = client.get("/api/v1/services/circuits").json()["circuit_breakers"][
+        "games"
+    ]
+    assert breaker["endpoints"]["http://games"]["consecutive_failures"] == 0
+
+
+def test_queue_wait_is_bounded_by_the_deadline(gateway) -> None:
+    """Test that a request queued for a concurrency slot gives up at its deadline."""
+    release = asyncio.Event()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await release.wait()
+        return httpx.Response(200, stream=ChunkedStream(b"ok"))
+
+    client = gateway(
+        {
+            "games": {
+                "url": "http://games",
+                "concurrency": {"initial_limit": 1, "max_limit": 1, "queue_timeout": 5},
+            }
+        },
+        handler,
+    )
+    queued = _exceeded("games", "queue")
+
+    async def scenario() -> None:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=client.app), base_url="http://gateway"
+        ) as http:
+            held = asyncio.ensure_future(http.get("/api/v1/games/a"))
+            await asyncio.sleep(0.05)
+            late = await http.get(
+                "/api/v1/games/b", headers={"x-request-timeout-ms": "100"}
+            )
+            assert late.status_code == 504
+            release.set()
+            assert (await held).status_code == 200
+
+    asyncio.run(scenario())
+    assert _exceeded("games", "queue") == queued + 1
+    stats_response = client.get("/api/v1/admin/concurrency", headers=admin_headers())
+    stats = stats_response.json()["concurrency"]
+    assert stats["games"]["shed"] == {"queue_full": 0, "timeout": 0}
@@ -0,0 +1,104 @@
+# --------------------------------------------------------------------------
+# Tests for background health checking.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+from typing import List
+
+import httpx
+
+from src.core.pools import ConnectionPoolManager
+from src.core.services import ServiceProxy, ServiceRegistry
+
+SERVICE = {
+    "endpoints": [{"url": "http://game-0"}, {"url": "http://game-1"}],
+    "health_check": {"path": "/health", "interval": 0.01, "unhealthy_threshold": 2},
+}
+
+
+def _handler(hosts: List[str]):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/health":
+            return httpx.Response(503 if request.url.host == "game-0" else 200)
+        hosts.append(request.url.host)
+        return httpx.Response(200)
+
+    return handler
+
+
+def _registry(hosts: List[str]) -> ServiceRegistry:
+    handler = _handler(hosts)
+    return ServiceRegistry(
+        ConnectionPoolManager(lambda name, config: httpx.MockTransport(handler))
+    )
+
+
+def test_proxy_skips_endpoints_marked_unhealthy() -> None:
+    """Test that background probes take failing endpoints out of rotation."""
+    hosts: List[str] = []
+
+    async def scenario() -> None:
+        registry = _registry(hosts)
+        await registry.add_service("games", SERVICE)
+        await registry.health_checker.start()
+        await asyncio.sleep(0.1)
+
+        health = registry.service_health("games")
+        assert health is not None and health["healthy"]
+        assert health["endpoints"]["http://game-0"]["healthy"] is False
+
+        proxy = ServiceProxy(registry)
+        for _ in range(6):
+            await proxy.forward_request("games", "GET", "/play", {})
+        assert set(hosts) == {"game-1"}
+        await registry.cleanup()
+
+    asyncio.run(scenario())
+
+
+def test_no_content_is_healthy_and_all_down_fails_open() -> None:
+    """Test that 2xx probes pass and a service with no healthy endpoint still works."""
+    hosts: List[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/health":
+            return httpx.Response(204)
+        if request.url.path == "/down":
+            return httpx.Response(404)
+        hosts.append(request.url.host)
+        return httpx.Response(200)
+
+    async def scenario() -> None:
+        registry = ServiceRegistry(
+            ConnectionPoolManager(lambda name, config: httpx.MockTransport(handler))
+        )
+        await registry.add_service("games", SERVICE)
+        await registry.add_service(
+            "blog", {"url": "http://blog", "health_check": {"path": "/down"}}
+        )
+        await registry.health_checker.probe_service("games")
+        await registry.health_checker.probe_service("blog")
+        assert registry.health_checker.table.unhealthy("games") == set()
+        assert registry.health_checker.table.unhealthy("blog") == {"http://blog"}
+
+        response = await ServiceProxy(registry).forward_request(
+            "blog", "GET", "/posts", {}
+        )
+        assert response.status_code == 200
+        assert hosts == ["blog"]
+        await registry.cleanup()
+
+    asyncio.run(scenario())
+
+
+def test_health_endpoints_answer_from_table(gateway) -> None:
+    """Test the per-service and aggregate health endpoints."""
+    client = gateway({"games": SERVICE}, _handler([]))
+
+    single = client.get("/api/v1/services/games/health").json()
+    assert single["healthy"] is True
+    assert single["endpoints"]["http://game-0"]["status_code"] == 503
+
+    aggregate = client.get("/api/v1/services/health").json()
+    assert aggregate["count"] == 1 and aggregate["healthy"] == 1
@@ -0,0 +1,33 @@
+# --------------------------------------------------------------------------
+# Tests for the non-blocking logging pipeline.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import io
+import logging
+import queue
+
+from prometheus_client import REGISTRY
+
+from src.core.logs import LogWriter, QueueLogHandler
+
+
+def test_full_queue_drops_records_and_writer_drains_in_batches() -> None:
+    """Test that logging never blocks on a full queue and queued lines are written."""
+    records: "queue.Queue" = queue.Queue(maxsize=3)
+    logger = logging.getLogger("tests.logs")
+    logger.propagate = False
+    logger.handlers = [QueueLogHandler(records)]
+    logger.setLevel(logging.INFO)
+    dropped = REGISTRY.get_sample_value("bifrost_log_records_dropped_total") or 0
+
+    for index in range(5):
+        logger.info("line %d", index)
+    assert records.qsize() == 3
+    assert REGISTRY.get_sample_value("bifrost_log_records_dropped_total") == dropped + 2
+
+    stream = io.StringIO()
+    writer = LogWriter(records, logging.Formatter("%(message)s"), stream, batch_size=2)
+    writer.start()
+    writer.stop()
+    assert stream.getvalue() == "line 0\nline 1\nline 2\n"
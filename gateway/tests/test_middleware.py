@@ -0,0 +1,139 @@
+# --------------------------------------------------------------------------
+# Tests for the gateway ASGI middleware.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+from typing import AsyncIterator
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from structlog.testing import capture_logs
+
+from src.core.metrics import render_metrics
+from src.core.middleware import (
+    LoggingMiddleware,
+    MetricsMiddleware,
+    RateLimitMiddleware,
+)
+from src.core.ratelimit import LocalRateLimiter
+from tests.conftest import ChunkedStream
+
+
+def _app(limit: int, sample_rate: float = 1.0) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(LoggingMiddleware, sample_rate=sample_rate)
+    app.add_middleware(RateLimitMiddleware, limit=limit)
+
+    @app.get("/stream")
+    async def stream() -> StreamingResponse:
+        async def chunks() -> AsyncIterator[bytes]:
+            for _ in range(3):
+                yield b"chunk"
+
+        return StreamingResponse(chunks(), status_code=206)
+
+    @app.get("/fail")
+    async def fail() -> PlainTextResponse:
+        return PlainTextResponse("boom", status_code=502)
+
+    return app
+
+
+def test_logging_records_status_of_streamed_response() -> None:
+    """Test that the completed log line carries the streamed response status."""
+    client = TestClient(_app(limit=10))
+
+    with capture_logs() as logs:
+        response = client.get("/stream?page=2")
+
+    assert response.content == b"chunk" * 3
+    completed = [log for log in logs if log["event"] == "Request completed"]
+    assert completed[0]["status_code"] == 206
+    assert completed[0]["url"] == "http://testserver/stream?page=2"
+    assert len(completed) == 1
+
+
+def test_sampled_access_log_keeps_every_error() -> None:
+    """Test that sampled-out successes are skipped while errors are logged."""
+    client = TestClient(_app(limit=100, sample_rate=0.0))
+
+    with capture_logs() as logs:
+        for _ in range(5):
+            client.get("/stream")
+        client.get("/fail")
+
+    completed = [log for log in logs if log["event"] == "Request completed"]
+    assert [log["status_code"] for log in completed] == [502]
+    assert completed[0]["log_level"] == "error"
+
+
+def test_rate_limit_rejects_requests_over_the_limit() -> None:
+    """Test that requests past the per-minute limit get a 429."""
+    client = TestClient(_app(limit=2))
+
+    responses = [client.get("/stream") for _ in range(3)]
+    assert [response.status_code for response in responses] == [206, 206, 429]
+    assert responses[0].headers["ratelimit-limit"] == "2"
+    assert responses[0].headers["ratelimit-remaining"] == "1"
+    assert int(responses[2].headers["retry-after"]) >= 1
+
+
+def test_service_and_route_limits_apply_per_client(gateway) -> None:
+    """Test that the tightest of the service and route limits is enforced."""
+    services = {
+        "games": {
+            "url": "http://games.internal",
+            "rate_limit": 5,
+            "routes": [{"prefix": "/leaderboard", "rate_limit": 2}],
+        }
+    }
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, stream=ChunkedStream(b"ok"))
+
+    client = gateway(services, handler)
+    limiter = LocalRateLimiter()
+    client.app.state.rate_limiter = limiter
+    client.app.add_middleware(RateLimitMiddleware, limit=100, backend=limiter)
+
+    board = [client.get("/api/v1/leaderboard") for _ in range(3)]
+    assert [response.status_code for response in board] == [200, 200, 429]
+    assert board[1].headers["ratelimit-limit"] == "2"
+    assert board[1].headers["ratelimit-remaining"] == "0"
+    assert "retry-after" in board[2].headers
+
+    # The two leaderboard calls also count against the service limit of 5
+    games = [client.get("/api/v1/games/scores").status_code for _ in range(4)]
+    assert games == [200, 200, 200, 429]
+
+
+def test_metrics_are_labelled_by_route_not_path(gateway) -> None:
+    """Test that proxied requests are counted per route with overhead split out."""
+    services = {"games": {"url": "http://games.internal"}}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, stream=ChunkedStream(b"x" * 100))
+
+    client = gateway(services, handler)
+    client.app.add_middleware(MetricsMiddleware)
+    labels = {"method": "GET", "endpoint": "/api/v1/games", "status": "200"}
+    before = REGISTRY.get_sample_value("http_requests_total", labels) or 0
+
+    for player in range(3):
+        assert client.get(f"/api/v1/games/players/{player}").status_code == 200
+
+    assert REGISTRY.get_sample_value("http_requests_total", labels) == before + 3
+    overhead = REGISTRY.get_sample_value(
+        "bifrost_gateway_overhead_seconds_count", {"service": "games"}
+    )
+    assert overhead >= 3
+    assert REGISTRY.get_sample_value("bifrost_requests_in_flight") == 0
+
+    content, content_type = render_metrics("text/plain")
+    assert content_type.startswith("text/plain; version=0.0.4")
+    assert b'endpoint="/api/v1/games/players/0"' not in content
+    _, content_type = render_metrics("application/openmetrics-text; version=1.0.0")
+    assert content_type.startswith("application/openmetrics-text")
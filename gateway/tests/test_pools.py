@@ -0,0 +1,92 @@
+# --------------------------------------------------------------------------
+# Tests for upstream connection pool management.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+from typing import Any, Dict
+
+import httpx
+
+from src.core.pools import ConnectionPoolManager
+from src.core.services import ServiceProxy, ServiceRegistry
+from tests.conftest import ChunkedStream
+
+
+def _mock_transport(name: str, pool_config: Dict[str, Any]) -> httpx.MockTransport:
+    return httpx.MockTransport(lambda request: httpx.Response(200, text=name))
+
+
+def test_pool_lifecycle_follows_registry() -> None:
+    """Test that pools are created and torn down with services."""
+
+    async def scenario() -> None:
+        registry = ServiceRegistry(ConnectionPoolManager(_mock_transport))
+        config = {"url": "http://hello", "pool": {"max_connections": 5}}
+        assert await registry.add_service("hello", config)
+
+        stats = registry.pool_manager.pool_stats()
+        assert stats["hello"]["max_connections"] == 5
+        assert stats["hello"]["max_keepalive_connections"] == 20
+
+        assert await registry.remove_service("hello")
+        assert registry.pool_manager.pool_stats() == {}
+        await registry.cleanup()
+
+    asyncio.run(scenario())
+
+
+def test_proxy_reuses_service_client() -> None:
+    """Test that every proxied request goes through the same pooled client."""
+
+    async def scenario() -> None:
+        registry = ServiceRegistry(ConnectionPoolManager(_mock_transport))
+        await registry.add_service("hello", {"url": "http://hello"})
+        client = registry.pool_manager.get_client("hello")
+
+        for _ in range(3):
+            response = await ServiceProxy(registry).forward_request(
+                service_name="hello", method="GET", path="/ping", headers={}
+            )
+            assert response.text == "hello"
+
+        assert registry.pool_manager.get_client("hello") is client
+        assert registry.pool_manager.pool_stats()["hello"]["in_flight"] == 0
+        await registry.cleanup()
+
+    asyncio.run(scenario())
+
+
+def test_replaced_pool_stays_open_for_streams_in_flight() -> None:
+    """Test that a reload waits for open streams before closing the old pool."""
+
+    async def scenario() -> None:
+        manager = ConnectionPoolManager(
+            lambda name, config: httpx.MockTransport(
+                lambda request: httpx.Response(200, stream=ChunkedStream(b"event"))
+            ),
+            drain_seconds=0.05,
+        )
+        registry = ServiceRegistry(manager)
+        await registry.add_service("events", {"url": "http://events"})
+        old_client = manager.get_client("events")
+
+        stream = await ServiceProxy(registry).stream_request(
+            service_name="events", method="GET", path="/feed", headers={}
+        )
+        await registry.add_service("events", {"url": "http://events", "timeout": 5})
+        idle_client = manager.get_client("events")
+        await registry.add_service("events", {"url": "http://events", "timeout": 6})
+
+        await asyncio.sleep(0.2)
+        # The stream outlived the drain timer, the pool that had none did not
+        assert not old_client.is_closed
+        assert idle_client.is_closed
+        assert b"".join([chunk async for chunk in stream]) == b"event"
+        await stream.aclose()
+
+        await asyncio.sleep(0)
+        assert old_client.is_closed
+        await registry.cleanup()
+
+    asyncio.run(scenario())
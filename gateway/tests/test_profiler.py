@@ -0,0 +1,121 @@
+# --------------------------------------------------------------------------
+# Tests for the on-demand sampling profiler.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import threading
+import time
+from typing import Dict
+
+import httpx
+import pytest
+from jose import jwt
+
+from src.config import settings
+from src.core.auth import Authenticator, KeySet
+from src.core.middleware import ProfilingMiddleware
+from src.core.profiler import SamplingProfiler, profiler
+from tests.conftest import ChunkedStream
+
+
+def _spin(seconds: float) -> None:
+    until = time.perf_counter() + seconds
+    while time.perf_counter() < until:
+        pass
+
+
+def _marked_work() -> None:
+    _spin(0.2)
+
+
+def _unmarked_work() -> None:
+    _spin(0.2)
+
+
+def _bearer(**claims: str) -> Dict[str, str]:
+    token = jwt.encode({"sub": "ops", "exp": int(time.time()) + 300, **claims}, "s")
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_profile_endpoint_returns_collapsed_stacks(gateway, monkeypatch) -> None:
+    """Test that a timed profile returns the hot stacks of the process."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, stream=ChunkedStream(b"ok"))
+
+    client = gateway({"games": {"url": "http://games"}}, handler)
+    client.app.state.authenticator = Authenticator(
+        KeySet(None, secret="s"), algorithms=("HS256",)
+    )
+    client.headers.update(_bearer(scope="admin"))
+    assert client.post("/api/v1/admin/profile").status_code == 404
+
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    assert client.post("/api/v1/admin/profile?seconds=600").status_code == 400
+    assert client.post("/api/v1/admin/profile?mode=everything").status_code == 400
+
+    worker = threading.Thread(target=_spin, args=(0.5,), name="busy-worker")
+    worker.start()
+    response = client.post("/api/v1/admin/profile?seconds=0.3&interval_ms=5")
+    worker.join()
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    busy = [line for line in lines if line.startswith("busy-worker;")]
+    assert busy and "_spin (tests/test_profiler.py:" in busy[0]
+    assert int(busy[0].rsplit(" ", 1)[1]) > 10
+    assert not profiler.running
+
+    profiler.start()
+    try:
+        assert client.post("/api/v1/admin/profile?seconds=0.1").status_code == 409
+    finally:
+        profiler.stop()
+
+
+def test_profile_endpoint_needs_an_admin_token(gateway, monkeypatch) -> None:
+    """Test that profiles are only started for tokens with the admin scope."""
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    client = gateway({"games": {"url": "http://games"}}, lambda request: None)
+    client.app.state.authenticator = Authenticator(
+        KeySet(None, secret="s"), algorithms=("HS256",)
+    )
+
+    anonymous = client.post("/api/v1/admin/profile?seconds=0.1")
+    assert anonymous.status_code == 401
+    assert anonymous.headers["www-authenticate"] == "Bearer"
+    forged = {"Authorization": "Bearer x.y.z"}
+    assert client.post("/api/v1/admin/profile", headers=forged).status_code == 401
+    user = client.post("/api/v1/admin/profile", headers=_bearer(scope="read"))
+    assert user.status_code == 403
+    assert not profiler.running
+
+
+def test_requests_profile_samples_only_marked_requests(gateway) -> None:
+    """Test that a requests profile only records requests sent with X-Profile."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/marked":
+            _marked_work()
+        else:
+            _unmarked_work()
+        return httpx.Response(200, stream=ChunkedStream(b"ok"))
+
+    sampler = SamplingProfiler()
+    client = gateway({"games": {"url": "http://games"}}, handler)
+    client.app.add_middleware(ProfilingMiddleware, profiler=sampler)
+
+    sampler.start("requests", interval=0.005)
+    try:
+        assert client.get("/api/v1/games/marked", headers={"x-profile": "1"}).is_success
+        assert client.get("/api/v1/games/unmarked").is_success
+    finally:
+        result = sampler.stop()
+
+    assert result.samples > 10
+    assert all(stack.startswith("request;") for stack in result.stacks)
+    assert any("_marked_work" in stack for stack in result.stacks)
+    assert not any("_unmarked_work" in stack for stack in result.stacks)
+    # Requests are not tracked once the profile is over
+    assert not sampler.marking and not sampler.marked
+    with pytest.raises(RuntimeError):
+        sampler.stop()
@@ -0,0 +1,107 @@
+# --------------------------------------------------------------------------
+# Tests for the rate limiting backends.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+from typing import Any, List
+
+import pytest
+from redis.exceptions import ConnectionError
+
+from src.core.ratelimit import LocalRateLimiter, RedisRateLimiter
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class UnreachableRedis:
+    """Redis client whose every call fails, as during an outage"""
+
+    def register_script(self, script: str) -> Any:
+        async def run(keys: List[str], args: List[Any]) -> Any:
+            raise ConnectionError("Connection refused")
+
+        return run
+
+
+def test_local_limiter_keeps_constant_state_per_key() -> None:
+    """Test that the local limiter is exact and only evicts keys with a full budget."""
+    limiter = LocalRateLimiter(max_keys=100)
+
+    decisions = [limiter.check_now("client:a", 3, 60.0, now=0.0) for _ in range(4)]
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert decisions[3].retry_after == pytest.approx(20.0)
+    assert limiter.check_now("client:a", 3, 60.0, now=20.0).allowed
+
+    for index in range(1000):
+        limiter.check_now(f"client:{index}", 3, 60.0, now=30.0)
+    assert len(limiter) == 100
+    # Keys sprayed past max_keys neither reset the limited ones nor get through
+    assert not limiter.check_now("client:999", 3, 60.0, now=30.0).allowed
+    limiter.check_now("client:a", 3, 60.0, now=30.0)
+    limiter.check_now("client:a", 3, 60.0, now=30.0)
+    assert not limiter.check_now("client:a", 3, 60.0, now=30.0).allowed
+    # Once their budget is whole again, the least recent keys make room
+    assert limiter.check_now("client:new", 3, 60.0, now=60.0).allowed
+    assert len(limiter) <= 100
+
+
+def test_workers_share_one_limit_through_redis() -> None:
+    """Test that two limiters on one Redis enforce a single budget."""
+
+    async def scenario() -> None:
+        redis = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer())
+        workers = [RedisRateLimiter(redis, batch_size=5) for _ in range(2)]
+
+        allowed = 0
+        for attempt in range(60):
+            decision = await workers[attempt % 2].check("client:1.2.3.4", 40, 60.0)
+            allowed += decision.allowed
+        assert allowed == 40
+
+        denied = await workers[0].check("client:1.2.3.4", 40, 60.0)
+        assert not denied.allowed
+        assert 0 < denied.retry_after <= 1.5
+        assert (await workers[0].check("client:5.6.7.8", 40, 60.0)).allowed
+
+    asyncio.run(scenario())
+
+
+def test_leases_answer_most_checks_without_redis() -> None:
+    """Test that leased tokens are handed out without a Redis round trip."""
+
+    async def scenario() -> None:
+        limiter = RedisRateLimiter(
+            fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer()), batch_size=10
+        )
+        calls = 0
+        script = limiter._script
+
+        async def counted(keys: List[str], args: List[Any]) -> Any:
+            nonlocal calls
+            calls += 1
+            return await script(keys=keys, args=args)
+
+        limiter._script = counted
+        decisions = [
+            await limiter.check("client:1.2.3.4", 1000, 60.0) for _ in range(50)
+        ]
+        assert all(decision.allowed for decision in decisions)
+        assert calls == 5
+        # Leased decisions report the reset time Redis gave with the grant
+        first, leased = decisions[0], decisions[1]
+        assert 0 < leased.reset_after <= first.reset_after < 1.0
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("failure_mode, expected", [("open", 5), ("local", 3)])
+def test_redis_outage_falls_back(failure_mode: str, expected: int) -> None:
+    """Test fail-open and per-process fallbacks while Redis is unreachable."""
+
+    async def scenario() -> None:
+        limiter = RedisRateLimiter(UnreachableRedis(), failure_mode=failure_mode)
+        decisions = [await limiter.check("client:1.2.3.4", 3, 60.0) for _ in range(5)]
+        assert sum(d.allowed for d in decisions) == expected
+
+    asyncio.run(scenario())
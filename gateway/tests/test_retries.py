@@ -0,0 +1,122 @@
+# --------------------------------------------------------------------------
+# Tests for hedged and budgeted upstream retries.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+from typing import List
+
+import httpx
+
+from src.core.pools import ConnectionPoolManager
+from src.core.retries import RetryBudget
+from src.core.services import ServiceProxy, ServiceRegistry
+from tests.conftest import ChunkedStream, admin_headers
+
+ENDPOINTS = [{"url": "http://games-1"}, {"url": "http://games-2"}]
+
+
+def test_connection_errors_are_retried_on_another_endpoint(gateway) -> None:
+    """Test that a GET failing to connect is retried elsewhere, a POST is not."""
+    hosts: List[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        hosts.append(request.url.host)
+        if request.url.host == "games-1":
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, stream=ChunkedStream(request.url.host.encode()))
+
+    client = gateway({"games": {"endpoints": ENDPOINTS}}, handler)
+
+    for _ in range(2):
+        response = client.get("/api/v1/games/scores")
+        assert response.status_code == 200
+        assert response.content == b"games-2"
+    assert hosts.count("games-1") == 1
+
+    stats_response = client.get("/api/v1/admin/retries", headers=admin_headers())
+
+    stats = stats_response.json()["retries"]
+    assert stats["services"]["games"]["retries"] == 1
+
+    hosts.clear()
+    statuses = {client.post("/api/v1/games/scores").status_code for _ in range(2)}
+    assert 500 in statuses
+    assert len(hosts) == 2
+
+
+def test_retry_budget_caps_retries_at_a_share_of_traffic() -> None:
+    """Test that the budget allows the floor plus its ratio of requests."""
+    budget = RetryBudget(ratio=0.1, min_per_second=0.1, window=10.0)
+    for _ in range(20):
+        budget.deposit()
+
+    allowed = sum(budget.withdraw() for _ in range(10))
+    assert allowed == 3
+    assert budget.stats()["rejected"] == 7
+
+
+def test_slow_get_is_hedged_and_first_response_wins() -> None:
+    """Test that a GET slower than the hedge delay is raced on another endpoint."""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "games-1":
+            await asyncio.sleep(1)
+        return httpx.Response(200, json={"host": request.url.host})
+
+    async def scenario() -> None:
+        registry = ServiceRegistry(
+            ConnectionPoolManager(lambda name, config: httpx.MockTransport(handler))
+        )
+        config = {
+            "endpoints": ENDPOINTS,
+            "hedging": {"min_samples": 1, "min_delay": 0.01},
+        }
+        await registry.add_service("games", config)
+        registry.retry_policy.latencies.record("games", 0.01)
+        proxy = ServiceProxy(registry)
+
+        response = await proxy.forward_request("games", "GET", "/scores", {})
+        assert response.json() == {"host": "games-2"}
+        assert registry.retry_policy.counters["games"] == {
+            "retries": 0,
+            "hedges": 1,
+            "hedge_wins": 1,
+        }
+        endpoints = registry.balancers.get("games").endpoints
+        await asyncio.sleep(0)
+        assert all(endpoint.outstanding == 0 for endpoint in endpoints)
+        assert registry.pool_manager.in_flight["games"] == 0
+        await registry.cleanup()
+
+    asyncio.run(scenario())
+
+
+def test_hedge_queued_behind_the_original_does_not_hide_upstream_time() -> None:
+    """Test that only the winning attempt's wait for a slot counts as overhead."""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json={"host": request.url.host})
+
+    async def scenario() -> None:
+        registry = ServiceRegistry(
+            ConnectionPoolManager(lambda name, config: httpx.MockTransport(handler))
+        )
+        config = {
+            "endpoints": ENDPOINTS,
+            "hedging": {"min_samples": 1, "min_delay": 0.01},
+            # The hedge waits for the original's slot and loses the race
+            "concurrency": {"algorithm": "aimd", "initial_limit": 1, "max_limit": 1},
+        }
+        await registry.add_service("games", config)
+        registry.retry_policy.latencies.record("games", 0.01)
+        proxy = ServiceProxy(registry)
+
+        response = await proxy.forward_request("games", "GET", "/scores", {})
+        assert response.json() == {"host": "games-1"}
+        assert registry.retry_policy.counters["games"]["hedges"] == 1
+        assert proxy.timings.upstream_seconds >= 0.15
+        await registry.cleanup()
+
+    asyncio.run(scenario())
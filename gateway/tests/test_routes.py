@@ -0,0 +1,104 @@
+# --------------------------------------------------------------------------
+# Tests for the precompiled route table.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import httpx
+import pytest
+
+from src.core.routes import RouteTable
+from src.core.snapshot import InvalidServiceConfig, validate_services
+from tests.conftest import ChunkedStream, admin_headers
+
+SERVICES = {
+    "games": {
+        "url": "http://games",
+        "timeout": 10,
+        "routes": [
+            {"prefix": "/play", "hosts": ["*.bnbong.xyz"]},
+        ],
+    },
+    "leaderboard": {
+        "url": "http://leaderboard",
+        "routes": [
+            {"prefix": "/games/leaderboard", "rewrite": "/v2/ranks", "timeout": 2},
+            {
+                "prefix": "/games/leaderboard",
+                "methods": ["POST"],
+                "strip_prefix": False,
+            },
+        ],
+    },
+}
+
+
+def test_longest_prefix_with_host_and_method_conditions() -> None:
+    """Test that the deepest matching prefix wins and conditions are honored."""
+    table = RouteTable.compile(SERVICES)
+
+    games = table.match("/games/scores/1")
+    assert games.service == "games"
+    assert games.upstream_path("/games/scores/1") == "/scores/1"
+
+    ranks = table.match("/games/leaderboard/weekly", method="GET")
+    assert ranks.service == "leaderboard"
+    assert ranks.timeout == 2
+    assert ranks.upstream_path("/games/leaderboard/weekly") == "/v2/ranks/weekly"
+
+    submit = table.match("/games/leaderboard", method="POST")
+    assert submit.upstream_path("/games/leaderboard") == "/games/leaderboard"
+
+    assert table.match("/play/1", host="arcade.bnbong.xyz:443").service == "games"
+    assert table.match("/play/1", host="example.com") is None
+    assert table.match("/gamesx") is None
+
+
+def test_gateway_proxies_through_matched_route(gateway) -> None:
+    """Test that a nested prefix reaches its own backend with a rewritten path."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = f"{request.url.host}{request.url.path}".encode()
+        return httpx.Response(200, stream=ChunkedStream(body))
+
+    client = gateway(SERVICES, handler)
+
+    assert client.get("/api/v1/games/leaderboard/weekly").text == (
+        "leaderboard/v2/ranks/weekly"
+    )
+    assert client.get("/api/v1/games/scores").text == "games/scores"
+    assert client.get("/api/v1/unknown/path").status_code == 404
+
+    stats_response = client.get("/api/v1/admin/routes", headers=admin_headers())
+
+    routes = stats_response.json()
+    assert routes["count"] == 5
+
+
+@pytest.mark.parametrize(
+    "rate_limit", [{"period": 60}, {"limit": 0}, {"limit": 10, "period": 0}, -5, "x"]
+)
+def test_invalid_rate_limits_are_rejected_on_load(rate_limit) -> None:
+    """Test that bad service and route rate limits fail validation, not requests."""
+    with pytest.raises(InvalidServiceConfig):
+        validate_services({"games": {"url": "http://games", "rate_limit": rate_limit}})
+    with pytest.raises(InvalidServiceConfig):
+        validate_services(
+            {
+                "games": {
+                    "url": "http://games",
+                    "routes": [{"prefix": "/play", "rate_limit": rate_limit}],
+                }
+            }
+        )
+
+    table = validate_services(
+        {
+            "games": {
+                "url": "http://games",
+                "routes": [{"prefix": "/play", "rate_limit": {"limit": 5}}],
+            }
+        }
+    )
+    route = table.match("/play")
+    assert route.rate_limit == (5, 60.0)
+    assert route.describe()["rate_limit"] == {"limit": 5, "period": 60.0}
@@ -0,0 +1,143 @@
+# --------------------------------------------------------------------------
+# Tests for registry snapshots and services file reloads.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+import json
+from pathlib import Path
+
+import httpx
+import pytest
+
+from src.core.pools import ConnectionPoolManager
+from src.core.services import ServiceRegistry
+from src.core.snapshot import InvalidServiceConfig
+from tests.conftest import ChunkedStream, admin_headers
+
+
+def _registry(path: Path) -> ServiceRegistry:
+    registry = ServiceRegistry(
+        ConnectionPoolManager(
+            lambda name, config: httpx.MockTransport(
+                lambda request: httpx.Response(200, stream=ChunkedStream(b"ok"))
+            )
+        )
+    )
+    registry.config_path = registry.watcher.path = path
+    # Checked by hand below rather than by the background poll
+    registry.watcher.interval = 60
+    registry.watcher.debounce = 0.01
+    return registry
+
+
+def test_file_changes_swap_snapshots_and_keep_unchanged_services(
+    tmp_path: Path,
+) -> None:
+    """Test that a reload rebuilds only changed services and skips invalid files."""
+    path = tmp_path / "services.json"
+    path.write_text(
+        json.dumps({"games": {"url": "http://games"}, "blog": {"url": "http://blog"}})
+    )
+
+    async def scenario() -> None:
+        registry = _registry(path)
+        await registry.initialize()
+        first = registry.snapshot
+        games_pool = registry.pool_manager.get_client("games")
+        blog_pool = registry.pool_manager.get_client("blog")
+
+        path.write_text(
+            json.dumps(
+                {
+                    "games": {"url": "http://games", "timeout": 5},
+                    "blog": {"url": "http://blog"},
+                }
+            )
+        )
+        assert await registry.watcher.check()
+        assert registry.snapshot.version == first.version + 1
+        assert registry.get_service("games")["timeout"] == 5
+        assert registry.pool_manager.get_client("blog") is blog_pool
+        # The replaced pool drains instead of closing under requests in flight
+        assert registry.pool_manager.get_client("games") is not games_pool
+        assert not games_pool.is_closed
+
+        path.write_text('{"games": {"timeout": 1}')
+        assert not await registry.watcher.check()
+        assert registry.snapshot.version == first.version + 1
+        await registry.cleanup()
+        assert games_pool.is_closed
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize(
+    "bad",
+    [
+        {"url": "http://bad", "load_balancer": {"policy": "fastest"}},
+        {"endpoints": [{"url": "http://bad", "region": "eu"}]},
+        {"url": "http://bad", "pool": {"max_connections": "many"}},
+        {"url": "http://bad", "circuit_breaker": ["enabled"]},
+    ],
+)
+def test_invalid_service_leaves_the_registry_untouched(
+    tmp_path: Path, bad: dict
+) -> None:
+    """Test that a change failing on any service is rejected before anything is applied."""
+
+    async def scenario() -> None:
+        registry = _registry(tmp_path / "services.json")
+        await registry.apply({"games": {"url": "http://games"}})
+        before = registry.snapshot
+        games_pool = registry.pool_manager.get_client("games")
+
+        with pytest.raises(InvalidServiceConfig):
+            await registry.apply(
+                {"games": {"url": "http://games", "timeout": 5}, "bad": bad}
+            )
+        assert registry.snapshot is before
+        assert registry.pool_manager.get_client("games") is games_pool
+        assert set(registry.pool_manager.clients) == {"games"}
+        assert set(registry.balancers.balancers) == {"games"}
+        await registry.cleanup()
+
+    asyncio.run(scenario())
+
+
+def test_services_listing_is_tagged_with_snapshot_version(gateway) -> None:
+    """Test that GET /services answers 304 until the registry changes."""
+    client = gateway({"games": {"url": "http://games"}}, lambda request: None)
+
+    listing = client.get("/api/v1/services")
+    assert listing.json()["services"] == {"games": {"url": "http://games"}}
+    etag = listing.headers["etag"]
+    assert (
+        client.get("/api/v1/services", headers={"If-None-Match": etag}).status_code
+        == 304
+    )
+
+    client.post(
+        "/api/v1/admin/services",
+        json={"name": "blog", "config": {"url": "http://blog"}},
+    )
+    changed = client.get("/api/v1/services", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()["count"] == 2
+
+
+def test_reload_endpoint_needs_an_admin_token(gateway, tmp_path: Path) -> None:
+    """Test that only admins can reload the services file."""
+    path = tmp_path / "services.json"
+    path.write_text(
+        json.dumps({"games": {"url": "http://games"}, "blog": {"url": "http://blog"}})
+    )
+    client = gateway({"games": {"url": "http://games"}}, lambda request: None)
+    client.app.state.service_registry.config_path = path
+
+    assert client.post("/api/v1/admin/services/reload").status_code == 401
+    assert client.app.state.service_registry.get_service("blog") is None
+
+    response = client.post("/api/v1/admin/services/reload", headers=admin_headers())
+    assert response.status_code == 200
+    assert response.json()["count"] == 2
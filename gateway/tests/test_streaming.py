@@ -0,0 +1,62 @@
+# --------------------------------------------------------------------------
+# Tests for the streaming proxy path.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import gzip
+
+import httpx
+
+from tests.conftest import ChunkedStream
+
+
+def test_streams_compressed_body_raw(gateway) -> None:
+    """Test that encoded upstream bytes are relayed without being decoded."""
+    payload = gzip.compress(b"bifrost" * 10_000)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200,
+            headers={"content-encoding": "gzip", "content-length": str(len(payload))},
+            stream=ChunkedStream(payload),
+        )
+
+    client = gateway({"files": {"url": "http://files"}}, handler)
+    response = client.get("/api/v1/files/blob", headers={"accept-encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == b"bifrost" * 10_000
+    registry = client.app.state.service_registry
+    assert registry.pool_manager.pool_stats()["files"]["in_flight"] == 0
+
+
+def test_streams_request_body_upstream(gateway) -> None:
+    """Test that an uploaded body reaches the upstream intact."""
+    upload = b"x" * 300_000
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.read() == upload
+        return httpx.Response(201, stream=ChunkedStream(b"stored"))
+
+    client = gateway({"files": {"url": "http://files"}}, handler)
+    response = client.post("/api/v1/files/upload", content=upload)
+
+    assert response.status_code == 201
+    assert response.content == b"stored"
+
+
+def test_buffered_mode_drops_stale_encoding(gateway) -> None:
+    """Test that the buffered path does not advertise an encoding it decoded."""
+    payload = gzip.compress(b"buffered")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200, headers={"content-encoding": "gzip"}, stream=ChunkedStream(payload)
+        )
+
+    client = gateway({"files": {"url": "http://files", "streaming": False}}, handler)
+    response = client.get("/api/v1/files/blob")
+
+    assert "content-encoding" not in response.headers
+    assert response.content == b"buffered"
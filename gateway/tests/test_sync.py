@@ -0,0 +1,149 @@
+# --------------------------------------------------------------------------
+# Tests for service registry synchronization across workers.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+import json
+from pathlib import Path
+
+import httpx
+import pytest
+
+from src.core.pools import ConnectionPoolManager
+from src.core.services import ServiceRegistry
+from src.core.snapshot import InvalidServiceConfig
+from src.core.sync import (
+    FileSyncBackend,
+    InProcessSyncBackend,
+    RedisSyncBackend,
+    SyncBackend,
+)
+from tests.conftest import ChunkedStream
+
+
+def _worker(path: Path, backend: SyncBackend, name: str) -> ServiceRegistry:
+    registry = ServiceRegistry(
+        ConnectionPoolManager(
+            lambda service, config: httpx.MockTransport(
+                lambda request: httpx.Response(200, stream=ChunkedStream(b"ok"))
+            )
+        ),
+        sync_backend=backend,
+    )
+    registry.config_path = registry.watcher.path = path
+    registry.watcher.interval = 60
+    registry.sync.interval = 0.05
+    registry.sync.worker = name
+    return registry
+
+
+async def _converge(*registries: ServiceRegistry) -> None:
+    for _ in range(100):
+        if len({registry.snapshot.version for registry in registries}) == 1:
+            return
+        await asyncio.sleep(0.02)
+
+
+async def _changes_reach_every_worker(path: Path, backends) -> None:
+    first = _worker(path, backends[0], "worker-1")
+    second = _worker(path, backends[1], "worker-2")
+    await first.initialize()
+    await second.initialize()
+    try:
+        assert first.snapshot.version == second.snapshot.version == 1
+
+        assert await first.add_service("blog", {"url": "http://blog"})
+        await _converge(first, second)
+        assert second.get_service("blog") == {"url": "http://blog"}
+        assert second.snapshot.etag == first.snapshot.etag
+
+        assert await second.remove_service("games")
+        await _converge(first, second)
+        assert first.get_service("games") is None
+        assert first.snapshot.version == 3
+
+        # An invalid change is rejected before it reaches the other workers
+        with pytest.raises(InvalidServiceConfig):
+            await first.sync.update(lambda services: {**services, "bad": {}})
+        with pytest.raises(InvalidServiceConfig):
+            await first.sync.update(
+                lambda services: {
+                    **services,
+                    "bad": {
+                        "url": "http://bad",
+                        "load_balancer": {"policy": "fastest"},
+                    },
+                }
+            )
+        assert second.snapshot.version == 3
+
+        await asyncio.sleep(0.1)
+        workers = (await first.sync.stats())["workers"]
+        assert {name: report["version"] for name, report in workers.items()} == {
+            "worker-1": 3,
+            "worker-2": 3,
+        }
+    finally:
+        await first.cleanup()
+        await second.cleanup()
+
+
+def test_in_process_backend_shares_admin_changes(tmp_path: Path) -> None:
+    """Test that a change on one worker is applied by the others."""
+    path = tmp_path / "services.json"
+    path.write_text(json.dumps({"games": {"url": "http://games"}}))
+    backend = InProcessSyncBackend()
+    asyncio.run(_changes_reach_every_worker(path, [backend, backend]))
+
+
+def test_file_backend_shares_admin_changes(tmp_path: Path) -> None:
+    """Test that workers sharing a state file converge on the same version."""
+    path = tmp_path / "services.json"
+    path.write_text(json.dumps({"games": {"url": "http://games"}}))
+    state = tmp_path / "sync" / "registry.json"
+    backends = [
+        FileSyncBackend(state, poll_interval=0.01),
+        FileSyncBackend(state, poll_interval=0.01),
+    ]
+    asyncio.run(_changes_reach_every_worker(path, backends))
+
+
+def test_redis_backend_shares_admin_changes(tmp_path: Path) -> None:
+    """Test that workers sharing a Redis state converge on the same version."""
+    fakeredis = pytest.importorskip("fakeredis")
+    path = tmp_path / "services.json"
+    path.write_text(json.dumps({"games": {"url": "http://games"}}))
+    server = fakeredis.FakeServer()
+    backends = [
+        RedisSyncBackend(fakeredis.aioredis.FakeRedis(server=server)),
+        RedisSyncBackend(fakeredis.aioredis.FakeRedis(server=server)),
+    ]
+    asyncio.run(_changes_reach_every_worker(path, backends))
+
+
+def test_new_worker_takes_the_shared_registry_over_its_file(tmp_path: Path) -> None:
+    """Test that a worker starting late joins the shared version, not its file."""
+    path = tmp_path / "services.json"
+    path.write_text(json.dumps({"games": {"url": "http://games"}}))
+    backend = InProcessSyncBackend()
+
+    async def scenario() -> None:
+        first = _worker(path, backend, "worker-1")
+        await first.initialize()
+        await first.add_service("blog", {"url": "http://blog"})
+
+        late = _worker(path, backend, "worker-2")
+        await late.initialize()
+        assert late.snapshot.version == 2
+        assert set(late.services) == {"games", "blog"}
+
+        # A reload publishes the file to every worker, once
+        assert (await late.reload()).version == 3
+        await _converge(first, late)
+        assert set(first.services) == {"games"}
+        assert (await first.reload()).version == 3
+        await first.cleanup()
+        await late.cleanup()
+
+    asyncio.run(scenario())
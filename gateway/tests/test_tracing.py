@@ -0,0 +1,125 @@
+# --------------------------------------------------------------------------
+# Tests for request tracing and trace context propagation.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import json
+from pathlib import Path
+from typing import Any, Dict, List
+
+import httpx
+from prometheus_client import REGISTRY
+
+from src.core.middleware import TracingMiddleware
+from src.core.tracing import (
+    BatchSpanProcessor,
+    FileSpanExporter,
+    Tracer,
+    parse_traceparent,
+)
+from tests.conftest import ChunkedStream
+
+CALLER_TRACE = "0af7651916cd43dd8448eb211c80319c"
+
+
+def _traces(decision: str) -> float:
+    labels = {"decision": decision}
+    return REGISTRY.get_sample_value("bifrost_traces_total", labels) or 0
+
+
+def _read_spans(path: Path) -> List[Dict[str, Any]]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_traceparent_is_validated() -> None:
+    """Test that only well-formed trace context headers are continued."""
+    parent = parse_traceparent(f"00-{CALLER_TRACE}-b7ad6b7169203331-01", "k=v")
+    assert parent is not None
+    assert (parent.trace_id, parent.span_id) == (CALLER_TRACE, "b7ad6b7169203331")
+    assert parent.sampled and parent.tracestate == "k=v"
+    assert not parse_traceparent(f"00-{CALLER_TRACE}-b7ad6b7169203331-00").sampled
+
+    assert parse_traceparent(None) is None
+    assert parse_traceparent("00-abc-def-01") is None
+    assert parse_traceparent(f"ff-{CALLER_TRACE}-b7ad6b7169203331-01") is None
+    assert parse_traceparent(f"00-{'0' * 32}-b7ad6b7169203331-01") is None
+    assert parse_traceparent(f"00-{CALLER_TRACE}-b7ad6b7169203331-01-extra") is None
+    # Later versions may append fields
+    assert parse_traceparent(f"01-{CALLER_TRACE}-b7ad6b7169203331-01-extra")
+
+
+def test_trace_context_reaches_upstreams_and_spans_are_exported(
+    gateway, tmp_path: Path
+) -> None:
+    """Test that the caller's trace is continued upstream and its spans exported."""
+    seen: List[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.headers["traceparent"])
+        return httpx.Response(200, stream=ChunkedStream(b"ok"))
+
+    path = tmp_path / "spans.jsonl"
+    processor = BatchSpanProcessor(FileSpanExporter(path), interval=0.05)
+    processor.start()
+    tracer = Tracer("gateway-test")
+    tracer.configure(processor, sample_rate=0.0, slow_seconds=60)
+    client = gateway({"games": {"url": "http://games"}}, handler)
+    client.app.add_middleware(TracingMiddleware, tracer=tracer)
+
+    response = client.get(
+        "/api/v1/games/scores",
+        headers={
+            "traceparent": f"00-{CALLER_TRACE}-b7ad6b7169203331-01",
+            "tracestate": "vendor=1",
+        },
+    )
+    assert response.status_code == 200
+    tracer.shutdown()
+
+    spans = {span["name"]: span for span in _read_spans(path)}
+    assert {"GET /api/v1/games", "auth.verify", "proxy.stream", "upstream"} <= set(
+        spans
+    )
+    root = spans["GET /api/v1/games"]
+    assert root["trace_id"] == CALLER_TRACE
+    assert root["parent_span_id"] == "b7ad6b7169203331"
+    assert root["attributes"]["http.status_code"] == 200
+    assert spans["proxy.stream"]["parent_span_id"] == root["span_id"]
+    upstream = spans["upstream"]
+    assert upstream["parent_span_id"] == spans["proxy.stream"]["span_id"]
+    assert upstream["kind"] == "client"
+    # The upstream continues from the client span, still sampled
+    assert seen == [f"00-{CALLER_TRACE}-{upstream['span_id']}-01"]
+
+
+def test_unsampled_traces_are_kept_when_they_fail_or_are_slow(
+    gateway, tmp_path: Path
+) -> None:
+    """Test that tail sampling keeps failed and slow traces and drops the rest."""
+    statuses = iter([200, 502, 200])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(next(statuses), stream=ChunkedStream(b"ok"))
+
+    path = tmp_path / "spans.jsonl"
+    processor = BatchSpanProcessor(FileSpanExporter(path), interval=0.05)
+    processor.start()
+    tracer = Tracer("gateway-test")
+    tracer.configure(processor, sample_rate=0.0, slow_seconds=60)
+    client = gateway({"games": {"url": "http://games"}}, handler)
+    client.app.add_middleware(TracingMiddleware, tracer=tracer)
+    dropped, errors, slow = _traces("dropped"), _traces("error"), _traces("slow")
+
+    assert client.get("/api/v1/games/scores").status_code == 200
+    assert client.get("/api/v1/games/scores").status_code == 502
+    tracer.slow_seconds = 0
+    assert client.get("/api/v1/games/scores").status_code == 200
+    tracer.shutdown()
+
+    assert _traces("dropped") == dropped + 1
+    assert _traces("error") == errors + 1
+    assert _traces("slow") == slow + 1
+    spans = _read_spans(path)
+    assert len({span["trace_id"] for span in spans}) == 2
+    failed = [span for span in spans if span["status"] == "error"]
+    assert {span["name"] for span in failed} == {"GET /api/v1/games", "upstream"}
@@ -0,0 +1,166 @@
+# --------------------------------------------------------------------------
+# Tests for cached DNS resolution and upstream connection warm-up.
+#
+# @author bnbong bbbong9@gmail.com
+# --------------------------------------------------------------------------
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import pytest
+
+from src.core.pools import ConnectionPoolManager
+from src.core.resolver import DnsCache
+from src.core.services import ServiceProxy, ServiceRegistry
+
+
+class FakeResolver:
+    """Resolver answering from a table and counting its queries"""
+
+    def __init__(self, table: Dict[str, List[str]], ttl: Optional[float] = None):
+        self.table = table
+        self.ttl = ttl
+        self.queries: List[str] = []
+
+    async def __call__(self, host: str) -> Tuple[List[str], Optional[float]]:
+        self.queries.append(host)
+        await asyncio.sleep(0.01)
+        if host not in self.table:
+            raise OSError(f"Cannot resolve {host}")
+        return list(self.table[host]), self.ttl
+
+
+def test_dns_cache_serves_hits_and_refreshes_in_the_background() -> None:
+    """Test that lookups are shared and cached, and refreshed before they expire."""
+    resolver = FakeResolver({"games.internal": ["10.0.0.1"]}, ttl=60)
+
+    async def scenario() -> None:
+        cache = DnsCache(ttl=30, max_ttl=45, resolve=resolver)
+        first = await asyncio.gather(
+            *[cache.resolve("games.internal") for _ in range(3)]
+        )
+        assert first == [["10.0.0.1"]] * 3
+        assert resolver.queries == ["games.internal"]
+        assert cache.stats()["games.internal"]["ttl"] == 45
+        assert await cache.resolve("10.0.0.9") == ["10.0.0.9"]
+
+        # Due for a refresh: the new addresses replace the old ones
+        resolver.table["games.internal"] = ["10.0.0.2"]
+        cache.entries["games.internal"].refresh_at = time.monotonic()
+        await cache.refresh_due()
+        assert await cache.resolve("games.internal") == ["10.0.0.2"]
+
+        # A failed refresh keeps the last known addresses
+        del resolver.table["games.internal"]
+        cache.entries["games.internal"].refresh_at = time.monotonic()
+        await cache.refresh_due()
+        assert await cache.resolve("games.internal") == ["10.0.0.2"]
+        assert cache.entries["games.internal"].refresh_at > time.monotonic()
+
+        with pytest.raises(OSError):
+            await cache.resolve("unknown.internal")
+
+        # Hosts nobody connects to any more are dropped
+        cache.idle_expiry = 0
+        await asyncio.sleep(0.01)
+        await cache.refresh_due()
+        assert cache.stats() == {}
+
+    asyncio.run(scenario())
+
+
+async def _serve(connections: List[int]) -> asyncio.AbstractServer:
+    """Keep-alive HTTP/1.1 upstream on loopback that counts its connections"""
+
+    async def handle(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        connections.append(1)
+        try:
+            while await reader.readuntil(b"\r\n\r\n"):
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+def test_pools_connect_through_the_dns_cache() -> None:
+    """Test that the default transport resolves upstream hosts with the DNS cache."""
+    connections: List[int] = []
+
+    async def scenario() -> None:
+        server = await _serve(connections)
+        port = server.sockets[0].getsockname()[1]
+        resolver = FakeResolver({"games.internal": ["127.0.0.1"]})
+        manager = ConnectionPoolManager(dns_cache=DnsCache(resolve=resolver))
+        client = await manager.create_pool("games", {})
+
+        for _ in range(2):
+            response = await client.get(f"http://games.internal:{port}/scores")
+            assert response.text == "ok"
+        assert resolver.queries == ["games.internal"]
+        assert manager.pool_stats()["games"]["connections"] == 1
+
+        # Failures surface as the httpx errors the proxy handles
+        with pytest.raises(httpx.ConnectError):
+            await client.get("http://unknown.internal/")
+
+        await manager.close()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(scenario())
+
+
+def test_warmup_opens_connections_that_requests_reuse() -> None:
+    """Test that warm-up resolves hosts and opens keep-alive connections ahead of traffic."""
+    connections: List[int] = []
+
+    async def scenario() -> None:
+        server = await _serve(connections)
+        port = server.sockets[0].getsockname()[1]
+        resolver = FakeResolver({"games.internal": ["127.0.0.1"]})
+        registry = ServiceRegistry(
+            ConnectionPoolManager(dns_cache=DnsCache(resolve=resolver))
+        )
+        await registry.add_service(
+            "games", {"url": f"http://games.internal:{port}", "prewarm": 3}
+        )
+        assert not registry.warmup.ready
+
+        await registry.warmup.start()
+        assert await registry.warmup.wait(5)
+        stats = registry.warmup.stats()
+        assert stats["services"]["games"]["state"] == "warm"
+        assert stats["services"]["games"]["connections"] == 3
+        assert stats["dns"]["games.internal"]["addresses"] == ["127.0.0.1"]
+        assert registry.pool_manager.pool_stats()["games"]["idle_connections"] == 3
+        assert len(connections) == 3
+
+        response = await ServiceProxy(registry).forward_request(
+            "games", "GET", "/scores", {}
+        )
+        assert response.content == b"ok"
+        assert len(connections) == 3
+        assert resolver.queries == ["games.internal"]
+
+        # Services added later are warmed as well
+        await registry.add_service(
+            "chat", {"url": f"http://127.0.0.1:{port}", "prewarm": {"connections": 1}}
+        )
+        for _ in range(100):
+            if registry.warmup.stats()["services"]["chat"]["state"] != "warming":
+                break
+            await asyncio.sleep(0.01)
+        assert registry.warmup.stats()["services"]["chat"]["connections"] == 1
+
+        await registry.cleanup()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(scenario())